@@ -5,4 +5,10 @@ mkdir -p media
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput
 
-exec gunicorn config.wsgi:application --bind 0.0.0.0:${PORT:-8000} --workers ${WEB_CONCURRENCY:-3} --timeout 60
+# Workers write metrics here and /metrics merges them (config/metrics.py); start clean
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Threaded workers: a slow client downloading media no longer blocks a whole process
+exec gunicorn config.wsgi:application -c config/gunicorn.py --bind 0.0.0.0:${PORT:-8000} --workers ${WEB_CONCURRENCY:-3} \
+  --worker-class gthread --threads ${WEB_THREADS:-8} --timeout 60
@@ -0,0 +1,146 @@
+"""How the bot reaches the shop: over HTTP or in-process.
+
+``BOT_BACKEND`` picks one:
+
+- ``http``: calls the web app's JSON API through one pooled keep-alive
+  ``requests.Session``;
+- ``orm``: sets Django up in the bot process and calls ``shop.services``
+  directly (the same code the API views run), so a bot interaction costs
+  no HTTP round trip and no gunicorn worker slot. Needs the web app's
+  database settings (``DATABASE_URL`` etc.);
+- ``auto`` (default): ``orm`` when Django is already configured (webhook
+  mode sets it up in the bot process to read the update inbox), otherwise
+  ``http``.
+
+Both expose ``get_user``, ``save_user``, ``create_order`` and
+``product_loader`` (for ``bot.catalog.ProductCache``), and time every call
+in ``latency`` (HTTP: until the response headers arrive).
+"""
+import os
+import sys
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from bot.catalog import http_loader
+    from bot.dispatch import Latency
+except ImportError:  # run as a script: python bot/main.py
+    from catalog import http_loader
+    from dispatch import Latency
+
+
+class HttpBackend:
+    def __init__(self, base_url: str, pool_size: int = 10, timeout: float = 10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.latency = Latency()
+        self.session = requests.Session()
+        self.session.hooks['response'].append(lambda r, *args, **kwargs: self.latency.observe(r.elapsed.total_seconds()))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_user(self, telegram_id):
+        r = self.session.get(self.base_url + '/api/user', params={'telegram_id': str(telegram_id)}, timeout=self.timeout)
+        r.raise_for_status()
+        info = r.json()
+        return info.get('user') if info.get('exists') else None
+
+    def save_user(self, telegram_id, **fields):
+        r = self.session.post(self.base_url + '/api/user', json={'telegram_id': str(telegram_id), **fields}, timeout=self.timeout)
+        r.raise_for_status()
+
+    def create_order(self, payload, idempotency_key, attempts=3, timeout=5):
+        """POST /api/order, retrying timeouts and 5xx with the same idempotency key."""
+        url = self.base_url + '/api/order'
+        headers = {'Idempotency-Key': idempotency_key}
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                r = self.session.post(url, json=payload, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+            else:
+                if r.status_code < 500 or last:
+                    r.raise_for_status()
+                    return r.json()
+            time.sleep(0.5 * 2 ** attempt)
+
+    def product_loader(self):
+        return http_loader(self.base_url, session=self.session, timeout=self.timeout)
+
+
+def setup_django():
+    """Configure Django for this process unless it already is."""
+    from django.conf import settings
+
+    if settings.configured:
+        return
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+
+    django.setup()
+
+
+class OrmBackend:
+    def __init__(self):
+        setup_django()
+        from django.db import close_old_connections
+
+        from shop import catalog, services
+
+        self.catalog = catalog
+        self.services = services
+        self._close_old_connections = close_old_connections
+        self.latency = Latency()
+
+    def _call(self, fn, *args, **kwargs):
+        # Handler threads live long: drop stale connections like a request would
+        self._close_old_connections()
+        started = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.latency.observe(time.monotonic() - started)
+            self._close_old_connections()
+
+    def get_user(self, telegram_id):
+        return self._call(self.services.get_profile, telegram_id)
+
+    def save_user(self, telegram_id, **fields):
+        self._call(self.services.upsert_profile, str(telegram_id), **fields)
+
+    def create_order(self, payload, idempotency_key):
+        order, _ = self._call(
+            self.services.create_order,
+            str(payload['telegram_id']), payload.get('items') or [],
+            language=payload.get('language'), phone=payload.get('phone'),
+            full_name=payload.get('full_name'), username=payload.get('username'),
+            comment=payload.get('comment') or '', idempotency_key=idempotency_key,
+        )
+        return {'status': 'ok', 'order_id': order.id, 'total': float(order.total)}
+
+    def product_loader(self):
+        def load(etag):
+            # The catalog version is the ETag: unchanged version, nothing to rebuild
+            version = str(self._call(self.catalog.current_version))
+            if etag == version:
+                return None
+            return self._call(self.services.product_rows), version
+
+        return load
+
+
+def from_env(base_url: str):
+    mode = os.getenv('BOT_BACKEND', 'auto')
+    if mode == 'auto':
+        from django.conf import settings
+
+        mode = 'orm' if settings.configured else 'http'
+    if mode == 'orm':
+        return OrmBackend()
+    return HttpBackend(base_url, pool_size=int(os.getenv('BOT_THREADS', '4')) + 2)
@@ -0,0 +1,112 @@
+"""Product catalog cache for the bot.
+
+Handlers read an immutable ``CatalogView`` (products in catalog order, an
+id index and per-language name lists) and never wait on the web app:
+
+- a view older than ``ttl`` seconds is still served while one background
+  thread revalidates it with a conditional request (``If-None-Match``); a
+  304 only renews the timestamp;
+- a new view is built off to the side and swapped in with one assignment;
+- ``warm()`` fills the cache at startup; until the first load succeeds
+  handlers see an empty catalog and a refresh is kicked off.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+LANGUAGES = ('UZ', 'RU', 'EN')
+# Wait this long before retrying a failed refresh
+RETRY_SECONDS = 5
+
+CatalogView = namedtuple('CatalogView', 'items by_id names etag loaded_at')
+
+
+def localized_name(p: dict, lang: str) -> str:
+    if lang == 'RU':
+        return p.get('name_ru') or p.get('name_uz') or ''
+    if lang == 'EN':
+        return p.get('name_en') or p.get('name_uz') or ''
+    return p.get('name_uz') or ''
+
+
+def build_view(items, etag=None) -> CatalogView:
+    items = tuple(items)
+    return CatalogView(
+        items=items,
+        by_id={p['id']: p for p in items},
+        names={lang: tuple(localized_name(p, lang) for p in items) for lang in LANGUAGES},
+        etag=etag,
+        loaded_at=time.monotonic(),
+    )
+
+
+EMPTY = CatalogView((), {}, {lang: () for lang in LANGUAGES}, None, float('-inf'))
+
+
+def http_loader(base_url: str, session=None, timeout: float = 10):
+    """Return a loader that fetches ``/api/products`` conditionally.
+
+    The loader takes the current ETag and returns ``(products, etag)``, or
+    None when the catalog is unchanged.
+    """
+    url = base_url.rstrip('/') + '/api/products'
+    http = session or requests.Session()
+
+    def load(etag):
+        headers = {'If-None-Match': etag} if etag else {}
+        r = http.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        return r.json().get('products', []), r.headers.get('ETag')
+
+    return load
+
+
+class ProductCache:
+    def __init__(self, loader, ttl: float = 60):
+        self.loader = loader
+        self.ttl = ttl
+        self.view = EMPTY
+        self._refreshing = threading.Lock()
+        self._retry_at = 0.0
+
+    def refresh(self) -> bool:
+        """Revalidate now (in the calling thread); returns False if another
+        refresh is already running."""
+        if not self._refreshing.acquire(blocking=False):
+            return False
+        try:
+            current = self.view
+            result = self.loader(current.etag if current.items else None)
+            if result is None:
+                self.view = current._replace(loaded_at=time.monotonic())
+            else:
+                self.view = build_view(*result)
+            return True
+        finally:
+            self._refreshing.release()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            self._retry_at = time.monotonic() + RETRY_SECONDS
+            logger.warning('Product refresh failed: %s', e)
+
+    def get(self) -> CatalogView:
+        """Return the current view, scheduling a background refresh when stale."""
+        view = self.view
+        now = time.monotonic()
+        if now - view.loaded_at > self.ttl and now >= self._retry_at and not self._refreshing.locked():
+            threading.Thread(target=self._refresh_quietly, name='product-refresh', daemon=True).start()
+        return view
+
+    def warm(self):
+        """Load the catalog before serving; failures are retried lazily."""
+        self._refresh_quietly()
@@ -0,0 +1,199 @@
+"""Concurrent update processing with per-chat ordering.
+
+``ChatDispatcher`` runs handlers on ``workers`` threads, each owning a
+bounded queue. Updates are sharded by chat id, so one chat's updates run
+one at a time and in arrival order (the onboarding state machine and the
+cart never see two of its updates at once) while different chats run in
+parallel and a slow handler only holds up the chats on its shard.
+
+The guarantee is per process, which is why exactly one process runs the
+handlers in both polling and webhook mode (see ``bot.webhook``).
+
+Backpressure: ``submit`` blocks while the shard queue is full. Polling
+therefore stops fetching updates when workers fall behind, and in webhook
+mode the backlog stays in the inbox table (``bot.webhook.consume``).
+
+``stats()`` reports queue depth per shard and queue wait / handler /
+update lag latency (count, mean, p50/p95/max over the most recent
+samples). ``Latency.listeners`` and ``DispatchingTeleBot.handler_listeners``
+let ``bot.metrics`` observe the same events.
+"""
+import functools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from telebot import TeleBot
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per metric for percentiles
+SAMPLE_SIZE = 1024
+
+
+def chat_id_of(update):
+    """The chat an update belongs to (its sharding key)."""
+    for attr in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        msg = getattr(update, attr, None)
+        if msg is not None:
+            return msg.chat.id
+    call = getattr(update, 'callback_query', None)
+    if call is not None:
+        return call.message.chat.id if call.message else call.from_user.id
+    for attr in ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query', 'my_chat_member', 'chat_member'):
+        obj = getattr(update, attr, None)
+        if obj is not None and getattr(obj, 'from_user', None) is not None:
+            return obj.from_user.id
+    return update.update_id
+
+
+def sent_at(update):
+    """Unix time Telegram received the update's message, if it has one."""
+    msg = update.message or update.channel_post
+    if msg is not None:
+        return msg.date
+    msg = update.edited_message or update.edited_channel_post
+    if msg is not None:
+        return msg.edit_date or msg.date
+    return None
+
+
+class Latency:
+    """Count, total and a window of recent samples (seconds)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+        self.lock = threading.Lock()
+        # Called with every sample (e.g. a Prometheus histogram's observe)
+        self.listeners = []
+
+    def observe(self, seconds: float):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.samples.append(seconds)
+        for listener in self.listeners:
+            listener(seconds)
+
+    def summary(self) -> dict:
+        with self.lock:
+            samples = sorted(self.samples)
+            count, total = self.count, self.total
+        if not samples:
+            return {'count': count, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+
+        def pct(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 2)
+
+        return {
+            'count': count,
+            'mean_ms': round(total / count * 1000, 2),
+            'p50_ms': pct(0.5),
+            'p95_ms': pct(0.95),
+            'max_ms': round(samples[-1] * 1000, 2),
+        }
+
+
+class ChatDispatcher:
+    def __init__(self, process, workers: int = 8, queue_size: int = 100):
+        """``process`` takes a list of updates and runs their handlers."""
+        self.process = process
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.wait = Latency()
+        self.handler = Latency()
+        # Telegram receiving a message to its handler starting (whole seconds resolution)
+        self.lag = Latency()
+        self.rejected = 0
+        self.errors = 0
+        self.threads = []
+        for i, q in enumerate(self.queues):
+            t = threading.Thread(target=self._work, args=(q,), name=f'bot-shard-{i}', daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, update, timeout=None) -> bool:
+        """Queue ``update`` on its chat's shard; False if still full after ``timeout``."""
+        q = self.queues[hash(chat_id_of(update)) % len(self.queues)]
+        try:
+            q.put((time.monotonic(), update), timeout=timeout)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        return True
+
+    def _work(self, q):
+        while True:
+            queued_at, update = q.get()
+            started = time.monotonic()
+            self.wait.observe(started - queued_at)
+            date = sent_at(update)
+            if date:
+                self.lag.observe(max(0.0, time.time() - date))
+            try:
+                self.process([update])
+            except Exception:
+                self.errors += 1
+                logger.exception('Update %s failed', update.update_id)
+            finally:
+                self.handler.observe(time.monotonic() - started)
+                q.task_done()
+
+    def stats(self) -> dict:
+        depths = [q.qsize() for q in self.queues]
+        return {
+            'workers': len(self.queues),
+            'queue_depth': sum(depths),
+            'max_shard_depth': max(depths),
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'queue_wait': self.wait.summary(),
+            'handler': self.handler.summary(),
+            'update_lag': self.lag.summary(),
+        }
+
+
+class DispatchingTeleBot(TeleBot):
+    """TeleBot whose updates run on a ``ChatDispatcher`` instead of its own pool."""
+
+    def __init__(self, token, workers: int = 8, queue_size: int = 100, **kwargs):
+        kwargs['threaded'] = False
+        super().__init__(token, **kwargs)
+        self.dispatcher = ChatDispatcher(super().process_new_updates, workers, queue_size)
+        # Called with (handler name, seconds, failed) after every handler
+        self.handler_listeners = []
+
+    def dispatch(self, update, timeout=None) -> bool:
+        # Polling asks for updates after last_update_id, so advance it on receipt
+        if update.update_id > self.last_update_id:
+            self.last_update_id = update.update_id
+        return self.dispatcher.submit(update, timeout)
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            self.dispatch(update)
+
+    def _build_handler_dict(self, handler, pass_bot=False, **filters):
+        # Every registration goes through here: time the handler itself
+        return super()._build_handler_dict(self._timed(handler), pass_bot, **filters)
+
+    def _timed(self, handler):
+        name = getattr(handler, '__name__', 'handler')
+
+        @functools.wraps(handler)  # keeps the signature telebot inspects
+        def run(*args, **kwargs):
+            started = time.monotonic()
+            failed = True
+            try:
+                result = handler(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                seconds = time.monotonic() - started
+                for listener in self.handler_listeners:
+                    listener(name, seconds, failed)
+
+        return run
@@ -1,36 +1,70 @@
 ﻿import os
+import threading
+import time
+import uuid
 import logging
-import requests
 from dotenv import load_dotenv
-from telebot import TeleBot, types
+from telebot import types
+
+try:
+    from bot import backend as backends
+    from bot import metrics as bot_metrics
+    from bot.catalog import ProductCache, localized_name
+    from bot.dispatch import DispatchingTeleBot
+    from bot.state import StateStore
+    from bot import webhook
+except ImportError:  # run as a script: python bot/main.py
+    import backend as backends
+    import metrics as bot_metrics
+    from catalog import ProductCache, localized_name
+    from dispatch import DispatchingTeleBot
+    from state import StateStore
+    import webhook
 
 
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
+# 'polling' (default, local development) or 'webhook' (see bot/webhook.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
 
 if not BOT_TOKEN:
     raise SystemExit('BOT_TOKEN is not set in environment/.env')
 
-bot = TeleBot(BOT_TOKEN, parse_mode='HTML')
+if BOT_MODE == 'webhook':
+    # Updates come from the web app's inbox table (bot/webhook.py), so Django is needed anyway
+    backends.setup_django()
+
+# Handlers run on BOT_THREADS workers; one chat's updates stay in order (bot/dispatch.py)
+bot = DispatchingTeleBot(
+    BOT_TOKEN,
+    parse_mode='HTML',
+    workers=int(os.getenv('BOT_THREADS', '8')),
+    queue_size=int(os.getenv('BOT_QUEUE_SIZE', '100')),
+)
 logging.basicConfig(level=logging.INFO)
 
-# Per-user state in memory
-# { chat_id: {stage, language, phone, full_name, cart:{product_id: qty}} }
-STATE = {}
+# Per-user state: { chat_id: {stage, language, phone, full_name, cart:{product_id: qty}} }
+# kept in a bounded LRU backed by SQLite (see bot/state.py)
+STATE = StateStore(
+    os.getenv('BOT_STATE_DB') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot_state.sqlite3'),
+    max_entries=int(os.getenv('BOT_STATE_MAX_ENTRIES', '5000')),
+    idle_ttl=float(os.getenv('BOT_STATE_IDLE_TTL', '1800')),
+)
+STATE.start()
 
-# Simple products cache
-PRODUCTS_CACHE = {'items': []}
+# Users, orders and products: over HTTP or straight through shop.services (BOT_BACKEND)
+BACKEND = backends.from_env(BASE_URL)
+
+# Products with an id index, refreshed in the background every PRODUCTS_TTL seconds
+PRODUCTS = ProductCache(BACKEND.product_loader(), ttl=float(os.getenv('PRODUCTS_TTL', '60')))
+
+# Prometheus metrics (bot/metrics.py), served on BOT_METRICS_PORT in both modes
+bot_metrics.install(bot, STATE, BACKEND)
 
 
 def get_state(chat_id):
-    st = STATE.get(chat_id)
-    if not st:
-        st = {'stage': 'language', 'cart': {}}
-        STATE[chat_id] = st
-    if 'cart' not in st:
-        st['cart'] = {}
-    return st
+    return STATE.get(chat_id)
 
 
 def lang_label(st, uz, ru, en=None):
@@ -46,38 +80,23 @@ def cart_count(st):
     return sum(st.get('cart', {}).values())
 
 
-def load_products():
-    url = BASE_URL.rstrip('/') + '/api/products'
-    r = requests.get(url, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    PRODUCTS_CACHE['items'] = data.get('products', [])
-    return PRODUCTS_CACHE['items']
-
-
 def products():
-    if not PRODUCTS_CACHE['items']:
-        return load_products()
-    return PRODUCTS_CACHE['items']
+    """Current catalog view; never blocks on the web app (see bot/catalog.py)."""
+    return PRODUCTS.get()
 
 
 def send_catalog(chat_id, page=1, message_id=None):
     st = get_state(chat_id)
-    items = products()
+    view = products()
+    items = view.items
+    names = view.names.get((st.get('language') or 'UZ').upper(), view.names['UZ'])
     per = 6
     total_pages = max(1, (len(items) + per - 1) // per)
     page = max(1, min(page, total_pages))
     start = (page - 1) * per
-    chunk = items[start:start+per]
 
     kb = types.InlineKeyboardMarkup()
-    for p in chunk:
-        if st.get('language') == 'RU':
-            name = p.get('name_ru') or p.get('name_uz')
-        elif st.get('language') == 'EN':
-            name = p.get('name_en') or p.get('name_uz')
-        else:
-            name = p.get('name_uz')
+    for p, name in zip(items[start:start+per], names[start:start+per]):
         price = p['price']
         label = f"??? {name} ??? {price}"
         kb.add(types.InlineKeyboardButton(label, callback_data=f"add:{p['id']}:pg{page}"))
@@ -105,7 +124,7 @@ def send_catalog(chat_id, page=1, message_id=None):
 def send_cart(chat_id, message_id=None):
     st = get_state(chat_id)
     cart = st.get('cart', {})
-    by_id = {p['id']: p for p in products()}
+    by_id = products().by_id
     total = 0.0
     lines = []
     for pid, qty in cart.items():
@@ -114,7 +133,7 @@ def send_cart(chat_id, message_id=None):
             continue
         price = float(p['price'])
         total += price * qty
-        name = p['name_ru'] if st.get('language') == 'RU' else p['name_uz']
+        name = localized_name(p, (st.get('language') or 'UZ').upper())
         lines.append(f"{name} x{qty}")
     if lines:
         text = '\n'.join(lines) + f"\n\n{lang_label(st, 'Jami', 'Сумма', 'Total')}: {int(total) if float(total).is_integer() else total}"
@@ -236,7 +255,6 @@ def handle_language_button(msg):
     chat_id = msg.chat.id
     st = get_state(chat_id)
     st['stage'] = 'change_lang'
-    STATE[chat_id] = st
     bot.send_message(chat_id, 'Tilni tanlang / Выберите язык / Choose language', reply_markup=start_keyboard())
 
 
@@ -256,9 +274,8 @@ def handle_change_lang(msg):
         bot.send_message(chat_id, 'Please choose UZ / RU / EN', reply_markup=start_keyboard())
         return
     st['stage'] = 'done'
-    STATE[chat_id] = st
     try:
-        requests.post(BASE_URL.rstrip('/') + '/api/user', json={'telegram_id': str(chat_id), 'language': st.get('language')}, timeout=10)
+        BACKEND.save_user(chat_id, language=st.get('language'))
     except Exception:
         pass
     after_onboarding_message(chat_id)
@@ -278,20 +295,15 @@ def handle_start(msg):
     chat_id = msg.chat.id
     # If profile exists (has phone and full_name), skip onboarding
     try:
-        import requests as _rq
-        resp = _rq.get(BASE_URL.rstrip('/') + '/api/user', params={'telegram_id': str(chat_id)}, timeout=10)
-        if resp.ok:
-            info = resp.json()
-            if info.get('exists'):
-                u = info.get('user') or {}
-                if u.get('full_name') and u.get('phone'):
-                    st = {'stage': 'done', 'cart': {}, 'language': (u.get('language') or 'UZ')}
-                    STATE[chat_id] = st
-                    after_onboarding_message(chat_id)
-                    return
+        u = BACKEND.get_user(chat_id) or {}
+        if u.get('full_name') and u.get('phone'):
+            st = {'stage': 'done', 'cart': {}, 'language': (u.get('language') or 'UZ')}
+            STATE.set(chat_id, st)
+            after_onboarding_message(chat_id)
+            return
     except Exception:
         pass
-    STATE[chat_id] = {'stage': 'language', 'cart': {}}
+    STATE.set(chat_id, {'stage': 'language', 'cart': {}})
     bot.send_message(chat_id, 'Tilni tanlang / Выберите язык / Choose language', reply_markup=start_keyboard())
 
 
@@ -313,7 +325,6 @@ def handle_text(msg):
             bot.send_message(chat_id, 'Please choose UZ / RU / EN ', reply_markup=start_keyboard())
             return
         st['stage'] = 'contact'
-        STATE[chat_id] = st
         bot.send_message(chat_id, 'Telefon raqamingizni yuboring / Отправьте свой номер телефона / Send your phone number', reply_markup=contact_keyboard())
         return
 
@@ -324,17 +335,15 @@ def handle_text(msg):
     if stage == 'name':
         st['full_name'] = text
         st['stage'] = 'done'
-        STATE[chat_id] = st
         # Persist full profile to backend
         try:
-            import requests as _rq
-            _rq.post(BASE_URL.rstrip('/') + '/api/user', json={
-                'telegram_id': str(chat_id),
-                'language': st.get('language'),
-                'phone': st.get('phone'),
-                'full_name': st.get('full_name'),
-                'username': (getattr(msg.chat, 'username', None) or '')
-            }, timeout=10)
+            BACKEND.save_user(
+                chat_id,
+                language=st.get('language'),
+                phone=st.get('phone'),
+                full_name=st.get('full_name'),
+                username=(getattr(msg.chat, 'username', None) or ''),
+            )
         except Exception:
             pass
         after_onboarding_message(chat_id)
@@ -369,7 +378,6 @@ def handle_contact(msg):
     phone = msg.contact.phone_number if msg.contact and msg.contact.phone_number else None
     st['phone'] = phone
     st['stage'] = 'name'
-    STATE[chat_id] = st
     if st.get('language') == 'RU':
         bot.send_message(chat_id, 'Полное имя введите (ФИО)')
     elif st.get('language') == 'UZ':
@@ -378,14 +386,13 @@ def handle_contact(msg):
         bot.send_message(chat_id, 'Enter your full name (FIO)')
     # Persist phone to backend
     try:
-        import requests as _rq
-        _rq.post(BASE_URL.rstrip('/') + '/api/user', json={
-            'telegram_id': str(chat_id),
-            'language': st.get('language'),
-            'phone': phone,
-            'full_name': ((getattr(msg.from_user, 'first_name', '') or '') + ((' ' + getattr(msg.from_user, 'last_name', '')) if getattr(msg.from_user, 'last_name', None) else '')),
-            'username': (getattr(msg.chat, 'username', None) or '')
-        }, timeout=10)
+        BACKEND.save_user(
+            chat_id,
+            language=st.get('language'),
+            phone=phone,
+            full_name=((getattr(msg.from_user, 'first_name', '') or '') + ((' ' + getattr(msg.from_user, 'last_name', '')) if getattr(msg.from_user, 'last_name', None) else '')),
+            username=(getattr(msg.chat, 'username', None) or ''),
+        )
     except Exception:
         pass
 
@@ -418,12 +425,14 @@ def handle_callbacks(call):
                 except Exception:
                     page_hint = 1
             st['cart'][pid] = st['cart'].get(pid, 0) + 1
+            st.pop('checkout_key', None)
             bot.answer_callback_query(call.id, lang_label(st, "Qo'shildi", "Добавлено", "Added"))
             send_catalog(chat_id, page=page_hint, message_id=call.message.message_id)
             return
         # Keep inline catalog/cart features available if needed; no changes for orders/menu here now.
         if data == 'clear':
             st['cart'].clear()
+            st.pop('checkout_key', None)
             bot.answer_callback_query(call.id, lang_label(st, "Tozalandi", "Очищено", "Cleared"))
             send_cart(chat_id, message_id=call.message.message_id)
             return
@@ -440,12 +449,12 @@ def handle_callbacks(call):
                 'comment': '',
                 'items': items,
             }
+            # One key per cart: retries (and repeated taps) cannot create a second order
+            checkout_key = st.setdefault('checkout_key', uuid.uuid4().hex)
             try:
-                url = BASE_URL.rstrip('/') + '/api/order'
-                r = requests.post(url, json=payload, timeout=15)
-                r.raise_for_status()
-                _ = r.json()
+                BACKEND.create_order(payload, checkout_key)
                 st['cart'].clear()
+                st.pop('checkout_key', None)
                 bot.answer_callback_query(call.id, lang_label(st, "Yuborildi", "Отправлено", "Sent"))
                 text = lang_label(st, "Buyurtma qabul qilindi!", "Заказ принят!", "Order placed!")
                 bot.edit_message_text(text, chat_id, call.message.message_id)
@@ -486,7 +495,33 @@ def main_menu_keyboard(st, chat_id):
     return mk
 
 
+def log_stats(interval):
+    while True:
+        time.sleep(interval)
+        s = bot.dispatcher.stats()
+        b = BACKEND.latency.summary()
+        logging.info(
+            'dispatch: depth=%s max_shard=%s rejected=%s errors=%s wait_p95=%sms handler_p50=%sms handler_p95=%sms '
+            'backend_calls=%s backend_p50=%sms backend_p95=%sms',
+            s['queue_depth'], s['max_shard_depth'], s['rejected'], s['errors'],
+            s['queue_wait']['p95_ms'], s['handler']['p50_ms'], s['handler']['p95_ms'],
+            b['count'], b['p50_ms'], b['p95_ms'],
+        )
+
+
 def main():
+    PRODUCTS.warm()
+    metrics_port = int(os.getenv('BOT_METRICS_PORT', '0'))
+    if metrics_port:
+        bot_metrics.serve(metrics_port, os.getenv('BOT_METRICS_ADDR', '127.0.0.1'))
+    interval = float(os.getenv('BOT_STATS_INTERVAL', '60'))
+    if interval > 0:
+        threading.Thread(target=log_stats, args=(interval,), name='bot-stats', daemon=True).start()
+    if BOT_MODE == 'webhook':
+        # The web app stores updates (/bot/webhook); this process alone runs them
+        print('Bot started. Reading webhook updates from the inbox...')
+        webhook.consume(bot)
+        return
     print('Bot started. Listening for updates...')
     try:
         bot.remove_webhook()
@@ -0,0 +1,111 @@
+"""Prometheus metrics for the bot.
+
+``install()`` hooks these into the dispatcher, the handlers, the backend
+and pyTelegramBotAPI's HTTP calls:
+
+- ``bot_handler_duration_seconds`` / ``bot_handler_errors_total`` per handler;
+- ``bot_update_lag_seconds``: Telegram receiving a message to its handler starting;
+- ``bot_queue_wait_seconds``, ``bot_queue_depth``, ``bot_updates_rejected_total``;
+- ``bot_backend_request_duration_seconds``: calls to the shop (HTTP or ORM);
+- ``bot_telegram_requests_total`` / ``bot_telegram_request_duration_seconds``
+  per Bot API method and outcome (``getUpdates`` long polls are counted,
+  not timed);
+- ``bot_state_entries`` by kind (``cached`` chats, ``touched`` with unsaved
+  changes, ``pending`` evicted before saving) and ``bot_state_db_bytes``.
+
+``serve()`` exposes them on ``BOT_METRICS_PORT``. Handlers always run in
+the ``bot`` process, in webhook mode too (the web app only stores updates,
+see ``bot.webhook``).
+"""
+import os
+import threading
+import time
+
+import requests
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+try:
+    from bot.outcomes import telegram_outcome
+except ImportError:  # run as a script: python bot/main.py
+    from outcomes import telegram_outcome
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (1, 2, 5, 10, 30, 60, 300, 900)
+# Gauges and the rejected counter are refreshed this often
+REFRESH_SECONDS = 5
+
+HANDLER_SECONDS = Histogram('bot_handler_duration_seconds', 'Handler run time', ['handler'], buckets=LATENCY_BUCKETS)
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Handlers that raised', ['handler'])
+UPDATE_LAG = Histogram('bot_update_lag_seconds', 'Message sent to handler start', buckets=LAG_BUCKETS)
+QUEUE_WAIT = Histogram('bot_queue_wait_seconds', 'Time updates wait for a worker', buckets=LATENCY_BUCKETS)
+QUEUE_DEPTH = Gauge('bot_queue_depth', 'Updates waiting for a worker', multiprocess_mode='livesum')
+REJECTED = Counter('bot_updates_rejected_total', 'Updates refused because the shard queue was full')
+BACKEND_SECONDS = Histogram('bot_backend_request_duration_seconds', 'Calls to the shop', buckets=LATENCY_BUCKETS)
+TELEGRAM_REQUESTS = Counter('bot_telegram_requests_total', 'Bot API calls', ['method', 'outcome'])
+TELEGRAM_SECONDS = Histogram('bot_telegram_request_duration_seconds', 'Bot API call latency', ['method'], buckets=LATENCY_BUCKETS)
+STATE_ENTRIES = Gauge('bot_state_entries', 'Chats in the state store', ['kind'], multiprocess_mode='livesum')
+STATE_DB_BYTES = Gauge('bot_state_db_bytes', 'Size of the state database', multiprocess_mode='livemax')
+
+
+def timed_sender(pool_size: int = 10):
+    """A pooled ``apihelper.CUSTOM_REQUEST_SENDER`` that records every call."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    def send(method, url, **kwargs):
+        name = url.rsplit('/', 1)[-1]
+        started = time.monotonic()
+        status_code = None
+        try:
+            r = session.request(method, url, **kwargs)
+            status_code = r.status_code
+            return r
+        finally:
+            TELEGRAM_REQUESTS.labels(name, telegram_outcome(status_code)).inc()
+            if name != 'getUpdates':
+                TELEGRAM_SECONDS.labels(name).observe(time.monotonic() - started)
+
+    return send
+
+
+def _on_handler(name, seconds, failed):
+    HANDLER_SECONDS.labels(name).observe(seconds)
+    if failed:
+        HANDLER_ERRORS.labels(name).inc()
+
+
+def _refresh(bot, state):
+    rejected = 0
+    while True:
+        try:
+            stats = bot.dispatcher.stats()
+            QUEUE_DEPTH.set(stats['queue_depth'])
+            REJECTED.inc(stats['rejected'] - rejected)
+            rejected = stats['rejected']
+            for kind, value in state.stats().items():
+                STATE_ENTRIES.labels(kind).set(value)
+            if os.path.exists(state.path):
+                STATE_DB_BYTES.set(os.path.getsize(state.path))
+        except Exception:
+            pass
+        time.sleep(REFRESH_SECONDS)
+
+
+def install(bot, state, backend):
+    """Start recording; call once per process after the bot is built."""
+    bot.handler_listeners.append(_on_handler)
+    bot.dispatcher.wait.listeners.append(QUEUE_WAIT.observe)
+    bot.dispatcher.lag.listeners.append(UPDATE_LAG.observe)
+    backend.latency.listeners.append(BACKEND_SECONDS.observe)
+    if apihelper.CUSTOM_REQUEST_SENDER is None:
+        apihelper.CUSTOM_REQUEST_SENDER = timed_sender(len(bot.dispatcher.queues) + 2)
+    threading.Thread(target=_refresh, args=(bot, state), name='bot-metrics', daemon=True).start()
+
+
+def serve(port: int, addr: str = '127.0.0.1'):
+    """Expose /metrics on ``addr:port`` (prometheus_client's own HTTP server)."""
+    start_http_server(port, addr=addr)
@@ -0,0 +1,18 @@
+"""Outcome labels for Bot API calls.
+
+Shared by the bot's metrics (``bot.metrics``) and the shop's
+(``config.metrics``, for ``send_telegram_message``), so both count
+``shop_telegram_*`` and ``bot_telegram_*`` calls the same way. Imports
+nothing, so either side can use it without pulling in the other.
+"""
+
+
+def telegram_outcome(status_code) -> str:
+    """``ok``, ``rate_limited``, ``client_error``, ``server_error`` or ``network_error`` (no response)."""
+    if status_code is None:
+        return 'network_error'
+    if status_code == 200:
+        return 'ok'
+    if status_code == 429:
+        return 'rate_limited'
+    return 'client_error' if status_code < 500 else 'server_error'
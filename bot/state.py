@@ -0,0 +1,219 @@
+"""Conversation state for the bot (stage, language, contact, cart).
+
+``StateStore`` keeps recently active chats in an in-memory LRU and
+everything else in a local SQLite file, so memory stays flat however many
+users the bot has seen and a restart or deploy loses nothing:
+
+- at most ``max_entries`` chats are held in memory; the least recently
+  used one, or any chat idle for ``idle_ttl`` seconds, is dropped (after
+  its changes are written);
+- handlers mutate the returned dict in place; a background thread writes
+  the touched chats every ``flush_interval`` seconds and only when their
+  JSON actually changed, so a burst of cart taps costs one write;
+- pending changes are flushed on exit.
+
+The memory tier belongs to one process and is never re-read from the
+file, so a second process with its own copy would overwrite the first
+one's changes. The store therefore takes an exclusive lock on
+``<path>.lock``: a second process on the same file (e.g. the new bot
+while the old one is still stopping during a deploy) waits until the
+first one exits. Webhook mode keeps the single owner too: the web app
+only stores updates and the bot process runs them (``bot.webhook``).
+"""
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, run one bot process by hand
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def new_state() -> dict:
+    return {'stage': 'language', 'cart': {}}
+
+
+def _decode(raw: str) -> dict:
+    st = json.loads(raw)
+    # JSON object keys are strings; the cart is keyed by product id
+    st['cart'] = {int(pid): qty for pid, qty in (st.get('cart') or {}).items()}
+    return st
+
+
+def _encode(st: dict) -> str:
+    return json.dumps(st, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+class StateStore:
+    def __init__(self, path: str, max_entries: int = 5000, idle_ttl: float = 1800, flush_interval: float = 2.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        # chat_id -> [state, last_access, last_saved_json]
+        self._entries = OrderedDict()
+        self._touched = set()
+        # Evicted chats whose changes are not on disk yet: chat_id -> json
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._db_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._owner = self._lock_file(path + '.lock')
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS bot_state ('
+            'chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    @staticmethod
+    def _lock_file(path):
+        """Hold an exclusive lock on ``path`` for the life of the process."""
+        if fcntl is None:
+            return None
+        fh = open(path, 'a')
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.warning('Another process owns %s; waiting for it to exit', path)
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        return fh
+
+    def _load(self, chat_id):
+        raw = self._pending.get(chat_id)
+        if raw is None:
+            with self._db_lock:
+                row = self._conn.execute('SELECT data FROM bot_state WHERE chat_id = ?', (chat_id,)).fetchone()
+            raw = row[0] if row else None
+        if raw is None:
+            return new_state(), None
+        try:
+            return _decode(raw), raw
+        except (ValueError, TypeError, AttributeError):
+            logger.warning('Discarding unreadable state for chat %s', chat_id)
+            return new_state(), None
+
+    def _evict(self, chat_id, entry):
+        """Drop a chat from memory, keeping unsaved changes for the next flush."""
+        del self._entries[chat_id]
+        self._touched.discard(chat_id)
+        try:
+            raw = _encode(entry[0])
+        except (TypeError, ValueError):
+            logger.exception('State for chat %s is not serializable', chat_id)
+            return
+        if raw != entry[2]:
+            self._pending[chat_id] = raw
+
+    def get(self, chat_id) -> dict:
+        """Return the live state dict for ``chat_id`` (created when missing)."""
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is None:
+                st, raw = self._load(chat_id)
+                entry = self._entries[chat_id] = [st, 0.0, raw]
+                while len(self._entries) > self.max_entries:
+                    oldest = next(iter(self._entries))
+                    self._evict(oldest, self._entries[oldest])
+            else:
+                self._entries.move_to_end(chat_id)
+            entry[1] = time.monotonic()
+            entry[0].setdefault('cart', {})
+            self._touched.add(chat_id)
+            return entry[0]
+
+    def set(self, chat_id, st: dict) -> dict:
+        """Replace the state of ``chat_id``."""
+        with self._lock:
+            self.get(chat_id)
+            st.setdefault('cart', {})
+            self._entries[chat_id][0] = st
+            return st
+
+    def flush(self) -> int:
+        """Write changed chats and expire idle ones; returns rows written."""
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            touched, self._touched = self._touched, set()
+            for chat_id in touched:
+                entry = self._entries.get(chat_id)
+                if entry is None:
+                    continue
+                try:
+                    raw = _encode(entry[0])
+                except RuntimeError:
+                    # Mutated by a handler mid-serialization; next round
+                    self._touched.add(chat_id)
+                    continue
+                except (TypeError, ValueError):
+                    logger.exception('State for chat %s is not serializable', chat_id)
+                    continue
+                if raw != entry[2]:
+                    entry[2] = raw
+                    rows.append((chat_id, raw))
+            for chat_id, entry in list(self._entries.items()):
+                if now - entry[1] < self.idle_ttl:
+                    break  # LRU order: the rest were used more recently
+                if chat_id not in self._touched:
+                    self._evict(chat_id, entry)
+            written = set(cid for cid, _ in rows)
+            rows.extend((cid, raw) for cid, raw in self._pending.items() if cid not in written)
+            pending, self._pending = self._pending, {}
+        if rows:
+            ts = time.time()
+            try:
+                with self._db_lock:
+                    self._conn.execute('BEGIN')
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO bot_state (chat_id, data, updated_at) VALUES (?, ?, ?)',
+                        [(cid, raw, ts) for cid, raw in rows],
+                    )
+                    self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                logger.exception('Writing bot state failed')
+                with self._db_lock:
+                    if self._conn.in_transaction:
+                        self._conn.execute('ROLLBACK')
+                with self._lock:
+                    for cid, raw in pending.items():
+                        self._pending.setdefault(cid, raw)
+                    for cid, _ in rows:
+                        entry = self._entries.get(cid)
+                        if entry is not None:
+                            entry[2] = None
+                            self._touched.add(cid)
+                return 0
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'cached': len(self._entries), 'touched': len(self._touched), 'pending': len(self._pending)}
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Bot state flush failed')
+
+    def start(self):
+        """Start the background flusher (and flush once more at exit)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='bot-state-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,86 @@
+"""Telegram webhook: the web app stores updates, the bot process runs them.
+
+Enabled by setting ``BOT_WEBHOOK_SECRET``; register the URL with
+``python manage.py telegram_webhook set``.
+
+- ``telegram_webhook`` (the Django view, served by every web worker)
+  checks the secret and writes the update to the ``BotUpdate`` inbox
+  table, then answers at once. It never imports the bot, so web workers
+  need no ``BOT_TOKEN`` and hold no conversation state. Telegram's
+  redeliveries are dropped by the unique ``update_id``.
+- ``consume`` runs in the one ``bot`` process (``BOT_MODE=webhook``) and
+  feeds the inbox to the dispatcher in ``update_id`` order, deleting rows
+  once they are queued. One process owns every chat, so per-chat ordering
+  and the state store work exactly as in polling mode.
+
+Updates already queued in the dispatcher when the bot process dies are
+lost, as with polling; anything still in the table is picked up on start.
+"""
+import hmac
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = 'bot/webhook'
+# Inbox rows handed to the dispatcher per query
+BATCH_SIZE = 100
+
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    from shop.models import BotUpdate
+
+    secret = getattr(settings, 'BOT_WEBHOOK_SECRET', '') or ''
+    if not secret:
+        raise Http404('Webhook is disabled')
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(token.encode(), secret.encode()):
+        return HttpResponseForbidden('Bad secret token')
+
+    try:
+        payload = request.body.decode('utf-8')
+        update_id = int(json.loads(payload)['update_id'])
+    except (ValueError, TypeError, KeyError):
+        return HttpResponseBadRequest('Invalid update')
+    BotUpdate.objects.bulk_create([BotUpdate(update_id=update_id, payload=payload)], ignore_conflicts=True)
+    return HttpResponse('ok')
+
+
+def consume(bot, idle_sleep: float = 0.5, batch_size: int = BATCH_SIZE):
+    """Feed inbox updates to ``bot``'s dispatcher forever (one consumer only).
+
+    ``bot.dispatch`` blocks while a chat's shard is full, so a backlog
+    stays in the table rather than in memory.
+    """
+    from django.db import close_old_connections
+    from telebot.types import Update
+
+    from shop.models import BotUpdate
+
+    while True:
+        close_old_connections()
+        try:
+            rows = list(BotUpdate.objects.order_by('update_id').values_list('id', 'payload')[:batch_size])
+        except Exception:
+            logger.exception('Reading the webhook inbox failed')
+            time.sleep(5)
+            continue
+        if not rows:
+            time.sleep(idle_sleep)
+            continue
+        for _, payload in rows:
+            try:
+                update = Update.de_json(payload)
+            except Exception:
+                logger.exception('Dropping unreadable update %s', payload[:200])
+                continue
+            bot.dispatch(update)
+        BotUpdate.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
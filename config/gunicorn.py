@@ -0,0 +1,10 @@
+"""gunicorn hooks, loaded by bin/web.sh (``-c config/gunicorn.py``)."""
+import os
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges from the merged /metrics output
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,120 @@
+"""Production media serving.
+
+Replaces ``django.views.static.serve`` for ``/media/``:
+
+- content-hashed names (``variants/<hash>-<w>.webp``, ``remote/<sha1>``)
+  are sent with a one year ``immutable`` Cache-Control, everything else
+  with a short max-age plus revalidation;
+- ``ETag``/``Last-Modified`` so revalidations end in a 304;
+- single ``Range`` requests (206/416);
+- full bodies go out through ``FileResponse``, which gunicorn hands to
+  ``sendfile()``; with ``MEDIA_ACCEL_REDIRECT`` set (e.g. ``/protected-media/``)
+  the response is only an ``X-Accel-Redirect`` header and the front proxy
+  streams the file.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+HASHED_NAME_RE = re.compile(r'^(variants/[0-9a-f]{16}-\d+\.webp|remote/[0-9a-f]{40})$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+
+
+def _cache_control(path: str) -> str:
+    if HASHED_NAME_RE.match(path):
+        return IMMUTABLE
+    return f"public, max-age={int(getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600))}, must-revalidate"
+
+
+def _parse_range(header: str, size: int):
+    """Return ``(start, end)`` for a single satisfiable range, ``None`` to ignore
+    the header, or ``False`` when the range cannot be satisfied."""
+    m = RANGE_RE.match(header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        start = max(0, size - int(m.group(2)))
+        end = size - 1
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    try:
+        st = os.stat(fullpath)
+    except OSError:
+        raise Http404('Not found')
+    if not os.path.isfile(fullpath):
+        raise Http404('Not found')
+
+    etag = '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Cache-Control': _cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(st.st_mtime))
+    if response is None:
+        accel = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '') or ''
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if request.headers.get('Range') and (not if_range or if_range == etag):
+            byte_range = _parse_range(request.headers['Range'], st.st_size)
+
+        if accel:
+            # The proxy handles Range itself; we only decide caching headers
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = accel.rstrip('/') + '/' + path.lstrip('/')
+        elif byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            body = _read_range(fullpath, start, length) if request.method != 'HEAD' else []
+            response = StreamingHttpResponse(body, status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+            response['Content-Length'] = str(length)
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response['Content-Length'] = str(st.st_size)
+        else:
+            response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+            response['Content-Length'] = str(st.st_size)
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
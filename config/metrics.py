@@ -0,0 +1,87 @@
+"""Prometheus metrics for the web app, served at ``/metrics``.
+
+- ``shop_http_requests_total`` / ``shop_http_request_duration_seconds``:
+  requests and latency per view (URL name), method and status;
+- ``shop_http_db_queries`` / ``shop_http_db_seconds_total``: SQL
+  statements per request and time spent in them, per view;
+- ``shop_telegram_requests_total`` / ``shop_telegram_request_duration_seconds``:
+  outbound Bot API calls (``send_telegram_message``) by outcome.
+
+Request metrics are recorded by ``config.middleware.RequestTimingMiddleware``
+from the timings it already collects. With several gunicorn workers set
+``PROMETHEUS_MULTIPROC_DIR`` (``bin/web.sh`` does): every process writes its
+samples there and ``/metrics`` merges them, whichever worker answers;
+``config/gunicorn.py`` drops the files of dead workers.
+
+The Telegram metrics are recorded where ``send_telegram_message`` runs, in
+``notify_worker``; it serves them itself on ``WORKER_METRICS_PORT``
+(``serve``), like the bot does.
+
+``/metrics`` answers only ``Authorization: Bearer $METRICS_TOKEN`` and is
+off (404) without the token: behind a reverse proxy every client looks
+like loopback, so the client address proves nothing.
+"""
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess, start_http_server
+
+from bot.outcomes import telegram_outcome
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUESTS = Counter('shop_http_requests_total', 'HTTP requests', ['view', 'method', 'status'])
+REQUEST_SECONDS = Histogram(
+    'shop_http_request_duration_seconds', 'HTTP request latency', ['view', 'method'], buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram('shop_http_db_queries', 'SQL statements per request', ['view'], buckets=QUERY_BUCKETS)
+DB_SECONDS = Counter('shop_http_db_seconds_total', 'Time spent in SQL', ['view'])
+TELEGRAM_REQUESTS = Counter('shop_telegram_requests_total', 'Bot API calls', ['method', 'outcome'])
+TELEGRAM_SECONDS = Histogram(
+    'shop_telegram_request_duration_seconds', 'Bot API call latency', ['method'], buckets=LATENCY_BUCKETS,
+)
+
+
+def view_label(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name if match is not None else '') or 'unmatched'
+
+
+def observe_request(request, response, seconds: float, timings):
+    view = view_label(request)
+    REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+    REQUEST_SECONDS.labels(view, request.method).observe(seconds)
+    DB_QUERIES.labels(view).observe(timings.queries)
+    DB_SECONDS.labels(view).inc(timings.sql)
+
+
+def observe_telegram(method: str, seconds: float, status_code):
+    """Record one Bot API call; ``status_code`` is None when no response came back."""
+    TELEGRAM_REQUESTS.labels(method, telegram_outcome(status_code)).inc()
+    TELEGRAM_SECONDS.labels(method).observe(seconds)
+
+
+def serve(port: int, addr: str = '127.0.0.1'):
+    """Expose this process's metrics on ``addr:port`` (for processes outside gunicorn)."""
+    start_http_server(port, addr=addr)
+
+
+@require_GET
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '') or ''
+    if not token:
+        raise Http404('Metrics are disabled')
+    auth = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth.encode(), f'Bearer {token}'.encode()):
+        return HttpResponseForbidden('Forbidden')
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
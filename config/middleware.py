@@ -0,0 +1,150 @@
+"""Per-request timings: ``Server-Timing`` header and a slow-request log.
+
+``RequestTimingMiddleware`` (first in ``MIDDLEWARE``) measures:
+
+- ``db``: every SQL statement on the default connection, count and time;
+- ``serialize``: code wrapped in ``span('serialize')`` (building JSON bodies);
+- ``view``: the view plus the response phase of the middleware below;
+- ``total``: the whole request.
+
+Span times leave out the SQL run inside them, so ``db`` and the spans
+never count the same time twice. Timings live in a ``ContextVar``:
+code running outside a request (workers, the bot, background threads)
+finds none and ``span`` costs one lookup. Per statement the cost is two
+clock reads and a push onto a small heap.
+
+The same numbers feed the Prometheus metrics in ``config.metrics``.
+
+The ``Server-Timing`` header goes to staff sessions only, unless
+``SERVER_TIMING`` is on: query counts and timings tell anonymous clients
+more about the backend than they need.
+
+Requests slower than ``SLOW_REQUEST_MS`` are logged to ``config.timing``
+as one JSON line with the timings and the ``SLOW_REQUEST_QUERIES``
+slowest statements (SQL text only, never parameters).
+"""
+import heapq
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+logger = logging.getLogger('config.timing')
+
+_current = ContextVar('request_timings', default=None)
+
+
+class Timings:
+    __slots__ = ('started', 'view_started', 'queries', 'sql', 'spans', 'slowest', 'keep')
+
+    def __init__(self, keep: int):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = 0
+        self.sql = 0.0
+        self.spans = {}
+        self.slowest = []
+        self.keep = keep
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+def current():
+    """The timings of the request being served in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    """Add the time spent in the block (minus its SQL) to the ``name`` timing."""
+    t = _current.get()
+    if t is None:
+        yield
+        return
+    sql_before = t.sql
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        t.add(name, time.perf_counter() - started - (t.sql - sql_before))
+
+
+def _sql(execute, sql, params, many, context):
+    t = _current.get()
+    if t is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        t.queries += 1
+        t.sql += elapsed
+        if t.keep:
+            if len(t.slowest) < t.keep:
+                heapq.heappush(t.slowest, (elapsed, sql))
+            else:
+                heapq.heappushpop(t.slowest, (elapsed, sql))
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _is_staff(request) -> bool:
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = getattr(settings, 'SERVER_TIMING', False)
+        self.slow_ms = getattr(settings, 'SLOW_REQUEST_MS', 1000)
+        self.keep = getattr(settings, 'SLOW_REQUEST_QUERIES', 5) if self.slow_ms else 0
+
+    def __call__(self, request):
+        t = Timings(self.keep)
+        token = _current.set(t)
+        try:
+            with connection.execute_wrapper(_sql):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        now = time.perf_counter()
+        total = now - t.started
+        view = now - t.view_started if t.view_started is not None else 0.0
+        metrics.observe_request(request, response, total, t)
+
+        if self.header or _is_staff(request):
+            parts = [f'db;dur={_ms(t.sql)};desc="{t.queries} queries"']
+            parts += [f'{name};dur={_ms(seconds)}' for name, seconds in t.spans.items()]
+            parts += [f'view;dur={_ms(view)}', f'total;dur={_ms(total)}']
+            response['Server-Timing'] = ', '.join(parts)
+
+        if self.slow_ms and total * 1000 >= self.slow_ms:
+            data = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': _ms(total),
+                'view_ms': _ms(view),
+                'db_ms': _ms(t.sql),
+                'queries': t.queries,
+                **{f'{name}_ms': _ms(seconds) for name, seconds in t.spans.items()},
+                'slowest': [{'ms': _ms(s), 'sql': sql[:500]} for s, sql in sorted(t.slowest, reverse=True)],
+            }
+            logger.warning('Slow request %s', json.dumps(data), extra={'timings': data})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        t = _current.get()
+        if t is not None:
+            t.view_started = time.perf_counter()
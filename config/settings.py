@@ -27,6 +27,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -68,6 +69,28 @@ else:
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 
+# Cache: in-process by default. Set CACHE_URL (redis://... or a directory path)
+# to add a 'shared' alias that all workers can use.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+_cache_url = os.getenv('CACHE_URL', '')
+if _cache_url.startswith(('redis://', 'rediss://')):
+    CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': _cache_url}
+elif _cache_url:
+    CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': _cache_url}
+
+# Catalog snapshot cache (shop.catalog): optional shared alias and how long a
+# worker trusts its local copy of the catalog version (seconds)
+CATALOG_CACHE = os.getenv('CATALOG_CACHE', 'shared' if 'shared' in CACHES else '')
+CATALOG_VERSION_TTL = float(os.getenv('CATALOG_VERSION_TTL', '2'))
+# Days deleted products stay in the ?since= delta; older clients resync in full
+CATALOG_TOMBSTONE_DAYS = int(os.getenv('CATALOG_TOMBSTONE_DAYS', '30'))
+
+# Product search backend: 'auto' (trigram index on PostgreSQL, in-memory index
+# elsewhere), 'postgres' or 'memory'
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -83,6 +106,15 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Production media serving (config/media.py): max-age for non-hashed files, and
+# an optional internal location (e.g. /protected-media/) for nginx X-Accel-Redirect
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', '3600'))
+MEDIA_ACCEL_REDIRECT = os.getenv('MEDIA_ACCEL_REDIRECT', '')
+
+# Resized WebP renditions of product/category images (shop.images)
+IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in os.getenv('IMAGE_VARIANT_WIDTHS', '160,320,640').split(',') if w)
+IMAGE_MAX_SOURCE_BYTES = int(os.getenv('IMAGE_MAX_SOURCE_BYTES', str(15 * 1024 * 1024)))
+
 # Optional: control file permissions for uploaded files (more permissive for PaaS)
 FILE_UPLOAD_PERMISSIONS = 0o644
 FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o755
@@ -92,8 +124,35 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Telegram / project config from env
 BOT_TOKEN = os.getenv('BOT_TOKEN', '')
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID', '')
+# Telegram webhook at /bot/webhook (disabled while empty): the web app stores updates
+# and bot/main.py with BOT_MODE=webhook runs them
+BOT_WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
 BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
 
+# Outbox delivery (shop.notifications / manage.py notify_worker): Telegram
+# allows ~30 msg/s per bot and ~1 msg/s per chat
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '20'))
+
+# How long an /api/order Idempotency-Key replays the original order
+ORDER_IDEMPOTENCY_TTL_HOURS = float(os.getenv('ORDER_IDEMPOTENCY_TTL_HOURS', '24'))
+# Bearer token for the staff order APIs; empty = staff sessions only
+ORDERS_API_TOKEN = os.getenv('ORDERS_API_TOKEN', '')
+
+# Per-request timings (config/middleware.py): Server-Timing header for everyone
+# (staff sessions always get it), and a log line with the slowest queries for
+# requests over SLOW_REQUEST_MS (0 = off)
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+SLOW_REQUEST_QUERIES = int(os.getenv('SLOW_REQUEST_QUERIES', '5'))
+
+# /metrics (config/metrics.py): bearer token for scrapers; empty = /metrics is off
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# notify_worker's own metrics (Telegram call latency and outcomes); 0 = not served
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '0'))
+WORKER_METRICS_ADDR = os.getenv('WORKER_METRICS_ADDR', '127.0.0.1')
+
 # CSRF trusted origins
 _csrf_env = os.getenv('CSRF_TRUSTED_ORIGINS', '')
 if _csrf_env:
@@ -3,11 +3,17 @@ from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
-from django.views.static import serve as static_serve
+
+from bot.webhook import WEBHOOK_PATH, telegram_webhook
+
+from .media import serve_media
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('shop.urls')),
+    path(WEBHOOK_PATH, telegram_webhook, name='telegram_webhook'),
+    path('metrics', metrics_view, name='metrics'),
     path('webapp/', TemplateView.as_view(template_name='webapp/index.html'), name='webapp'),
     path('orders/', TemplateView.as_view(template_name='webapp/orders.html'), name='orders'),
     path('order/', TemplateView.as_view(template_name='webapp/order.html'), name='order_single'),
@@ -16,8 +22,9 @@ urlpatterns = [
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 else:
-    # Serve media in production (small uploads) when using a single-process PaaS
+    # Serve media in production with cache headers, Range and sendfile /
+    # X-Accel-Redirect offload (see config/media.py).
     # For heavy traffic use a CDN/object storage instead.
     urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', static_serve, {'document_root': settings.MEDIA_ROOT}),
+        re_path(r'^media/(?P<path>.*)$', serve_media, name='media'),
     ]
@@ -5,3 +5,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
 
+
+# Build the catalog snapshots before this worker takes its first request
+from shop.catalog import warm  # noqa: E402
+
+warm()
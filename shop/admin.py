@@ -1,22 +1,140 @@
-from django.contrib import admin
+import io
+from datetime import timedelta
+
+from django import forms
+from django.contrib import admin, messages
 from django.conf import settings
-import requests
-from .models import Category, Product, UserProfile, Order, OrderItem
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import analytics, broadcasts, catalog_io, notifications, order_export, services
+from .models import (
+    Broadcast, BroadcastDelivery, Category, DailyStatusSales, Product, UserProfile, Order, OrderItem, OutboxMessage,
+)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that trusts PostgreSQL's row estimate for big unfiltered tables.
+
+    An exact ``COUNT(*)`` over millions of rows takes seconds; the estimate
+    from ``pg_class.reltuples`` (kept fresh by autovacuum) is free. Filtered
+    lists and small tables are counted exactly.
+    """
+    estimate_above = 100000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if isinstance(qs, QuerySet) and not qs.query.where:
+            connection = connections[qs.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [qs.model._meta.db_table])
+                    row = cursor.fetchone()
+                if row and row[0] > self.estimate_above:
+                    return int(row[0])
+        return super().count
+
+
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV or JSON Lines (.jsonl), UTF-8')
+    dry_run = forms.BooleanField(required=False, help_text='Only validate and count; nothing is saved')
+
+
+class CatalogIOAdmin(admin.ModelAdmin):
+    """Export actions and an import page backed by shop.catalog_io."""
+    catalog_kind = None
+    change_list_template = 'admin/shop/catalog_change_list.html'
+    actions = ['export_csv', 'export_jsonl']
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view),
+                 name=f'{opts.app_label}_{opts.model_name}_import'),
+        ] + super().get_urls()
+
+    def _export(self, queryset, fmt):
+        rows = catalog_io.export_rows(self.catalog_kind, queryset)
+        if fmt == 'csv':
+            chunks = catalog_io.to_csv(rows, catalog_io.EXPORT_COLUMNS[self.catalog_kind])
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            chunks = catalog_io.to_jsonl(rows)
+            content_type = 'application/x-ndjson; charset=utf-8'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.catalog_kind}.{fmt}"'
+        return response
+
+    @admin.action(description='Export selected as CSV')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Export selected as JSON Lines')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        opts = self.model._meta
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            dry_run = form.cleaned_data['dry_run']
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = catalog_io.import_rows(
+                    self.catalog_kind, catalog_io.read_rows(stream, catalog_io.format_for(upload.name)), dry_run=dry_run,
+                )
+            except UnicodeDecodeError:
+                self.message_user(request, 'The file is not UTF-8 text', messages.ERROR)
+            else:
+                self.message_user(
+                    request,
+                    f"{'Dry run: ' if dry_run else ''}{result['rows']} rows: {result['created']} created, "
+                    f"{result['updated']} updated, {result['unchanged']} unchanged, {result['errors']} errors",
+                    messages.WARNING if result['errors'] else messages.SUCCESS,
+                )
+                for message in result['error_samples'][:10]:
+                    self.message_user(request, message, messages.ERROR)
+                if not dry_run and not result['errors']:
+                    return redirect(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Import {opts.verbose_name_plural}',
+            'opts': opts,
+            'form': form,
+            'columns': catalog_io.EXPORT_COLUMNS[self.catalog_kind],
+            'natural_key': catalog_io.KINDS[self.catalog_kind][1],
+        }
+        return TemplateResponse(request, 'admin/shop/catalog_import.html', context)
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name_uz', 'name_ru', 'name_en', 'sort_order', 'image_url', 'image')
+class CategoryAdmin(CatalogIOAdmin):
+    catalog_kind = 'categories'
+    list_display = ('id', 'code', 'name_uz', 'name_ru', 'name_en', 'sort_order', 'image_url', 'image')
     list_editable = ('sort_order',)
-    search_fields = ('name_uz', 'name_ru', 'name_en')
+    search_fields = ('code', 'name_uz', 'name_ru', 'name_en')
     ordering = ('sort_order', 'id')
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name_uz', 'name_ru', 'name_en', 'category', 'price', 'is_active', 'sort_order', 'image_url')
+class ProductAdmin(CatalogIOAdmin):
+    catalog_kind = 'products'
+    list_display = (
+        'id', 'sku', 'name_uz', 'name_ru', 'name_en', 'category', 'price', 'is_active', 'sort_order', 'image_url',
+    )
     list_filter = ('category', 'is_active')
-    search_fields = ('name_uz', 'name_ru', 'name_en')
+    search_fields = ('sku', 'name_uz', 'name_ru', 'name_en')
     list_editable = ('sort_order',)
     ordering = ('sort_order', 'id')
 
@@ -30,52 +148,170 @@ class UserProfileAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    fields = ('product', 'product_name_uz', 'quantity', 'price')
+    readonly_fields = ('product_name_uz',)
+    # A <select> would list every product in the catalog
+    autocomplete_fields = ('product',)
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'total', 'status', 'created_at')
-    list_filter = ('status',)
-    date_hierarchy = 'created_at'
+    # DateFieldListFilter offers fixed ranges instead of date_hierarchy's
+    # scan for distinct dates over the whole table
+    list_filter = ('status', ('created_at', admin.DateFieldListFilter))
+    list_select_related = ('user',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    raw_id_fields = ('user',)
     inlines = [OrderItemInline]
     list_editable = ('status',)
+    actions = ['mark_processing', 'mark_done', 'mark_cancelled', 'export_csv', 'export_jsonl']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
 
     def save_model(self, request, obj, form, change):
-        old_status = None
-        if change:
-            try:
-                old_status = Order.objects.get(pk=obj.pk).status
-            except Order.DoesNotExist:
-                old_status = None
         super().save_model(request, obj, form, change)
-        if change and old_status != obj.status:
+        # The form knows what the admin changed; no need to re-read the row.
+        # The old bucket gives back the total it was credited, not the edited one.
+        if change and ('status' in form.changed_data or 'total' in form.changed_data):
+            old = (form.initial.get('status', obj.status), form.initial.get('total', obj.total))
+            analytics.status_changed([(obj.pk, obj.created_at, obj.total, *old)], obj.status)
+        if change and 'status' in form.changed_data:
             self._notify_status_change(obj)
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is OrderItem:
+            # Items added or repointed here need the same snapshot services gives them
+            for item_form in formset.forms:
+                item = item_form.instance
+                if item.product_id and ('product' in item_form.changed_data or not item.product_name_uz):
+                    item.snapshot_product(item.product)
+        super().save_formset(request, form, formset, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if not change:
+            # Orders added by hand count once their items exist
+            analytics.order_created(form.instance, form.instance.items.all())
+
     @staticmethod
     def _notify_status_change(order: Order):
         token = getattr(settings, 'BOT_TOKEN', '')
         chat_id = getattr(order.user, 'telegram_id', '') if order.user_id else ''
         if not token or not chat_id:
             return
-        # Localize minimal status names
-        lang = (getattr(order.user, 'language', 'UZ') or 'UZ').upper()
-        status_map = {
-            'new':        {'UZ': 'Yangi',        'RU': 'Новый',       'EN': 'New'},
-            'processing': {'UZ': 'Jarayonda',    'RU': 'В обработке', 'EN': 'Processing'},
-            'done':       {'UZ': 'Tugallandi',   'RU': 'Готов',       'EN': 'Done'},
-            'cancelled':  {'UZ': 'Bekor qilindi','RU': 'Отменён',     'EN': 'Cancelled'},
-        }
-        st_txt = status_map.get(order.status, {}).get(lang, order.status)
-        texts = {
-            'UZ': f"📦 Buyurtma #{order.id} status yangilandi: {st_txt}",
-            'RU': f"📦 Заказ #{order.id} обновлён: {st_txt}",
-            'EN': f"📦 Order #{order.id} updated: {st_txt}",
-        }
-        text = texts.get(lang, texts['EN'])
-        try:
-            url = f"https://api.telegram.org/bot{token}/sendMessage"
-            requests.post(url, json={'chat_id': chat_id, 'text': text}, timeout=10)
-        except Exception:
-            pass
+        text = services.status_change_text(order.id, order.status, getattr(order.user, 'language', 'UZ'))
+        # Sent by the notify_worker process after the admin save commits
+        notifications.enqueue(chat_id, text)
+
+    def _bulk_status(self, request, queryset, status):
+        changed = services.bulk_set_status(queryset.values_list('pk', flat=True), status)
+        self.message_user(request, f"{changed} order(s) marked {status}; customers will be notified")
+
+    @admin.action(description='Mark selected orders as processing')
+    def mark_processing(self, request, queryset):
+        self._bulk_status(request, queryset, 'processing')
+
+    @admin.action(description='Mark selected orders as done')
+    def mark_done(self, request, queryset):
+        self._bulk_status(request, queryset, 'done')
+
+    @admin.action(description='Mark selected orders as cancelled')
+    def mark_cancelled(self, request, queryset):
+        self._bulk_status(request, queryset, 'cancelled')
+
+    def _export(self, queryset, fmt):
+        response = StreamingHttpResponse(
+            order_export.stream(queryset, fmt), content_type=order_export.CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+        return response
+
+    @admin.action(description='Export selected orders with items as CSV')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Export selected orders with items as JSON Lines')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
 
     readonly_fields = ()
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'chat_id', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at', 'last_error')
+    list_filter = ('status',)
+    search_fields = ('chat_id',)
+    readonly_fields = ('chat_id', 'text', 'attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboxMessage.SENT).update(
+            status=OutboxMessage.PENDING, attempts=0, next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f"{updated} message(s) queued for retry")
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'recipients', 'sent', 'failed', 'blocked', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'recipients', 'sent', 'failed', 'blocked', 'started_at', 'finished_at')
+    actions = ['start_broadcast', 'pause_broadcast']
+
+    @admin.action(description='Start / resume selected broadcasts')
+    def start_broadcast(self, request, queryset):
+        started = sum(broadcasts.start(pk) for pk in queryset.values_list('pk', flat=True))
+        self.message_user(request, f"{started} broadcast(s) queued; notify_worker sends them")
+
+    @admin.action(description='Pause selected broadcasts')
+    def pause_broadcast(self, request, queryset):
+        paused = sum(broadcasts.pause(pk) for pk in queryset.values_list('pk', flat=True))
+        self.message_user(request, f"{paused} broadcast(s) paused")
+
+
+@admin.register(BroadcastDelivery)
+class BroadcastDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'broadcast', 'chat_id', 'language', 'status', 'attempts', 'sent_at', 'last_error')
+    list_filter = ('status', 'broadcast')
+    search_fields = ('chat_id',)
+    raw_id_fields = ('broadcast', 'user')
+    list_select_related = ('broadcast',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+
+@admin.register(DailyStatusSales)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    """Sales report built from the daily rollups (see shop.analytics)."""
+    periods = (7, 30, 90, 365)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        try:
+            days = int(request.GET.get('days') or 30)
+        except ValueError:
+            days = 30
+        days = min(max(days, 1), 3660)
+        end = timezone.localdate()
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales dashboard',
+            'opts': self.model._meta,
+            'days': days,
+            'periods': self.periods,
+            'report': analytics.report(end - timedelta(days=days - 1), end),
+        }
+        return TemplateResponse(request, 'admin/shop/sales_dashboard.html', context)
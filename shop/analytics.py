@@ -0,0 +1,220 @@
+"""Daily sales rollups.
+
+Three small tables answer every sales report without touching ``Order``
+or ``OrderItem``:
+
+- ``DailyStatusSales``: orders and revenue per day and current status;
+- ``DailyProductSales``: orders, units and revenue per day and product;
+- ``DailyCategorySales``: units and revenue per day and category.
+
+Days are the local date (``TIME_ZONE``) the order was placed. Product and
+category rows leave out cancelled orders. Lines count under the category
+recorded on the item when the order was placed (``product_category``), so
+moving a product to another category never shifts its past sales. ``services`` keeps them current
+inside the same transaction as the order write: creating an order and
+changing its status each add one multi-row ``INSERT … ON CONFLICT DO
+UPDATE`` per affected table. Edits that bypass ``services`` and the admin
+(raw SQL, deleting orders, changing items by hand) are not tracked;
+``manage.py rebuild_sales_rollups`` recomputes any range from scratch.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    Category, DailyCategorySales, DailyProductSales, DailyStatusSales, Order, OrderItem, Product,
+)
+
+# Statuses whose orders do not count as sales
+NOT_SALES = ('cancelled',)
+
+
+def _day(created_at):
+    return timezone.localdate(created_at)
+
+
+def _increment(model, key_fields, counter_fields, deltas):
+    """Add ``deltas`` (``{key_tuple: counter_tuple}``) to ``model`` rows,
+    creating missing ones, in one statement."""
+    deltas = {k: v for k, v in deltas.items() if any(v)}
+    if not deltas:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    fields = [model._meta.get_field(f) for f in key_fields + counter_fields]
+    columns = [qn(f.column) for f in fields]
+    keys = columns[:len(key_fields)]
+    counters = columns[len(key_fields):]
+    params = []
+    # Key order, not cart or status order: concurrent writers then lock the
+    # shared rows in the same order and cannot deadlock on PostgreSQL
+    for key, values in sorted(deltas.items()):
+        for field, value in zip(fields, key + tuple(values)):
+            params.append(field.get_db_prep_value(value, connection))
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row] * len(deltas))} "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+        + ', '.join(f'{c} = {table}.{c} + EXCLUDED.{c}' for c in counters)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _add_items(items, sign):
+    """Apply ``(day, order_id, product_id, category_id, quantity, price)`` lines."""
+    products = defaultdict(lambda: [set(), 0, Decimal('0')])
+    categories = defaultdict(lambda: [0, Decimal('0')])
+    for day, order_id, product_id, category_id, quantity, price in items:
+        amount = Decimal(price) * quantity
+        p = products[(day, product_id)]
+        p[0].add(order_id)
+        p[1] += quantity
+        p[2] += amount
+        if category_id is None:
+            continue
+        c = categories[(day, category_id)]
+        c[0] += quantity
+        c[1] += amount
+    _increment(DailyProductSales, ('day', 'product_id'), ('orders', 'units', 'revenue'), {
+        k: (sign * len(orders), sign * units, sign * revenue) for k, (orders, units, revenue) in products.items()
+    })
+    _increment(DailyCategorySales, ('day', 'category_id'), ('units', 'revenue'), {
+        k: (sign * units, sign * revenue) for k, (units, revenue) in categories.items()
+    })
+
+
+def order_created(order, items):
+    """Count a new order; ``items`` are its saved, snapshotted OrderItems."""
+    day = _day(order.created_at)
+    _increment(DailyStatusSales, ('day', 'status'), ('orders', 'revenue'), {(day, order.status): (1, order.total)})
+    if order.status not in NOT_SALES:
+        _add_items([(day, order.id, it.product_id, it.product_category_id, it.quantity, it.price) for it in items], 1)
+
+
+def status_changed(orders, new_status):
+    """Move orders between statuses.
+
+    ``orders`` holds ``(order_id, created_at, total, old_status)`` for
+    orders whose status actually changed; call inside the transaction that
+    updated them. A fifth ``old_total`` element gives the total counted
+    under ``old_status`` when the same save also edited the total.
+    """
+    statuses = defaultdict(lambda: [0, Decimal('0')])
+    leaving, returning = [], []
+    for order_id, created_at, total, old_status, *old_total in orders:
+        day = _day(created_at)
+        for key, sign, amount in (((day, old_status), -1, old_total[0] if old_total else total), ((day, new_status), 1, total)):
+            statuses[key][0] += sign
+            statuses[key][1] += sign * amount
+        if old_status not in NOT_SALES and new_status in NOT_SALES:
+            leaving.append(order_id)
+        elif old_status in NOT_SALES and new_status not in NOT_SALES:
+            returning.append(order_id)
+    _increment(DailyStatusSales, ('day', 'status'), ('orders', 'revenue'), {k: tuple(v) for k, v in statuses.items()})
+    for ids, sign in ((leaving, -1), (returning, 1)):
+        if ids:
+            rows = OrderItem.objects.filter(order_id__in=ids).values_list(
+                'order__created_at', 'order_id', 'product_id', 'product_category_id', 'quantity', 'price',
+            )
+            _add_items([(_day(r[0]),) + tuple(r[1:]) for r in rows], sign)
+
+
+def _day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def rebuild(start, end) -> dict:
+    """Recompute the rollups for ``start``..``end`` (dates, inclusive)."""
+    lo, hi = _day_bounds(start, end)
+    tz = timezone.get_current_timezone()
+    amount = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    with transaction.atomic():
+        for model in (DailyStatusSales, DailyProductSales, DailyCategorySales):
+            model.objects.filter(day__gte=start, day__lte=end).delete()
+
+        orders = (
+            Order.objects.filter(created_at__gte=lo, created_at__lt=hi)
+            .annotate(d=TruncDate('created_at', tzinfo=tz))
+            .values('d', 'status').annotate(n=Count('id'), revenue=Sum('total')).order_by()
+        )
+        DailyStatusSales.objects.bulk_create(
+            [DailyStatusSales(day=r['d'], status=r['status'], orders=r['n'], revenue=r['revenue']) for r in orders],
+            batch_size=1000,
+        )
+        items = (
+            OrderItem.objects.filter(order__created_at__gte=lo, order__created_at__lt=hi)
+            .exclude(order__status__in=NOT_SALES)
+            .annotate(d=TruncDate('order__created_at', tzinfo=tz))
+        )
+        products = (
+            items.values('d', 'product_id')
+            .annotate(n=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum(amount)).order_by()
+        )
+        DailyProductSales.objects.bulk_create(
+            [DailyProductSales(day=r['d'], product_id=r['product_id'], orders=r['n'], units=r['units'], revenue=r['revenue'])
+             for r in products],
+            batch_size=1000,
+        )
+        categories = (
+            items.exclude(product_category__isnull=True).values('d', 'product_category_id')
+            .annotate(units=Sum('quantity'), revenue=Sum(amount)).order_by()
+        )
+        DailyCategorySales.objects.bulk_create(
+            [DailyCategorySales(day=r['d'], category_id=r['product_category_id'], units=r['units'], revenue=r['revenue'])
+             for r in categories],
+            batch_size=1000,
+        )
+    return {
+        'days': (end - start).days + 1,
+        'status_rows': DailyStatusSales.objects.filter(day__gte=start, day__lte=end).count(),
+        'product_rows': DailyProductSales.objects.filter(day__gte=start, day__lte=end).count(),
+        'category_rows': DailyCategorySales.objects.filter(day__gte=start, day__lte=end).count(),
+    }
+
+
+def report(start, end, top: int = 10) -> dict:
+    """Sales for ``start``..``end`` (dates, inclusive), read from the rollups only."""
+    in_range = {'day__gte': start, 'day__lte': end}
+    sales = DailyStatusSales.objects.filter(**in_range).exclude(status__in=NOT_SALES)
+    days = list(sales.values('day').annotate(orders=Sum('orders'), revenue=Sum('revenue')).order_by('day'))
+    statuses = list(
+        DailyStatusSales.objects.filter(**in_range)
+        .values('status').annotate(orders=Sum('orders'), revenue=Sum('revenue')).order_by('status')
+    )
+    products = list(
+        DailyProductSales.objects.filter(**in_range)
+        .values('product_id').annotate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:top]
+    )
+    categories = list(
+        DailyCategorySales.objects.filter(**in_range)
+        .values('category_id').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-revenue')
+    )
+    product_names = dict(Product.objects.filter(pk__in=[p['product_id'] for p in products]).values_list('id', 'name_uz'))
+    category_names = dict(Category.objects.filter(pk__in=[c['category_id'] for c in categories]).values_list('id', 'name_uz'))
+    for p in products:
+        p['name'] = product_names.get(p['product_id'], '')
+    for c in categories:
+        c['name'] = category_names.get(c['category_id'], '')
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': {
+            'orders': sum(d['orders'] for d in days),
+            'revenue': float(sum((d['revenue'] for d in days), Decimal('0'))),
+        },
+        'days': [{'day': d['day'].isoformat(), 'orders': d['orders'], 'revenue': float(d['revenue'])} for d in days],
+        'statuses': [{**s, 'revenue': float(s['revenue'])} for s in statuses],
+        'products': [{**p, 'revenue': float(p['revenue'])} for p in products],
+        'categories': [{**c, 'revenue': float(c['revenue'])} for c in categories],
+    }
@@ -0,0 +1,199 @@
+"""Broadcasts: one message to every UserProfile.
+
+A queued ``Broadcast`` is sent by ``manage.py notify_worker`` between
+outbox batches (or in the foreground by ``manage.py broadcast run``)
+through the same ``notifications.Dispatcher``, so broadcasts and order
+notifications share the global and per-chat token buckets and a 429
+pauses both:
+
+- recipients are added in ``UserProfile.id`` chunks as sending goes on
+  (``Broadcast.cursor``), so memory use does not grow with the audience;
+- deliveries are claimed in batches and marked ``sending`` before the
+  request goes out. A crash can lose a message but never send one twice:
+  rows left in ``sending`` longer than ``LEASE_SECONDS`` are failed as
+  interrupted when the broadcast resumes;
+- 403 (bot blocked, account deleted) marks the recipient ``blocked``;
+  429 pauses all sending for ``retry_after`` and requeues the row; network
+  errors and 5xx are retried up to ``MAX_ATTEMPTS`` times.
+
+Sending speed is bounded by ``TELEGRAM_GLOBAL_RATE``: 100k recipients
+take 100000 / rate seconds (about 67 minutes at the default 25/s).
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Broadcast, BroadcastDelivery, UserProfile
+from .notifications import send_telegram_message
+
+logger = logging.getLogger(__name__)
+
+FILL_CHUNK = 1000
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+
+def start(broadcast_id) -> bool:
+    """Queue a draft or paused broadcast for the worker."""
+    return bool(Broadcast.objects.filter(pk=broadcast_id, status__in=[Broadcast.DRAFT, Broadcast.PAUSED]).update(
+        status=Broadcast.QUEUED, started_at=Coalesce('started_at', timezone.now()),
+    ))
+
+
+def pause(broadcast_id) -> bool:
+    """Stop after the batch in flight; ``start`` resumes where it stopped."""
+    return bool(Broadcast.objects.filter(pk=broadcast_id, status=Broadcast.QUEUED).update(status=Broadcast.PAUSED))
+
+
+def _fill(broadcast_id):
+    """Add the next chunk of recipients after the broadcast's cursor."""
+    with transaction.atomic():
+        b = Broadcast.objects.select_for_update().get(pk=broadcast_id)
+        if b.recipients_complete:
+            return
+        users = list(
+            UserProfile.objects.filter(id__gt=b.cursor).order_by('id')
+            .values_list('id', 'telegram_id', 'language')[:FILL_CHUNK]
+        )
+        added = 0
+        if users:
+            # ignore_conflicts hides which rows were skipped; count the chunk's range instead
+            chunk = BroadcastDelivery.objects.filter(
+                broadcast_id=b.pk, user_id__gt=b.cursor, user_id__lte=users[-1][0],
+            )
+            before = chunk.count()
+            BroadcastDelivery.objects.bulk_create(
+                [BroadcastDelivery(broadcast_id=b.pk, user_id=uid, chat_id=tid, language=lang or '') for uid, tid, lang in users],
+                ignore_conflicts=True,
+            )
+            added = chunk.count() - before
+        Broadcast.objects.filter(pk=b.pk).update(
+            cursor=users[-1][0] if users else b.cursor,
+            recipients=F('recipients') + added,
+            recipients_complete=len(users) < FILL_CHUNK,
+        )
+
+
+def _recover(broadcast_id):
+    """Fail deliveries whose sender died mid-request (they may have gone out)."""
+    stale = timezone.now() - timedelta(seconds=LEASE_SECONDS)
+    with transaction.atomic():
+        n = BroadcastDelivery.objects.filter(
+            broadcast_id=broadcast_id, status=BroadcastDelivery.SENDING, claimed_at__lt=stale,
+        ).update(status=BroadcastDelivery.FAILED, last_error='interrupted')
+        if n:
+            Broadcast.objects.filter(pk=broadcast_id).update(failed=F('failed') + n)
+
+
+def _claim(broadcast_id, limit) -> list:
+    if limit <= 0:
+        return []
+    with transaction.atomic():
+        qs = BroadcastDelivery.objects.filter(broadcast_id=broadcast_id, status=BroadcastDelivery.PENDING).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        batch = list(qs[:limit])
+        if batch:
+            BroadcastDelivery.objects.filter(pk__in=[d.pk for d in batch]).update(
+                status=BroadcastDelivery.SENDING, claimed_at=timezone.now(),
+            )
+    return batch
+
+
+def _send(dispatcher, broadcast, delivery):
+    """Send one delivery; returns ``(outcome, error)``."""
+    try:
+        return _attempt(dispatcher, broadcast, delivery)
+    except Exception as e:
+        logger.exception('Broadcast delivery #%s failed', delivery.pk)
+        return 'retry', str(e)
+
+
+def _attempt(dispatcher, broadcast, delivery):
+    if dispatcher.paused_until > time.monotonic():
+        return 'deferred', ''
+    if dispatcher.chat_bucket(delivery.chat_id).try_acquire():
+        return 'deferred', ''
+    dispatcher.global_bucket.acquire()
+    result = send_telegram_message(delivery.chat_id, broadcast.text_for(delivery.language), session=dispatcher.session)
+    if result.ok:
+        return 'sent', ''
+    if result.retry_after:
+        dispatcher.pause(result.retry_after)
+        return 'deferred', result.error
+    if result.config_error:
+        dispatcher.config_error(result.error)
+        return 'deferred', result.error
+    if result.status_code == 403:
+        return 'blocked', result.error
+    if result.permanent:
+        return 'failed', result.error
+    return 'retry', result.error
+
+
+def _record(broadcast, batch, outcomes) -> dict:
+    now = timezone.now()
+    by_outcome = {}
+    for delivery, (outcome, error) in zip(batch, outcomes):
+        if outcome == 'retry' and delivery.attempts + 1 >= MAX_ATTEMPTS:
+            outcome = 'failed'
+        by_outcome.setdefault(outcome, []).append((delivery, error))
+
+    Delivery = BroadcastDelivery
+    with transaction.atomic():
+        for outcome, rows in by_outcome.items():
+            ids = [d.pk for d, _ in rows]
+            if outcome == 'sent':
+                Delivery.objects.filter(pk__in=ids).update(status=Delivery.SENT, sent_at=now, attempts=F('attempts') + 1, last_error='')
+            elif outcome == 'deferred':
+                Delivery.objects.filter(pk__in=ids).update(status=Delivery.PENDING, claimed_at=None)
+            elif outcome == 'retry':
+                Delivery.objects.filter(pk__in=ids).update(status=Delivery.PENDING, claimed_at=None, attempts=F('attempts') + 1)
+            else:
+                status = Delivery.BLOCKED if outcome == 'blocked' else Delivery.FAILED
+                Delivery.objects.filter(pk__in=ids).update(status=status, attempts=F('attempts') + 1, last_error=rows[0][1][:1000])
+        counters = {
+            field: F(field) + len(by_outcome[outcome])
+            for outcome, field in (('sent', 'sent'), ('failed', 'failed'), ('blocked', 'blocked'))
+            if outcome in by_outcome
+        }
+        if counters:
+            Broadcast.objects.filter(pk=broadcast.pk).update(**counters)
+    return {outcome: len(rows) for outcome, rows in by_outcome.items()}
+
+
+def _finish_if_done(broadcast):
+    broadcast.refresh_from_db(fields=['recipients_complete'])
+    if not broadcast.recipients_complete:
+        return False
+    open_rows = BroadcastDelivery.objects.filter(
+        broadcast=broadcast, status__in=[BroadcastDelivery.PENDING, BroadcastDelivery.SENDING],
+    )
+    if open_rows.exists():
+        return False
+    Broadcast.objects.filter(pk=broadcast.pk, status=Broadcast.QUEUED).update(status=Broadcast.DONE, finished_at=timezone.now())
+    return True
+
+
+def run_once(dispatcher, batch_size: int = 25, broadcast_id=None) -> dict:
+    """Send one batch of the oldest queued broadcast; returns outcome counts."""
+    qs = Broadcast.objects.filter(status=Broadcast.QUEUED)
+    if broadcast_id is not None:
+        qs = qs.filter(pk=broadcast_id)
+    broadcast = qs.order_by('id').first()
+    if broadcast is None or dispatcher.paused_until > time.monotonic():
+        return {}
+    _recover(broadcast.pk)
+    batch = _claim(broadcast.pk, batch_size)
+    if len(batch) < batch_size and not broadcast.recipients_complete:
+        _fill(broadcast.pk)
+        batch += _claim(broadcast.pk, batch_size - len(batch))
+    if not batch:
+        return {'done': 1} if _finish_if_done(broadcast) else {}
+    outcomes = list(dispatcher.pool.map(lambda d: _send(dispatcher, broadcast, d), batch))
+    return _record(broadcast, batch, outcomes)
@@ -0,0 +1,286 @@
+"""Versioned snapshot cache for the public catalog endpoints.
+
+The catalog only changes when someone saves a product or category, so the
+JSON bodies of ``/api/products`` and ``/api/categories`` are built once per
+catalog version and served as ready bytes afterwards.
+
+- The version lives in the single ``CatalogVersion`` row and is bumped by
+  the signals in ``shop.signals`` (inside the writer's transaction).
+- Each worker keeps snapshots in-process and re-checks the version at most
+  every ``CATALOG_VERSION_TTL`` seconds.
+- When ``CATALOG_CACHE`` names a Django cache alias (e.g. Redis) the version
+  and the snapshots are shared between workers as well.
+
+Every product row also carries the version that last touched it and deleted
+products leave a ``CatalogTombstone``, which is what ``changes_since`` uses
+to answer ``/api/products?since=<version>``. Tombstones are kept for
+``CATALOG_TOMBSTONE_DAYS``; a ``since`` older than the pruned ones gets
+``resync`` instead of a delta.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Max
+from django.http import HttpRequest
+from django.utils import timezone
+
+from config.middleware import span
+
+from .models import CatalogTombstone, CatalogVersion, Product
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'shop:catalog:version'
+# Shared entries expire on their own so a lost publish can never pin a stale version
+SHARED_TTL = 300
+# Each process prunes old tombstones at most this often (seconds)
+PRUNE_INTERVAL = 3600
+
+Snapshot = namedtuple('Snapshot', 'version body etag last_modified source')
+
+_lock = threading.Lock()
+_local = {'version': None, 'modified': 0, 'checked_at': 0.0, 'snapshots': {}, 'pruned_at': 0.0}
+
+# Per-process counters, exposed by shop.views.catalog_stats
+STATS = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'version_reads': 0, 'bumps': 0}
+
+
+def _shared_cache():
+    alias = getattr(settings, 'CATALOG_CACHE', '') or ''
+    if not alias:
+        return None
+    try:
+        return caches[alias]
+    except Exception:
+        logger.warning('CATALOG_CACHE alias %r is not configured', alias)
+        return None
+
+
+def read_version():
+    """Return ``(version, modified_timestamp)`` straight from the database."""
+    STATS['version_reads'] += 1
+    obj, _ = CatalogVersion.objects.get_or_create(pk=1, defaults={'value': 1})
+    return obj.value, int(obj.updated_at.timestamp())
+
+
+def _read_version():
+    shared = _shared_cache()
+    if shared is not None:
+        try:
+            value = shared.get(VERSION_KEY)
+            if value is not None:
+                return tuple(value)
+        except Exception:
+            logger.exception('Shared catalog cache read failed')
+    value = read_version()
+    if shared is not None:
+        try:
+            shared.set(VERSION_KEY, value, SHARED_TTL)
+        except Exception:
+            pass
+    return value
+
+
+def _set_local(version: int, modified: int):
+    if _local['version'] is None or version >= _local['version']:
+        _local['version'] = version
+        _local['modified'] = modified
+    _local['checked_at'] = time.monotonic()
+
+
+def current_version() -> int:
+    """Return the catalog version, trusting the local copy for a short TTL."""
+    ttl = float(getattr(settings, 'CATALOG_VERSION_TTL', 2))
+    version = _local['version']
+    if version is not None and time.monotonic() - _local['checked_at'] < ttl:
+        return version
+    version, modified = _read_version()
+    with _lock:
+        _set_local(version, modified)
+        return _local['version']
+
+
+def _publish(version: int, modified: int):
+    with _lock:
+        _set_local(version, modified)
+        stale = [k for k, snap in _local['snapshots'].items() if snap.version < _local['version']]
+        for k in stale:
+            _local['snapshots'].pop(k, None)
+    shared = _shared_cache()
+    if shared is not None:
+        try:
+            shared.set(VERSION_KEY, (version, modified), SHARED_TTL)
+        except Exception:
+            logger.exception('Shared catalog cache write failed')
+
+
+def bump_version() -> int:
+    """Advance the catalog version and return the new value.
+
+    Runs in the caller's transaction, so the row lock orders concurrent
+    catalog writes; caches learn about the new version once it commits.
+    """
+    now = timezone.now()
+    if not CatalogVersion.objects.filter(pk=1).update(value=F('value') + 1, updated_at=now):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'value': 1})
+    version = CatalogVersion.objects.values_list('value', flat=True).get(pk=1)
+    STATS['bumps'] += 1
+    transaction.on_commit(lambda: _publish(version, int(now.timestamp())))
+    return version
+
+
+def stamp_product(product, deleted=False) -> int:
+    """Bump the version and record it on ``product`` (or its tombstone).
+
+    Both happen in one transaction: a delta reader never sees the new
+    version without the row that carries it.
+    """
+    with transaction.atomic():
+        version = bump_version()
+        if deleted:
+            CatalogTombstone.objects.create(product_id=product.pk, version=version)
+        else:
+            Product.objects.filter(pk=product.pk).update(catalog_version=version)
+            product.catalog_version = version
+    if deleted and time.monotonic() - _local['pruned_at'] >= PRUNE_INTERVAL:
+        _local['pruned_at'] = time.monotonic()
+        prune_tombstones()
+    return version
+
+
+def prune_tombstones() -> int:
+    """Drop tombstones older than ``CATALOG_TOMBSTONE_DAYS``; returns how many."""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'CATALOG_TOMBSTONE_DAYS', 30))
+    with transaction.atomic():
+        old = CatalogTombstone.objects.filter(deleted_at__lt=cutoff)
+        newest = old.aggregate(v=Max('version'))['v']
+        if newest is None:
+            return 0
+        # Recorded first: clients behind it can no longer be told about these deletions
+        CatalogVersion.objects.filter(pk=1, pruned_through__lt=newest).update(pruned_through=newest)
+        return CatalogTombstone.objects.filter(version__lte=newest).delete()[0]
+
+
+def changes_since(since: int, serialize):
+    """Return the delta payload for clients that last saw version ``since``.
+
+    Changed active products are serialized with ``serialize``; deactivated
+    and deleted ones are reported by id in ``removed``. The version is read
+    from the database first so the window never skips a concurrent write.
+    When tombstones newer than ``since`` were pruned the payload is just
+    ``{'version', 'since', 'resync': True}``: fetch the full catalog.
+    """
+    row = CatalogVersion.objects.filter(pk=1).values_list('value', 'pruned_through').first()
+    version, pruned_through = row or (read_version()[0], 0)
+    if since < pruned_through:
+        return {'version': version, 'since': since, 'resync': True}
+    changed = (
+        Product.objects
+        .filter(catalog_version__gt=since, catalog_version__lte=version)
+        .order_by('sort_order', 'id')
+    )
+    products, removed = [], []
+    for p in changed:
+        if p.is_active:
+            products.append(serialize(p))
+        else:
+            removed.append(p.id)
+    removed.extend(
+        CatalogTombstone.objects
+        .filter(version__gt=since, version__lte=version)
+        .values_list('product_id', flat=True)
+    )
+    return {'version': version, 'since': since, 'products': products, 'removed': sorted(set(removed))}
+
+
+def _shared_key(kind: str, version: int, variant: str) -> str:
+    digest = hashlib.md5(variant.encode('utf-8')).hexdigest()[:12]
+    return f'shop:catalog:{kind}:{version}:{digest}'
+
+
+def get_snapshot(kind: str, variant: str, build) -> Snapshot:
+    """Return the serialized ``kind`` payload for the current version.
+
+    ``variant`` separates bodies that differ per request (the media base
+    URL). ``build`` is only called on a miss and must return a
+    JSON-serializable payload.
+    """
+    version = current_version()
+    key = (kind, variant)
+    snap = _local['snapshots'].get(key)
+    if snap is not None and snap.version == version:
+        STATS['hits'] += 1
+        return snap._replace(source='hit')
+
+    shared = _shared_cache()
+    skey = _shared_key(kind, version, variant)
+    body = None
+    if shared is not None:
+        try:
+            body = shared.get(skey)
+        except Exception:
+            body = None
+    modified = _local['modified']
+    if body is not None:
+        STATS['shared_hits'] += 1
+        source = 'shared'
+    else:
+        STATS['misses'] += 1
+        source = 'miss'
+        with span('serialize'):
+            body = json.dumps(build(), cls=DjangoJSONEncoder).encode('utf-8')
+        if shared is not None:
+            try:
+                shared.set(skey, body, SHARED_TTL)
+            except Exception:
+                pass
+
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    snap = Snapshot(version, body, etag, modified, source)
+    with _lock:
+        cur = _local['snapshots'].get(key)
+        if cur is None or cur.version <= version:
+            _local['snapshots'][key] = snap
+    return snap
+
+
+def stats() -> dict:
+    return {
+        **STATS,
+        'version': _local['version'],
+        'snapshots': len(_local['snapshots']),
+    }
+
+
+def warm():
+    """Pre-build the catalog snapshots for BASE_URL (called on worker start)."""
+    from . import views
+
+    base = getattr(settings, 'BASE_URL', '') or ''
+    parts = urlsplit(base)
+    if not parts.netloc:
+        return
+    request = HttpRequest()
+    request.method = 'GET'
+    request.META = {
+        'HTTP_HOST': parts.netloc,
+        'SERVER_NAME': parts.hostname or '',
+        'SERVER_PORT': str(parts.port or (443 if parts.scheme == 'https' else 80)),
+        'HTTP_X_FORWARDED_PROTO': parts.scheme,
+    }
+    try:
+        views.categories(request)
+        views.products(request)
+        logger.info('Catalog cache warmed at version %s', _local['version'])
+    except Exception:
+        logger.exception('Catalog cache warm-up failed')
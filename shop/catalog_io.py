@@ -0,0 +1,331 @@
+"""Streaming catalog import and export (CSV or JSON Lines).
+
+Rows are matched on natural keys: ``Category.code`` and ``Product.sku``.
+Rows without one fall back to ``id`` (update only), and so do rows whose
+key matches nothing but whose ``id`` does, which sets the key on that
+row. A catalog that has no keys yet can be exported, given keys and
+imported back without duplicating anything. Products name their
+category by ``category`` (its code) or ``category_id``.
+
+- Input is consumed ``BATCH_SIZE`` rows at a time: one lookup of the
+  existing rows, then one ``bulk_create`` and one ``bulk_update`` of the
+  rows that actually changed, each batch in its own transaction. Memory
+  stays flat whatever the file size and re-importing an unchanged file
+  writes nothing.
+- Bulk writes skip model signals, so ``search_text`` is computed here and
+  the catalog version is bumped once at the end instead of once per row.
+  A new or changed ``image_url`` drops the old image variants and marks
+  the row ``variants_pending`` for ``notify_worker`` (``shop.images``).
+- Columns missing from the file and empty cells leave existing values
+  alone. New categories need ``name_uz`` and ``name_ru``; new products
+  also need ``price`` and a category.
+
+``export_rows`` streams the same columns back out with ``to_csv`` /
+``to_jsonl``.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+
+from . import catalog
+from .models import Category, Product
+from .search import index_text
+
+BATCH_SIZE = 1000
+# Error details kept in the result; the rest are only counted
+MAX_ERROR_SAMPLES = 50
+
+TRUE = {'1', 'true', 'yes', 'y', 'on'}
+FALSE = {'0', 'false', 'no', 'n', 'off'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(max_length):
+    def parse(value):
+        value = str(value).strip()
+        if len(value) > max_length:
+            raise RowError(f'longer than {max_length} characters')
+        return value
+    return parse
+
+
+def _uint(value):
+    number = int(value)
+    if number < 0:
+        raise RowError('must not be negative')
+    return number
+
+
+def _price(value):
+    try:
+        price = Decimal(str(value).replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        raise RowError('not a number')
+    if not price.is_finite() or price < 0 or price >= Decimal('1e10'):
+        raise RowError('out of range')
+    return price.quantize(Decimal('0.01'))
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise RowError('expected true/false')
+
+
+def _url(value):
+    value = _text(500)(value)
+    if not value.startswith(('http://', 'https://')):
+        raise RowError('expected an http(s) URL')
+    return value
+
+
+NAMES = {'name_uz': _text(255), 'name_ru': _text(255), 'name_en': _text(255)}
+CATEGORY_COLUMNS = {
+    'code': _text(64), 'id': _uint, **NAMES, 'image_url': _url, 'sort_order': _uint,
+}
+PRODUCT_COLUMNS = {
+    'sku': _text(64), 'id': _uint, 'category': _text(64), 'category_id': _uint, **NAMES,
+    'price': _price, 'image_url': _url, 'is_active': _bool, 'sort_order': _uint,
+}
+# Columns that are lookups rather than model fields to write
+LOOKUPS = {'id', 'category'}
+
+KINDS = {
+    'categories': (Category, 'code', CATEGORY_COLUMNS, ('name_uz', 'name_ru')),
+    'products': (Product, 'sku', PRODUCT_COLUMNS, ('name_uz', 'name_ru', 'price', 'category_id')),
+}
+
+
+def format_for(filename: str) -> str:
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+def read_rows(stream, fmt: str):
+    """Dicts from a text stream; unreadable JSON lines come back as errors."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {'__error__': f'invalid JSON: {e}'}
+        yield row if isinstance(row, dict) else {'__error__': 'expected a JSON object'}
+
+
+def _clean(columns, raw) -> dict:
+    """Typed values of the known, non-empty columns of ``raw``."""
+    if '__error__' in raw:
+        raise RowError(raw['__error__'])
+    values = {}
+    for column, parse in columns.items():
+        value = raw.get(column)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        try:
+            values[column] = parse(value)
+        except (TypeError, ValueError) as e:
+            raise RowError(f'{column}: {e}')
+    return values
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _error(result, line, message):
+    result['errors'] += 1
+    if len(result['error_samples']) < MAX_ERROR_SAMPLES:
+        result['error_samples'].append(f'row {line}: {message}')
+
+
+def _import_batch(kind, batch, result, categories, version) -> dict:
+    """Write one batch; returns its created/updated/unchanged counts."""
+    model, natural, columns, required = KINDS[kind]
+    parsed = {}
+    for line, raw in batch:
+        try:
+            values = _clean(columns, raw)
+            if natural in values:
+                key = (natural, values[natural])
+            elif 'id' in values:
+                key = ('id', values['id'])
+            else:
+                raise RowError(f'{natural} or id required')
+            if categories is not None and ('category' in values or 'category_id' in values):
+                code = values.pop('category', None)
+                category_id = categories['codes'].get(code) if code else values.get('category_id')
+                if category_id is None or category_id not in categories['ids']:
+                    raise RowError(f"unknown category {code or values.get('category_id')}")
+                values['category_id'] = category_id
+        except RowError as e:
+            _error(result, line, e)
+            continue
+        # A key repeated in one batch: the last row wins
+        parsed[key] = (line, values)
+
+    existing = {}
+    by_natural = [k[1] for k in parsed if k[0] == natural]
+    by_id = [values['id'] for _, values in parsed.values() if 'id' in values]
+    if by_natural:
+        existing.update(((natural, getattr(o, natural)), o) for o in model.objects.filter(**{f'{natural}__in': by_natural}))
+    if by_id:
+        existing.update((('id', o.pk), o) for o in model.objects.filter(pk__in=by_id))
+
+    to_create, to_update, changed_fields = [], [], set()
+    unchanged = 0
+    for key, (line, values) in parsed.items():
+        fields = {f: v for f, v in values.items() if f not in LOOKUPS}
+        obj = existing.get(key)
+        if obj is None and 'id' in values:
+            # A new key on an exported row: update that row and give it the key
+            obj = existing.get(('id', values['id']))
+        if obj is None:
+            if key[0] == 'id':
+                _error(result, line, f'no {model._meta.verbose_name} with id {key[1]}')
+                continue
+            missing = [f for f in required if f not in fields]
+            if missing:
+                _error(result, line, f"new row needs {', '.join(missing)}")
+                continue
+            obj = model(**fields)
+            if obj.image_url:
+                obj.variants_pending = True
+            if model is Product:
+                obj.search_text = index_text(obj)
+                obj.catalog_version = version
+            to_create.append(obj)
+            continue
+        changed = [f for f, v in fields.items() if getattr(obj, f) != v]
+        if not changed:
+            unchanged += 1
+            continue
+        for f in changed:
+            setattr(obj, f, fields[f])
+        if 'image_url' in changed:
+            obj.image_variants, obj.variants_pending = {}, True
+            changed += ['image_variants', 'variants_pending']
+        if model is Product:
+            obj.search_text = index_text(obj)
+            obj.catalog_version = version
+            changed += ['search_text', 'catalog_version']
+        changed_fields.update(changed)
+        to_update.append(obj)
+
+    if to_create:
+        model.objects.bulk_create(to_create)
+    if to_update:
+        model.objects.bulk_update(to_update, sorted(changed_fields))
+    return {'created': len(to_create), 'updated': len(to_update), 'unchanged': unchanged}
+
+
+def import_rows(kind: str, rows, batch_size: int = BATCH_SIZE, dry_run: bool = False, progress=None) -> dict:
+    """Import ``rows`` (dicts) as ``kind`` ('products' or 'categories').
+
+    Returns counts (rows, created, updated, unchanged, errors) and the
+    first ``MAX_ERROR_SAMPLES`` error messages. ``progress`` is called with
+    the running result after every batch.
+    """
+    result = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0, 'error_samples': []}
+    categories = None
+    if kind == 'products':
+        codes = dict(Category.objects.exclude(code=None).values_list('code', 'id'))
+        categories = {'codes': codes, 'ids': set(Category.objects.values_list('id', flat=True))}
+    # Rows are stamped with the version the final bump should produce; see _publish
+    pending = catalog.read_version()[0] + 1
+
+    for batch in _batches(enumerate(rows, 1), batch_size):
+        result['rows'] += len(batch)
+        errors = result['errors']
+        try:
+            with transaction.atomic():
+                counts = _import_batch(kind, batch, result, categories, pending)
+                if dry_run:
+                    transaction.set_rollback(True)
+        except IntegrityError as e:
+            # e.g. a row giving a product the sku another one already has
+            result['errors'] = errors
+            _error(result, f'{batch[0][0]}-{batch[-1][0]}', f'batch rejected: {e}')
+            result['errors'] = errors + len(batch)
+        else:
+            for name, n in counts.items():
+                result[name] += n
+        if progress is not None:
+            progress(result)
+
+    if not dry_run and (result['created'] or result['updated']):
+        _publish(pending)
+    return result
+
+
+def _publish(pending):
+    """One catalog version bump for the whole import."""
+    with transaction.atomic():
+        version = catalog.bump_version()
+        if version != pending:
+            # Someone else bumped meanwhile: move our rows past every version clients may have seen
+            Product.objects.filter(catalog_version=pending).update(catalog_version=version)
+
+
+CATEGORY_EXPORT = ('code', 'id', 'name_uz', 'name_ru', 'name_en', 'image_url', 'sort_order')
+PRODUCT_EXPORT = (
+    'sku', 'id', 'category', 'category_id', 'name_uz', 'name_ru', 'name_en', 'price', 'image_url', 'is_active', 'sort_order',
+)
+EXPORT_COLUMNS = {'categories': CATEGORY_EXPORT, 'products': PRODUCT_EXPORT}
+
+
+def export_rows(kind: str, queryset=None):
+    """Yield ``EXPORT_COLUMNS[kind]`` dicts in id order, ``BATCH_SIZE`` rows per query."""
+    model = KINDS[kind][0]
+    qs = model.objects.all() if queryset is None else queryset
+    columns = EXPORT_COLUMNS[kind]
+    select = ['category__code' if c == 'category' else c for c in columns]
+    for row in qs.order_by('id').values_list(*select).iterator(chunk_size=BATCH_SIZE):
+        yield dict(zip(columns, row))
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def to_csv(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[c]) for c in columns])
+
+
+def to_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
@@ -0,0 +1,175 @@
+"""Resized WebP variants for product and category images.
+
+For each image source (the external ``image_url`` when set, otherwise the
+uploaded ``image``) a few fixed widths are rendered to WebP under
+``MEDIA_ROOT/variants/`` with content-hashed names, and recorded on the
+row's ``image_variants``::
+
+    {"source": "<image_url or file name>", "widths": {"160": "variants/ab12…-160.webp", ...}}
+
+Images are never upscaled: widths at or above the source's are replaced
+by one variant at the source's own width, so ``srcset`` only lists sizes
+that exist. ``srcset`` is empty while the recorded ``source`` is not the
+row's current image, so a new image never ships with the old one's sizes.
+
+External sources are downloaded once into ``MEDIA_ROOT/remote/``. Saving
+a row with a new image sets ``variants_pending`` in the same transaction;
+``notify_worker`` picks pending rows up with ``run_once`` (and
+``manage.py build_image_variants`` backfills), so a restart never loses
+work. Generation is idempotent: an unchanged source is skipped and
+existing variant files are reused.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from . import catalog
+from .models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+
+def widths():
+    return tuple(getattr(settings, 'IMAGE_VARIANT_WIDTHS', (160, 320, 640)))
+
+
+def source_of(obj) -> str:
+    """The image the API shows for ``obj`` (mirrors product_to_dict)."""
+    return obj.image_url or (obj.image.name if obj.image else '')
+
+
+def is_current(obj) -> bool:
+    source = source_of(obj)
+    variants = obj.image_variants or {}
+    return variants.get('source', '') == source and (not source or bool(variants.get('widths')))
+
+
+def srcset(obj_or_row, url_for) -> str:
+    """Return a ``srcset`` string; ``url_for`` turns a media name into a URL.
+
+    Takes a model instance or a ``.values()`` row with ``image_url``,
+    ``image`` and ``image_variants``.
+    """
+    if isinstance(obj_or_row, dict):
+        variants = obj_or_row['image_variants'] or {}
+        source = obj_or_row['image_url'] or obj_or_row['image'] or ''
+    else:
+        variants = obj_or_row.image_variants or {}
+        source = source_of(obj_or_row)
+    if variants.get('source', '') != source:
+        return ''
+    items = sorted((int(w), name) for w, name in (variants.get('widths') or {}).items())
+    return ', '.join(f"{url_for(default_storage.url(name))} {w}w" for w, name in items)
+
+
+def _read_source(obj) -> bytes:
+    if obj.image_url:
+        return _fetch_remote(obj.image_url)
+    with obj.image.open('rb') as fh:
+        return fh.read()
+
+
+def _fetch_remote(url: str) -> bytes:
+    """Download ``url`` once and keep it under MEDIA_ROOT/remote/."""
+    name = 'remote/' + hashlib.sha1(url.encode('utf-8')).hexdigest()
+    if default_storage.exists(name):
+        with default_storage.open(name, 'rb') as fh:
+            return fh.read()
+    limit = int(getattr(settings, 'IMAGE_MAX_SOURCE_BYTES', 15 * 1024 * 1024))
+    buf = BytesIO()
+    with requests.get(url, stream=True, timeout=15) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(64 * 1024):
+            buf.write(chunk)
+            if buf.tell() > limit:
+                raise ValueError(f'{url} is larger than {limit} bytes')
+    data = buf.getvalue()
+    default_storage.save(name, ContentFile(data))
+    return data
+
+
+def _target_widths(source_width: int) -> list:
+    configured = widths()
+    out = [w for w in configured if w < source_width]
+    if source_width <= max(configured, default=0):
+        out.append(source_width)
+    return out
+
+
+def render_variants(data: bytes) -> dict:
+    """Write WebP variants of ``data``; returns ``{width: name}``."""
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    img = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    out = {}
+    converted = None
+    for w in _target_widths(img.width):
+        name = f'variants/{digest}-{w}.webp'
+        if not default_storage.exists(name):
+            if converted is None:
+                converted = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            copy = converted.copy()
+            copy.thumbnail((w, w * 4), Image.LANCZOS)
+            buf = BytesIO()
+            copy.save(buf, 'WEBP', quality=80, method=4)
+            default_storage.save(name, ContentFile(buf.getvalue()))
+        out[str(w)] = name
+    return out
+
+
+def build(obj, force=False) -> bool:
+    """Generate variants for ``obj`` if its source changed; returns True if it did."""
+    model = type(obj)
+    if is_current(obj) and not force:
+        if obj.variants_pending:
+            model.objects.filter(pk=obj.pk).update(variants_pending=False)
+        return False
+    source = source_of(obj)
+    variants = {'source': source, 'widths': render_variants(_read_source(obj)) if source else {}}
+    with transaction.atomic():
+        # Re-check under the row lock in case the source changed meanwhile
+        current = model.objects.select_for_update().filter(pk=obj.pk).first()
+        if current is None or source_of(current) != source:
+            return False
+        model.objects.filter(pk=obj.pk).update(image_variants=variants, variants_pending=False)
+        obj.image_variants = variants
+        if model is Product:
+            catalog.stamp_product(obj)
+        else:
+            catalog.bump_version()
+    return True
+
+
+def schedule(obj):
+    """Mark ``obj`` for variant generation (in the caller's transaction)."""
+    if is_current(obj):
+        return
+    if obj.variants_pending and not obj.image_variants:
+        return
+    # The old image's variants are dropped with the old image
+    type(obj).objects.filter(pk=obj.pk).update(variants_pending=True, image_variants={})
+    obj.variants_pending = True
+    obj.image_variants = {}
+
+
+def run_once(batch_size: int = 10) -> dict:
+    """Build variants for up to ``batch_size`` pending rows; returns counts."""
+    counts = {}
+    for model in (Category, Product):
+        for obj in model.objects.filter(variants_pending=True).order_by('id')[:batch_size]:
+            try:
+                key = 'images_built' if build(obj) else 'images_skipped'
+            except Exception:
+                # Not retried automatically: a broken URL would spin forever.
+                # build_image_variants retries rows left without variants.
+                logger.exception('Image variants failed for %s #%s', model.__name__, obj.pk)
+                model.objects.filter(pk=obj.pk).update(variants_pending=False, image_variants={})
+                key = 'images_failed'
+            counts[key] = counts.get(key, 0) + 1
+    return counts
@@ -0,0 +1,442 @@
+"""Benchmark every ``/api/`` endpoint against a seeded throwaway database.
+
+The command creates a test database (``test_<NAME>`` on PostgreSQL, a
+temporary file on SQLite), fills it with a synthetic shop, drives each
+endpoint through the Django test client (``--mode client``, no network)
+or a threaded local HTTP server (``--mode server``, real sockets and
+``--concurrency`` clients) and reports per endpoint:
+
+- p50/p95/p99/max latency and throughput (requests per second);
+- SQL queries per request (mean and max) and mean response size;
+- non-2xx/304 responses as errors.
+
+``--json`` writes the results for diffing between commits and
+``--baseline`` prints the change against an earlier ``--json`` file. The
+database is destroyed afterwards; the real one is never touched.
+"""
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from shop import analytics, catalog
+from shop.models import Category, Order, OrderItem, Product, UserProfile
+from shop.search import index_text
+
+from .bench_search import SYLLABLES_CYRILLIC, SYLLABLES_LATIN, _word
+
+API_TOKEN = 'bench-token'
+QUERIES_HEADER = 'X-Bench-Queries'
+
+
+def _pct(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+class QueryCounter:
+    """``execute_wrapper`` hook counting the statements of one request."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Dataset:
+    """Ids the request generators pick from."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.category_ids = []
+        self.product_ids = []
+        self.product_words = []
+        self.telegram_ids = []
+        self.orders = []  # (order_id, telegram_id)
+        self.etag = ''
+        self.session_cookie = ''
+
+
+def seed(data, categories, products, users, orders, max_items, days):
+    rng = data.rng
+    Category.objects.bulk_create([
+        Category(name_uz=_word(rng, SYLLABLES_LATIN).title(), name_ru=_word(rng, SYLLABLES_CYRILLIC).title(), sort_order=i)
+        for i in range(categories)
+    ], batch_size=1000)
+    data.category_ids = list(Category.objects.values_list('id', flat=True))
+
+    version = catalog.current_version()
+    rows = []
+    for i in range(products):
+        p = Product(
+            category_id=rng.choice(data.category_ids),
+            name_uz=' '.join(_word(rng, SYLLABLES_LATIN) for _ in range(rng.randint(1, 3))),
+            name_ru=' '.join(_word(rng, SYLLABLES_CYRILLIC) for _ in range(rng.randint(1, 3))),
+            price=Decimal(rng.randrange(5, 500) * 1000),
+            is_active=rng.random() > 0.05,
+            sort_order=i,
+            catalog_version=version,
+        )
+        # bulk_create skips the pre_save signal that fills search_text
+        p.search_text = index_text(p)
+        rows.append(p)
+    Product.objects.bulk_create(rows, batch_size=1000)
+    active = list(Product.objects.filter(is_active=True).values_list('id', 'name_uz', 'name_ru', 'price'))
+    if not active:
+        raise CommandError('Seed at least one active product')
+    data.product_ids = [p[0] for p in active]
+    data.product_words = [w for p in active[:500] for w in (p[1].split()[0], p[2].split()[0])]
+    prices = {p[0]: p[3] for p in active}
+    names = {p[0]: p[1:3] for p in active}
+
+    UserProfile.objects.bulk_create([
+        UserProfile(telegram_id=str(10_000_000 + i), language=rng.choice(['UZ', 'RU', 'EN']), full_name=f'User {i}')
+        for i in range(users)
+    ], batch_size=1000)
+    profiles = list(UserProfile.objects.values_list('id', 'telegram_id'))
+    data.telegram_ids = [t for _, t in profiles]
+    if not profiles:
+        raise CommandError('Seed at least one user')
+
+    now = timezone.now()
+    statuses = ['new'] * 3 + ['processing'] * 2 + ['done'] * 4 + ['cancelled']
+    chunk = 2000
+    for start in range(0, orders, chunk):
+        batch, lines = [], []
+        for _ in range(min(chunk, orders - start)):
+            user_id, telegram_id = rng.choice(profiles)
+            picked = rng.sample(data.product_ids, min(len(data.product_ids), rng.randint(1, max_items)))
+            qty = {pid: rng.randint(1, 3) for pid in picked}
+            batch.append(Order(
+                user_id=user_id, status=rng.choice(statuses),
+                total=sum(prices[pid] * q for pid, q in qty.items()),
+            ))
+            lines.append((telegram_id, qty))
+        Order.objects.bulk_create(batch)
+        # created_at is auto_now_add: spread the orders over the period afterwards
+        for o in batch:
+            o.created_at = now - timedelta(seconds=rng.randrange(days * 86400))
+        Order.objects.bulk_update(batch, ['created_at'], batch_size=1000)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order_id=o.id, product_id=pid, quantity=q, price=prices[pid],
+                product_name_uz=names[pid][0], product_name_ru=names[pid][1],
+            )
+            for o, (_, qty) in zip(batch, lines) for pid, q in qty.items()
+        ], batch_size=2000)
+        data.orders.extend((o.id, telegram_id) for o, (telegram_id, _) in zip(batch, lines))
+    if data.orders:
+        analytics.rebuild(timezone.localdate(now) - timedelta(days=days), timezone.localdate(now))
+
+
+def endpoints(data):
+    """``name -> make(rng) -> (method, path, body, headers)``."""
+    token = {'Authorization': f'Bearer {API_TOKEN}'}
+
+    def order_payload(rng):
+        picked = rng.sample(data.product_ids, min(len(data.product_ids), rng.randint(1, 4)))
+        return {
+            'telegram_id': rng.choice(data.telegram_ids),
+            'items': [{'product_id': pid, 'quantity': rng.randint(1, 3)} for pid in picked],
+            'comment': 'bench',
+        }
+
+    def my_order(rng):
+        return rng.choice(data.orders) if data.orders else (0, rng.choice(data.telegram_ids))
+
+    today = timezone.localdate()
+    return {
+        'categories': lambda rng: ('GET', '/api/categories', None, {}),
+        'products': lambda rng: ('GET', '/api/products', None, {}),
+        'products_304': lambda rng: ('GET', '/api/products', None, {'If-None-Match': data.etag}),
+        'products_page': lambda rng: (
+            'GET', f'/api/products?limit=50&lang=uz&category_id={rng.choice(data.category_ids)}', None, {},
+        ),
+        'search': lambda rng: ('GET', f'/api/search?q={rng.choice(data.product_words)[:rng.randint(3, 6)]}', None, {}),
+        'create_order': lambda rng: ('POST', '/api/order', order_payload(rng), {}),
+        'my_orders': lambda rng: ('GET', f'/api/my-orders?telegram_id={my_order(rng)[1]}', None, {}),
+        'my_orders_summary': lambda rng: ('GET', f'/api/my-orders?telegram_id={my_order(rng)[1]}&view=summary', None, {}),
+        'order_detail': lambda rng: ('GET', '/api/orders/{}?telegram_id={}'.format(*my_order(rng)), None, {}),
+        'bulk_order_status': lambda rng: ('POST', '/api/orders/status', {
+            'order_ids': [o for o, _ in rng.sample(data.orders, min(len(data.orders), 50))],
+            'status': rng.choice(['processing', 'done']),
+        }, token),
+        'sales_report': lambda rng: (
+            'GET', f'/api/analytics/sales?start={today - timedelta(days=29)}&end={today}', None, token,
+        ),
+        'user_get': lambda rng: ('GET', f'/api/user?telegram_id={rng.choice(data.telegram_ids)}', None, {}),
+        'user_post': lambda rng: ('POST', '/api/user', {
+            'telegram_id': rng.choice(data.telegram_ids), 'language': rng.choice(['UZ', 'RU', 'EN']),
+        }, {}),
+        'catalog_stats': lambda rng: ('GET', '/api/catalog-stats', None, {'Cookie': data.session_cookie}),
+        'export_orders': lambda rng: (
+            'GET', f'/api/orders/export?start={today - timedelta(days=6)}&end={today}', None, token,
+        ),
+    }
+
+
+class ClientDriver:
+    """In-process requests through ``django.test.Client``."""
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, body, headers):
+        counter = QueryCounter()
+        extra = {'HTTP_' + k.upper().replace('-', '_'): v for k, v in headers.items()}
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            if method == 'GET':
+                resp = self.client.get(path, **extra)
+            else:
+                resp = self.client.post(path, json.dumps(body), content_type='application/json', **extra)
+            # Streamed responses (the order export) run their queries while being read
+            size = len(b''.join(resp.streaming_content) if resp.streaming else resp.content)
+        return time.perf_counter() - started, resp.status_code, counter.count, size
+
+
+class QuietHandler(WSGIRequestHandler):
+    # Small keep-alive responses otherwise wait out the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+def counting_app(app):
+    """Wrap the WSGI app to report each request's query count in a header."""
+    def wrapped(environ, start_response):
+        counter = QueryCounter()
+
+        def start(status, headers, exc_info=None):
+            headers.append((QUERIES_HEADER, str(counter.count)))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(counter):
+            captured = []
+            result = app(environ, lambda status, headers, exc_info=None: captured.append((status, headers, exc_info)))
+            try:
+                body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        start(*captured[0])
+        return [body]
+
+    return wrapped
+
+
+class ServerDriver:
+    """Real HTTP requests to a threaded server on a free local port."""
+
+    def __init__(self):
+        import requests
+
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, ipv6=False)
+        self.server.set_app(counting_app(get_internal_wsgi_application()))
+        self.thread = threading.Thread(target=self.server.serve_forever, name='bench-server', daemon=True)
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_port
+        self.local = threading.local()
+        self.requests = requests
+
+    def request(self, method, path, body, headers):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        started = time.perf_counter()
+        resp = session.request(method, self.base + path, json=body, headers=headers, timeout=30)
+        elapsed = time.perf_counter() - started
+        return elapsed, resp.status_code, int(resp.headers.get(QUERIES_HEADER, 0)), len(resp.content)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(driver, make, rng, requests, warmup, concurrency):
+    for _ in range(warmup):
+        driver.request(*make(rng))
+
+    results = []
+    lock = threading.Lock()
+    # Requests are generated up front so every run sends the same sequence
+    jobs = [make(rng) for _ in range(requests)]
+
+    def run(chunk):
+        out = [driver.request(*job) for job in chunk]
+        with lock:
+            results.extend(out)
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        run(jobs)
+    else:
+        threads = [threading.Thread(target=run, args=(jobs[i::concurrency],)) for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - started
+
+    latencies = sorted(r[0] * 1000 for r in results)
+    queries = [r[2] for r in results]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for r in results if not (200 <= r[1] < 300 or r[1] == 304)),
+        'status': sorted({r[1] for r in results}),
+        'rps': round(len(results) / wall, 1) if wall else 0.0,
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'p50_ms': round(_pct(latencies, 50), 3),
+        'p95_ms': round(_pct(latencies, 95), 3),
+        'p99_ms': round(_pct(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+        'bytes_mean': round(statistics.mean(r[3] for r in results)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except Exception:
+        return ''
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the shop API endpoints on a seeded throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--items-per-order', type=int, default=4, help='Maximum lines per seeded order')
+        parser.add_argument('--days', type=int, default=90, help='Seeded orders are spread over this many days')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint')
+        parser.add_argument('--mode', choices=['client', 'server'], default='client')
+        parser.add_argument('--concurrency', type=int, default=1, help='Parallel clients (server mode)')
+        parser.add_argument('--endpoint', action='append', dest='only', help='Run only this endpoint (repeatable)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', help='Write results to this file ("-" for stdout)')
+        parser.add_argument('--baseline', help='Compare with a previous --json file')
+
+    def handle(self, *args, **opts):
+        if opts['concurrency'] > 1 and opts['mode'] != 'server':
+            raise CommandError('--concurrency needs --mode server')
+        data = Dataset(random.Random(opts['seed']))
+        cases = endpoints(data)
+        unknown = set(opts['only'] or []) - set(cases)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(cases)}")
+        baseline = None
+        if opts['baseline']:
+            with open(opts['baseline']) as f:
+                baseline = json.load(f)
+
+        tmpdir = None
+        if connection.vendor == 'sqlite':
+            # A file rather than :memory: so server threads share it like real workers would
+            tmpdir = tempfile.mkdtemp(prefix='shop-bench-')
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                DEBUG=False, ALLOWED_HOSTS=['*'], ORDERS_API_TOKEN=API_TOKEN, CATALOG_CACHE='',
+            ):
+                report = self._run(data, cases, opts)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmpdir:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+        if opts['json'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print(report, baseline)
+            if opts['json']:
+                with open(opts['json'], 'w') as f:
+                    json.dump(report, f, indent=2)
+                self.stdout.write(f"Wrote {opts['json']}")
+
+    def _run(self, data, cases, opts):
+        started = time.perf_counter()
+        seed(data, opts['categories'], opts['products'], opts['users'], opts['orders'],
+             opts['items_per_order'], opts['days'])
+        seed_seconds = time.perf_counter() - started
+        if opts['json'] != '-':
+            self.stdout.write(f'Seeded in {seed_seconds:.1f}s on {connection.vendor}')
+
+        staff = get_user_model().objects.create_user('bench', password=None, is_staff=True)
+        login = Client()
+        login.force_login(staff)
+        data.session_cookie = f'{settings.SESSION_COOKIE_NAME}={login.cookies[settings.SESSION_COOKIE_NAME].value}'
+        data.etag = Client().get('/api/products')['ETag']
+
+        driver = ServerDriver() if opts['mode'] == 'server' else ClientDriver()
+        results = {}
+        try:
+            for name, make in cases.items():
+                if opts['only'] and name not in opts['only']:
+                    continue
+                # Same request sequence per endpoint whatever else runs
+                rng = random.Random(f"{opts['seed']}:{name}")
+                results[name] = measure(driver, make, rng, opts['requests'], opts['warmup'], opts['concurrency'])
+        finally:
+            if isinstance(driver, ServerDriver):
+                driver.close()
+
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'at': timezone.now().isoformat(timespec='seconds'),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'mode': opts['mode'],
+                'concurrency': opts['concurrency'],
+                'requests': opts['requests'],
+                'seed': opts['seed'],
+                'dataset': {k: opts[k] for k in ('categories', 'products', 'users', 'orders', 'items_per_order', 'days')},
+                'seed_seconds': round(seed_seconds, 1),
+            },
+            'endpoints': results,
+        }
+
+    def _print(self, report, baseline):
+        before = (baseline or {}).get('endpoints', {})
+        header = f"{'endpoint':<20}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'queries':>9}{'bytes':>10}{'errors':>8}"
+        self.stdout.write(header)
+        for name, r in report['endpoints'].items():
+            line = (
+                f"{name:<20}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['rps']:>9.1f}"
+                f"{r['queries_mean']:>9.1f}{r['bytes_mean']:>10}{r['errors']:>8}"
+            )
+            old = before.get(name)
+            if old:
+                change = (r['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+                line += f"   p95 {change:+.0f}%  queries {r['queries_mean'] - old['queries_mean']:+.1f}"
+            self.stdout.write(line)
+        self.stdout.write('Latency in ms; queries and bytes are per request.')
@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.search import SearchIndex, tokens
+
+SYLLABLES_LATIN = ['ba', 'qo', 'sh', 'ch', 'non', 'plov', 'go', 'sht', 'ma', 'sa', 'mo', 'ri', 'ka', 'lo', 'da', 'zi', "o'", "g'i", 'xo', 'tu']
+SYLLABLES_CYRILLIC = ['ба', 'ко', 'ша', 'чи', 'нон', 'плов', 'го', 'шт', 'ма', 'са', 'мо', 'ри', 'ка', 'ло', 'да', 'зи', 'ў', 'ғи', 'ҳо', 'ту']
+
+
+def _word(rng, syllables):
+    return ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the in-memory product search index on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--budget-ms', type=float, default=5.0, help='Fail if p99 query latency exceeds this')
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts['seed'])
+        rows = []
+        for i in range(opts['products']):
+            uz = ' '.join(_word(rng, SYLLABLES_LATIN) for _ in range(rng.randint(1, 3)))
+            ru = ' '.join(_word(rng, SYLLABLES_CYRILLIC) for _ in range(rng.randint(1, 3)))
+            rows.append({
+                'id': i + 1, 'name_uz': uz, 'name_ru': ru, 'name_en': '', 'price': 1000,
+                'image_url': '', 'image': '', 'category_id': 1, 'sort_order': i,
+            })
+
+        started = time.perf_counter()
+        index = SearchIndex(rows)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # Queries: full words, 2-4 letter prefixes (autocomplete) and two-word mixes
+        queries = []
+        for _ in range(opts['queries']):
+            row = rng.choice(rows)
+            words = tokens(row['name_uz']) + tokens(row['name_ru'])
+            word = rng.choice(words)
+            kind = rng.random()
+            if kind < 0.4:
+                queries.append(word[:rng.randint(2, 4)])
+            elif kind < 0.8:
+                queries.append(rng.choice([row['name_uz'], row['name_ru']]).split()[0])
+            else:
+                queries.append(' '.join(rng.sample(words, min(2, len(words)))))
+
+        timings = []
+        hits = 0
+        for q in queries:
+            t0 = time.perf_counter()
+            found = index.search(q)
+            timings.append((time.perf_counter() - t0) * 1000)
+            hits += bool(found)
+
+        timings.sort()
+
+        def pct(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+        self.stdout.write(
+            f"products={len(rows)} tokens={len(index.tokens)} build={build_ms:.0f}ms\n"
+            f"queries={len(queries)} with_results={hits} "
+            f"mean={statistics.mean(timings):.3f}ms p50={pct(50):.3f}ms p95={pct(95):.3f}ms "
+            f"p99={pct(99):.3f}ms max={timings[-1]:.3f}ms"
+        )
+        if pct(99) > opts['budget_ms']:
+            raise CommandError(f"p99 {pct(99):.3f}ms exceeds budget {opts['budget_ms']}ms")
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import broadcasts
+from shop.models import Broadcast
+from shop.notifications import Dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Create, start, pause or inspect broadcasts to all bot users'
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest='action', required=True)
+        create = sub.add_parser('create', help='Create a draft broadcast')
+        create.add_argument('text')
+        create.add_argument('--ru', default='', help='Text for Russian speakers')
+        create.add_argument('--en', default='', help='Text for English speakers')
+        create.add_argument('--start', action='store_true', help='Queue it for notify_worker right away')
+        for name, text in (('start', 'Queue (or resume) a broadcast for notify_worker'),
+                           ('pause', 'Pause a queued broadcast'),
+                           ('run', 'Queue a broadcast and send it from this process until done')):
+            p = sub.add_parser(name, help=text)
+            p.add_argument('id', type=int)
+            if name == 'run':
+                p.add_argument('--threads', type=int, default=8)
+        status = sub.add_parser('status', help='Show progress')
+        status.add_argument('id', type=int, nargs='?')
+
+    def _line(self, b):
+        return (f'#{b.id} {b.status}: recipients={b.recipients}{"" if b.recipients_complete else "+"} '
+                f'sent={b.sent} failed={b.failed} blocked={b.blocked}')
+
+    def handle(self, *args, **opts):
+        action = opts['action']
+        if action == 'create':
+            b = Broadcast.objects.create(text=opts['text'], text_ru=opts['ru'], text_en=opts['en'])
+            if opts['start']:
+                broadcasts.start(b.pk)
+            self.stdout.write(f'Created broadcast #{b.pk}')
+        elif action == 'start':
+            if not broadcasts.start(opts['id']):
+                raise CommandError('Only draft or paused broadcasts can be started')
+            self.stdout.write(f'Broadcast #{opts["id"]} queued')
+        elif action == 'pause':
+            if not broadcasts.pause(opts['id']):
+                raise CommandError('Only queued broadcasts can be paused')
+            self.stdout.write(f'Broadcast #{opts["id"]} paused')
+        elif action == 'status':
+            qs = Broadcast.objects.order_by('-id')
+            if opts['id']:
+                qs = qs.filter(pk=opts['id'])
+            for b in qs[:20]:
+                self.stdout.write(self._line(b))
+        elif action == 'run':
+            b = Broadcast.objects.filter(pk=opts['id']).first()
+            if b is None:
+                raise CommandError('No such broadcast')
+            broadcasts.start(b.pk)
+            dispatcher = Dispatcher(threads=opts['threads'])
+            batch = max(1, int(dispatcher.global_bucket.rate))
+            last_report = 0
+            while True:
+                b.refresh_from_db()
+                if b.status != Broadcast.QUEUED:
+                    break
+                counts = broadcasts.run_once(dispatcher, batch_size=batch, broadcast_id=b.pk)
+                if not counts:
+                    time.sleep(1)
+                if time.monotonic() - last_report > 10:
+                    last_report = time.monotonic()
+                    self.stdout.write(self._line(b))
+            self.stdout.write(self._line(b))
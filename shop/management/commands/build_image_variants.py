@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from shop import images
+from shop.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP variants for existing product and category images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild even when variants are up to date')
+        parser.add_argument('--only', choices=['products', 'categories'], help='Limit to one model')
+
+    def handle(self, *args, **opts):
+        models = {'products': [Product], 'categories': [Category]}.get(opts['only'], [Category, Product])
+        for model in models:
+            built = skipped = failed = 0
+            qs = model.objects.exclude(image_url='', image='').exclude(image_url='', image__isnull=True).order_by('id')
+            for obj in qs.iterator(chunk_size=200):
+                try:
+                    if images.build(obj, force=opts['force']):
+                        built += 1
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} #{obj.pk}: {e}")
+            self.stdout.write(f"{model.__name__}: built={built} up_to_date={skipped} failed={failed}")
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from shop import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Stream categories or products out as CSV / JSON Lines (the import_catalog format)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(catalog_io.KINDS), default='products')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from --output (stdout: csv)')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+
+    def handle(self, *args, **opts):
+        fmt = opts['format'] or (catalog_io.format_for(opts['output']) if opts['output'] else 'csv')
+        rows = catalog_io.export_rows(opts['kind'])
+        if fmt == 'csv':
+            chunks = catalog_io.to_csv(rows, catalog_io.EXPORT_COLUMNS[opts['kind']])
+        else:
+            chunks = catalog_io.to_jsonl(rows)
+        out = open(opts['output'], 'w', encoding='utf-8', newline='') if opts['output'] else sys.stdout
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if opts['output']:
+                out.close()
@@ -0,0 +1,38 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import order_export
+from shop.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Stream orders with their items out as CSV / JSON Lines (for accounting)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day (YYYY-MM-DD, local time)')
+        parser.add_argument('--until', help='Last day (YYYY-MM-DD, inclusive)')
+        parser.add_argument(
+            '--status', action='append', choices=[s for s, _ in Order.STATUS_CHOICES],
+            help='Only this status (repeatable)',
+        )
+        parser.add_argument('--format', choices=order_export.FORMATS, help='Default: from --output (stdout: csv)')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=order_export.CHUNK_SIZE)
+
+    def handle(self, *args, **opts):
+        try:
+            since = date.fromisoformat(opts['since']) if opts['since'] else None
+            until = date.fromisoformat(opts['until']) if opts['until'] else None
+        except ValueError as e:
+            raise CommandError(f'Bad date: {e}')
+        fmt = opts['format'] or ('jsonl' if (opts['output'] or '').endswith('.jsonl') else 'csv')
+        orders = order_export.filter_orders(statuses=opts['status'] or (), start=since, end=until)
+        out = open(opts['output'], 'w', encoding='utf-8', newline='') if opts['output'] else sys.stdout
+        try:
+            for chunk in order_export.stream(orders, fmt, opts['chunk_size']):
+                out.write(chunk)
+        finally:
+            if opts['output']:
+                out.close()
@@ -0,0 +1,54 @@
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import catalog_io
+
+
+class Command(BaseCommand):
+    help = 'Import categories or products from CSV / JSON Lines, matched on code / sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file ("-" reads stdin)')
+        parser.add_argument('--kind', choices=sorted(catalog_io.KINDS), default='products')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from the file extension (stdin: jsonl)')
+        parser.add_argument('--batch-size', type=int, default=catalog_io.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count, write nothing')
+
+    def handle(self, *args, **opts):
+        path = opts['path']
+        fmt = opts['format'] or ('jsonl' if path == '-' else catalog_io.format_for(path))
+        try:
+            # utf-8-sig: spreadsheet exports often start with a BOM
+            stream = (
+                io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='') if path == '-'
+                else open(path, encoding='utf-8-sig', newline='')
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        reported = [0]
+
+        def progress(result):
+            if result['rows'] - reported[0] >= 10 * opts['batch_size']:
+                reported[0] = result['rows']
+                self.stdout.write(
+                    f"{result['rows']} rows ({result['rows'] / (time.monotonic() - started):.0f}/s): "
+                    f"{result['created']} created, {result['updated']} updated, {result['errors']} errors"
+                )
+
+        with stream:
+            result = catalog_io.import_rows(
+                opts['kind'], catalog_io.read_rows(stream, fmt),
+                batch_size=opts['batch_size'], dry_run=opts['dry_run'], progress=progress,
+            )
+        for message in result['error_samples']:
+            self.stderr.write(message)
+        self.stdout.write(
+            f"{'Dry run: ' if opts['dry_run'] else ''}{result['rows']} rows in {time.monotonic() - started:.1f}s: "
+            f"{result['created']} created, {result['updated']} updated, {result['unchanged']} unchanged, "
+            f"{result['errors']} errors"
+        )
@@ -0,0 +1,50 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config import metrics
+from shop import broadcasts, images
+from shop.notifications import Dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued Telegram notifications from the outbox, then queued broadcasts and image variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--idle-sleep', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Send one batch and exit')
+        parser.add_argument(
+            '--metrics-port', type=int, default=getattr(settings, 'WORKER_METRICS_PORT', 0),
+            help='Serve Prometheus metrics on this port (0 = off)',
+        )
+
+    def handle(self, *args, **opts):
+        self.running = True
+
+        def stop(signum, frame):
+            self.running = False
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        if opts['metrics_port']:
+            metrics.serve(opts['metrics_port'], getattr(settings, 'WORKER_METRICS_ADDR', '127.0.0.1'))
+        dispatcher = Dispatcher(threads=opts['threads'])
+        self.stdout.write('Notify worker started')
+        while self.running:
+            counts = dispatcher.run_once(opts['batch_size'])
+            # Broadcasts get what the outbox leaves: about a second's worth of sends per round
+            sent = broadcasts.run_once(dispatcher, batch_size=max(1, int(dispatcher.global_bucket.rate)))
+            counts.update({f'broadcast_{k}': v for k, v in sent.items()})
+            counts.update(images.run_once())
+            if counts:
+                self.stdout.write(' '.join(f'{k}={v}' for k, v in sorted(counts.items())))
+            if opts['once']:
+                break
+            if not counts:
+                time.sleep(opts['idle_sleep'])
+        self.stdout.write('Notify worker stopped')
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop import analytics
+from shop.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups from orders (backfill or repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day (YYYY-MM-DD); default: first order')
+        parser.add_argument('--until', help='Last day (YYYY-MM-DD); default: today')
+        parser.add_argument('--window-days', type=int, default=31, help='Days recomputed per transaction')
+
+    def handle(self, *args, **opts):
+        try:
+            until = date.fromisoformat(opts['until']) if opts['until'] else timezone.localdate()
+            if opts['since']:
+                since = date.fromisoformat(opts['since'])
+            else:
+                first = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+                if first is None:
+                    self.stdout.write('No orders')
+                    return
+                since = timezone.localdate(first)
+        except ValueError as e:
+            raise CommandError(f'Bad date: {e}')
+
+        start = since
+        while start <= until:
+            end = min(until, start + timedelta(days=opts['window_days'] - 1))
+            counts = analytics.rebuild(start, end)
+            self.stdout.write(
+                f"{start}..{end}: {counts['status_rows']} status, {counts['product_rows']} product, "
+                f"{counts['category_rows']} category rows"
+            )
+            start = end + timedelta(days=1)
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from telebot import TeleBot
+
+from bot.webhook import WEBHOOK_PATH
+
+
+class Command(BaseCommand):
+    help = 'Register, remove or inspect the Telegram webhook for the bot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['set', 'delete', 'info'])
+        parser.add_argument('--url', help='Public webhook URL (default: BASE_URL + /%s)' % WEBHOOK_PATH)
+        parser.add_argument('--max-connections', type=int, default=40)
+        parser.add_argument('--drop-pending', action='store_true', help='Discard updates queued while no webhook was set')
+
+    def handle(self, *args, **opts):
+        if not settings.BOT_TOKEN:
+            raise CommandError('BOT_TOKEN is not set')
+        bot = TeleBot(settings.BOT_TOKEN)
+        action = opts['action']
+
+        if action == 'set':
+            secret = settings.BOT_WEBHOOK_SECRET
+            if not secret:
+                raise CommandError('Set BOT_WEBHOOK_SECRET first')
+            url = opts['url'] or settings.BASE_URL.rstrip('/') + '/' + WEBHOOK_PATH
+            if not url.startswith('https://'):
+                raise CommandError(f'Telegram requires an https webhook URL, got {url}')
+            bot.set_webhook(
+                url=url,
+                secret_token=secret,
+                max_connections=opts['max_connections'],
+                allowed_updates=['message', 'callback_query'],
+                drop_pending_updates=opts['drop_pending'],
+            )
+            self.stdout.write(f'Webhook set to {url}')
+        elif action == 'delete':
+            bot.remove_webhook()
+            self.stdout.write('Webhook removed; the bot can use polling again')
+
+        info = bot.get_webhook_info()
+        self.stdout.write(
+            f"url={info.url or '-'} pending_updates={info.pending_update_count} "
+            f"max_connections={info.max_connections} last_error={info.last_error_message or '-'}"
+        )
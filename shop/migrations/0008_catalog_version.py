@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+def create_row(apps, schema_editor):
+    CatalogVersion = apps.get_model('shop', 'CatalogVersion')
+    CatalogVersion.objects.get_or_create(pk=1, defaults={'value': 1})
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('shop', '0007_image_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(create_row, reverse_code=noop),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+
+def backfill_search_text(apps, schema_editor):
+    from shop.search import index_text
+
+    Product = apps.get_model('shop', 'Product')
+    batch = []
+    for p in Product.objects.only('id', 'name_uz', 'name_ru', 'name_en').iterator(chunk_size=1000):
+        p.search_text = index_text(p)
+        batch.append(p)
+        if len(batch) >= 1000:
+            Product.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['search_text'])
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS shop_product_search_trgm "
+        "ON shop_product USING gin (search_text gin_trgm_ops);"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS shop_product_search_trgm;")
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('shop', '0010_product_cat_sort_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_text, reverse_code=noop),
+        migrations.RunPython(create_trigram_index, reverse_code=drop_trigram_index),
+    ]
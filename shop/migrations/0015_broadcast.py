@@ -0,0 +1,49 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('shop', '0014_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(help_text='Sent to Uzbek speakers and anyone without a translation')),
+                ('text_ru', models.TextField(blank=True, default='')),
+                ('text_en', models.TextField(blank=True, default='')),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('queued', 'Queued'), ('paused', 'Paused'), ('done', 'Done')], default='draft', max_length=16)),
+                ('cursor', models.BigIntegerField(default=0, editable=False)),
+                ('recipients_complete', models.BooleanField(default=False, editable=False)),
+                ('recipients', models.PositiveIntegerField(default=0, editable=False)),
+                ('sent', models.PositiveIntegerField(default=0, editable=False)),
+                ('failed', models.PositiveIntegerField(default=0, editable=False)),
+                ('blocked', models.PositiveIntegerField(default=0, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BroadcastDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=64)),
+                ('language', models.CharField(blank=True, default='', max_length=4)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed'), ('blocked', 'Blocked the bot')], default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('broadcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='shop.broadcast')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='broadcast_deliveries', to='shop.userprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('broadcast', 'user'), name='shop_broadcast_user_uniq')],
+                'indexes': [models.Index(fields=['broadcast', 'status', 'id'], name='shop_broadcast_due_idx')],
+            },
+        ),
+    ]
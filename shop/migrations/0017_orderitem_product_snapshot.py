@@ -0,0 +1,63 @@
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 2000
+
+
+def backfill_snapshot(apps, schema_editor):
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    last_id = 0
+    while True:
+        batch = list(
+            OrderItem.objects.filter(id__gt=last_id).order_by('id')
+            .select_related('product')
+            .only('id', 'product__name_uz', 'product__name_ru', 'product__name_en', 'product__image_url', 'product__image')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for item in batch:
+            p = item.product
+            item.product_name_uz = p.name_uz or ''
+            item.product_name_ru = p.name_ru or ''
+            item.product_name_en = p.name_en or ''
+            item.product_image = p.image_url or (p.image.name if p.image else '')
+        # One transaction per batch: row locks are held for one batch only
+        with transaction.atomic():
+            OrderItem.objects.bulk_update(batch, ['product_name_uz', 'product_name_ru', 'product_name_en', 'product_image'])
+        last_id = batch[-1].id
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+    # The backfill commits batch by batch instead of in one long transaction
+    atomic = False
+
+    dependencies = [
+        ('shop', '0016_order_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name_uz',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name_ru',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name_en',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.RunPython(backfill_snapshot, reverse_code=noop),
+    ]
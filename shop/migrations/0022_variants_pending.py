@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('shop', '0021_catalog_tombstone_pruning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='variants_pending',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='variants_pending',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+    ]
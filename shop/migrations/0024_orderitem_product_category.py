@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 2000
+
+
+def backfill_category(apps, schema_editor):
+    # Best guess for existing lines: the product's category today
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    last_id = 0
+    while True:
+        batch = list(
+            OrderItem.objects.filter(id__gt=last_id).order_by('id')
+            .select_related('product').only('id', 'product__category_id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for item in batch:
+            item.product_category_id = item.product.category_id
+        with transaction.atomic():
+            OrderItem.objects.bulk_update(batch, ['product_category'])
+        last_id = batch[-1].id
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+    # The backfill commits batch by batch instead of in one long transaction
+    atomic = False
+
+    dependencies = [
+        ('shop', '0023_botupdate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_category',
+            field=models.ForeignKey(
+                blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                related_name='+', to='shop.category',
+            ),
+        ),
+        migrations.RunPython(backfill_category, reverse_code=noop),
+    ]
@@ -1,13 +1,20 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Category(models.Model):
+    # Natural key for catalog imports (shop.catalog_io); optional for hand-made rows
+    code = models.CharField(max_length=64, unique=True, blank=True, null=True)
     name_uz = models.CharField(max_length=255)
     name_ru = models.CharField(max_length=255)
     name_en = models.CharField(max_length=255, blank=True, default='')
     # Prefer using a direct image link when provided
     image_url = models.URLField(max_length=500, blank=True, default='')
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Resized WebP renditions of the image (see shop.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Set when the image changed and variants are waiting for notify_worker
+    variants_pending = models.BooleanField(default=False, db_index=True, editable=False)
     sort_order = models.PositiveIntegerField(default=0, db_index=True)
 
     def __str__(self):
@@ -19,6 +26,8 @@ class Category(models.Model):
 
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
+    # Supplier article number, the natural key for catalog imports (shop.catalog_io)
+    sku = models.CharField(max_length=64, unique=True, blank=True, null=True)
     name_uz = models.CharField(max_length=255)
     name_ru = models.CharField(max_length=255)
     name_en = models.CharField(max_length=255, blank=True, default='')
@@ -26,14 +35,26 @@ class Product(models.Model):
     # Prefer using a direct image link when provided
     image_url = models.URLField(max_length=500, blank=True, default='')
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized WebP renditions of the image (see shop.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Set when the image changed and variants are waiting for notify_worker
+    variants_pending = models.BooleanField(default=False, db_index=True, editable=False)
     is_active = models.BooleanField(default=True)
     sort_order = models.PositiveIntegerField(default=0, db_index=True)
+    # Catalog version of the last change to this row (for /api/products?since=)
+    catalog_version = models.PositiveBigIntegerField(default=0, db_index=True, editable=False)
+    # Transliterated names for /api/search (maintained by shop.signals)
+    search_text = models.TextField(blank=True, default='', editable=False)
 
     def __str__(self):
         return self.name_uz
 
     class Meta:
         ordering = ['sort_order', 'id']
+        indexes = [
+            # Keyset pages of /api/products filtered by category
+            models.Index(fields=['category', 'sort_order', 'id'], name='shop_product_cat_sort_idx'),
+        ]
 
 
 class UserProfile(models.Model):
@@ -62,17 +83,229 @@ class Order(models.Model):
     address = models.TextField(blank=True, null=True)
     contact_whatsapp = models.CharField(max_length=64, blank=True, null=True)
     contact_email = models.EmailField(blank=True, null=True)
+    # Client-supplied key that makes /api/order retries safe (see shop.services)
+    idempotency_key = models.CharField(max_length=64, unique=True, blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Order #{self.id} - {self.user} - {self.total}"
 
+    class Meta:
+        indexes = [
+            # /api/my-orders pages through a user's orders newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='shop_order_user_created_idx'),
+            # Date-range exports walk orders in (created_at, id) order (shop.order_export)
+            models.Index(fields=['created_at', 'id'], name='shop_order_created_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=12, decimal_places=2)
+    # Product as it was when ordered, so order history reads never join Product
+    product_name_uz = models.CharField(max_length=255, blank=True, default='')
+    product_name_ru = models.CharField(max_length=255, blank=True, default='')
+    product_name_en = models.CharField(max_length=255, blank=True, default='')
+    # image_url, or the uploaded image's storage name
+    product_image = models.CharField(max_length=500, blank=True, default='')
+    # Category the sales rollups booked this line under (shop.analytics)
+    product_category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', editable=False,
+    )
+
+    def __str__(self):
+        return f"{self.product_name_uz or self.product_id} x{self.quantity}"
+
+    def snapshot_product(self, product):
+        """Copy the product's names, image and category onto this item."""
+        self.product_name_uz = product.name_uz or ''
+        self.product_name_ru = product.name_ru or ''
+        self.product_name_en = product.name_en or ''
+        self.product_image = product.image_url or (product.image.name if product.image else '')
+        self.product_category_id = product.category_id
+
+
+class CatalogVersion(models.Model):
+    # Single row (pk=1) bumped on every product/category change; see shop.catalog
+    value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now_add=True)
+    # Newest version whose tombstones were pruned; older ?since= must resync
+    pruned_through = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalog v{self.value}"
+
+
+class CatalogTombstone(models.Model):
+    # Deleted product ids, so delta clients can drop them
+    product_id = models.BigIntegerField()
+    version = models.PositiveBigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Product #{self.product_id} deleted at v{self.version}"
+
+
+class BotUpdate(models.Model):
+    # Telegram updates from the webhook, waiting for the single bot process (see bot.webhook)
+    update_id = models.BigIntegerField(unique=True)
+    payload = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Update #{self.update_id}"
+
+
+class OutboxMessage(models.Model):
+    # Telegram messages waiting for the notify_worker process (see shop.notifications)
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+    chat_id = models.CharField(max_length=64)
+    text = models.TextField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Message #{self.id} to {self.chat_id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='shop_outbox_due_idx'),
+        ]
+
+
+class Broadcast(models.Model):
+    # A message to every UserProfile, sent by notify_worker (see shop.broadcasts)
+    DRAFT = 'draft'
+    QUEUED = 'queued'
+    PAUSED = 'paused'
+    DONE = 'done'
+    STATUS_CHOICES = [
+        (DRAFT, 'Draft'),
+        (QUEUED, 'Queued'),
+        (PAUSED, 'Paused'),
+        (DONE, 'Done'),
+    ]
+    text = models.TextField(help_text='Sent to Uzbek speakers and anyone without a translation')
+    text_ru = models.TextField(blank=True, default='')
+    text_en = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=DRAFT)
+    # Recipients are added in UserProfile.id order; cursor is the last id added
+    cursor = models.BigIntegerField(default=0, editable=False)
+    recipients_complete = models.BooleanField(default=False, editable=False)
+    recipients = models.PositiveIntegerField(default=0, editable=False)
+    sent = models.PositiveIntegerField(default=0, editable=False)
+    failed = models.PositiveIntegerField(default=0, editable=False)
+    blocked = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True, editable=False)
+    finished_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    def __str__(self):
+        return f"Broadcast #{self.id} ({self.status})"
+
+    def text_for(self, language: str) -> str:
+        language = (language or '').upper()
+        if language == 'RU' and self.text_ru:
+            return self.text_ru
+        if language == 'EN' and self.text_en:
+            return self.text_en
+        return self.text
+
+
+class BroadcastDelivery(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    BLOCKED = 'blocked'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+        (BLOCKED, 'Blocked the bot'),
+    ]
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name='deliveries')
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='broadcast_deliveries')
+    chat_id = models.CharField(max_length=64)
+    language = models.CharField(max_length=4, blank=True, default='')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"Broadcast #{self.broadcast_id} to {self.chat_id} ({self.status})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['broadcast', 'user'], name='shop_broadcast_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['broadcast', 'status', 'id'], name='shop_broadcast_due_idx'),
+        ]
+
+
+class DailyStatusSales(models.Model):
+    # Rollups kept current by shop.analytics; orders are bucketed by the
+    # local date they were placed and counted under their current status
+    day = models.DateField()
+    status = models.CharField(max_length=16)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
 
     def __str__(self):
-        return f"{self.product} x{self.quantity}"
+        return f"{self.day} {self.status}: {self.orders} orders"
+
+    class Meta:
+        verbose_name = 'sales dashboard'
+        verbose_name_plural = 'sales dashboard'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='shop_daily_status_uniq'),
+        ]
+
+
+class DailyProductSales(models.Model):
+    # Units and revenue per product per day, cancelled orders excluded
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day} product #{self.product_id}: {self.units}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='shop_daily_product_uniq'),
+        ]
+
+
+class DailyCategorySales(models.Model):
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day} category #{self.category_id}: {self.units}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='shop_daily_category_uniq'),
+        ]
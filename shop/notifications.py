@@ -0,0 +1,241 @@
+"""Telegram notifications through a transactional outbox.
+
+Request code only calls ``enqueue()``: the message becomes an
+``OutboxMessage`` row in the same transaction as the order (or status
+change) it describes, so it is sent if and only if that data commits and
+no request ever waits on api.telegram.org.
+
+``manage.py notify_worker`` (the ``worker`` Procfile entry) drains the table:
+
+- due rows are claimed in batches with a short lease (``SKIP LOCKED`` on
+  PostgreSQL), so several workers can run side by side;
+- sends go through a global and a per-chat token bucket to stay under
+  Telegram's limits (~30 msg/s overall, ~1 msg/s per chat);
+- 429 responses pause all sending for ``retry_after`` seconds; network
+  errors and 5xx are retried with exponential backoff; other 4xx (blocked
+  bot, unknown chat) fail permanently. Rows are never deleted.
+- A missing ``BOT_TOKEN`` or a token Telegram rejects (401/404) is a
+  configuration error, not the message's fault: sending pauses for
+  ``CONFIG_PAUSE_SECONDS``, an error is logged and no attempts are used up.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from config import metrics
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60
+MAX_BACKOFF_SECONDS = 3600
+# How long a bad or missing bot token stops all sending before trying again
+CONFIG_PAUSE_SECONDS = 60
+# Telegram answers these for the bot token itself, whatever the chat
+TOKEN_ERRORS = (401, 404)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token if available; returns 0 or the seconds to wait."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class SendResult:
+    __slots__ = ('ok', 'retry_after', 'permanent', 'config_error', 'error', 'status_code')
+
+    def __init__(self, ok=False, retry_after=0, permanent=False, config_error=False, error='', status_code=None):
+        self.ok = ok
+        self.retry_after = retry_after
+        self.permanent = permanent
+        self.config_error = config_error
+        self.error = error
+        self.status_code = status_code
+
+
+def send_telegram_message(chat_id: str, text: str, session=None) -> SendResult:
+    """Call sendMessage once and classify the outcome."""
+    token = settings.BOT_TOKEN
+    if not token:
+        return SendResult(config_error=True, error='BOT_TOKEN is not set')
+    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    started = time.monotonic()
+    try:
+        r = (session or requests).post(url, json={'chat_id': chat_id, 'text': text}, timeout=10)
+    except requests.RequestException as e:
+        metrics.observe_telegram('sendMessage', time.monotonic() - started, None)
+        return SendResult(error=str(e))
+    metrics.observe_telegram('sendMessage', time.monotonic() - started, r.status_code)
+    if r.status_code == 200:
+        return SendResult(ok=True, status_code=200)
+    try:
+        data = r.json()
+    except ValueError:
+        data = {}
+    error = f"{r.status_code} {data.get('description', '')}".strip()
+    if r.status_code == 429:
+        retry_after = int((data.get('parameters') or {}).get('retry_after') or 5)
+        return SendResult(retry_after=retry_after, error=error, status_code=429)
+    if r.status_code in TOKEN_ERRORS:
+        return SendResult(config_error=True, error=error, status_code=r.status_code)
+    return SendResult(permanent=400 <= r.status_code < 500, error=error, status_code=r.status_code)
+
+
+def enqueue(chat_id, text: str):
+    """Queue a message; call inside the transaction that caused it."""
+    if not chat_id:
+        return None
+    return OutboxMessage.objects.create(chat_id=str(chat_id), text=text)
+
+
+def enqueue_many(messages):
+    """Queue ``(chat_id, text)`` pairs with a single INSERT."""
+    rows = [OutboxMessage(chat_id=str(chat_id), text=text) for chat_id, text in messages if chat_id]
+    if rows:
+        OutboxMessage.objects.bulk_create(rows)
+    return rows
+
+
+def claim_batch(limit: int) -> list:
+    """Lease up to ``limit`` due messages to this worker."""
+    now = timezone.now()
+    with transaction.atomic():
+        qs = OutboxMessage.objects.filter(status=OutboxMessage.PENDING, next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        batch = list(qs[:limit])
+        if batch:
+            OutboxMessage.objects.filter(pk__in=[m.pk for m in batch]).update(
+                next_attempt_at=now + timedelta(seconds=LEASE_SECONDS),
+            )
+    return batch
+
+
+class Dispatcher:
+    """Sends claimed outbox messages under Telegram's rate limits."""
+
+    def __init__(self, threads: int = 8):
+        self.global_bucket = TokenBucket(float(getattr(settings, 'TELEGRAM_GLOBAL_RATE', 25)))
+        self.chat_rate = float(getattr(settings, 'TELEGRAM_CHAT_RATE', 1))
+        self.chat_buckets = {}
+        self.paused_until = 0.0
+        self.max_attempts = int(getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 20))
+        self.session = requests.Session()
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='outbox')
+        self.lock = threading.Lock()
+
+    def chat_bucket(self, chat_id):
+        with self.lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                if len(self.chat_buckets) > 10000:
+                    self.chat_buckets.clear()
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+            return bucket
+
+    def _reschedule(self, msg, delay, error='', count_attempt=True):
+        fields = {'next_attempt_at': timezone.now() + timedelta(seconds=delay), 'last_error': error[:1000]}
+        if count_attempt:
+            msg.attempts += 1
+            fields['attempts'] = msg.attempts
+            if msg.attempts >= self.max_attempts:
+                fields['status'] = OutboxMessage.FAILED
+        OutboxMessage.objects.filter(pk=msg.pk).update(**fields)
+
+    def pause(self, seconds):
+        """Stop all sending for ``seconds`` (Telegram's retry_after)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def config_error(self, error: str):
+        """Pause everything after a token problem; logs once per pause."""
+        with self.lock:
+            already = self.paused_until > time.monotonic()
+            self.paused_until = max(self.paused_until, time.monotonic() + CONFIG_PAUSE_SECONDS)
+        if not already:
+            logger.error('Telegram sending paused for %ss, check BOT_TOKEN: %s', CONFIG_PAUSE_SECONDS, error)
+
+    def _deliver(self, msg):
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            self._reschedule(msg, pause, count_attempt=False)
+            return 'deferred'
+        wait = self.chat_bucket(msg.chat_id).try_acquire()
+        if wait:
+            # This chat is over its limit; let other chats go first
+            self._reschedule(msg, wait, count_attempt=False)
+            return 'deferred'
+        self.global_bucket.acquire()
+        result = send_telegram_message(msg.chat_id, msg.text, session=self.session)
+        if result.ok:
+            OutboxMessage.objects.filter(pk=msg.pk).update(
+                status=OutboxMessage.SENT, sent_at=timezone.now(), attempts=msg.attempts + 1, last_error='',
+            )
+            return 'sent'
+        if result.retry_after:
+            self.pause(result.retry_after)
+            self._reschedule(msg, result.retry_after, result.error, count_attempt=False)
+            return 'throttled'
+        if result.config_error:
+            self.config_error(result.error)
+            self._reschedule(msg, CONFIG_PAUSE_SECONDS, result.error, count_attempt=False)
+            return 'paused'
+        if result.permanent:
+            OutboxMessage.objects.filter(pk=msg.pk).update(
+                status=OutboxMessage.FAILED, attempts=msg.attempts + 1, last_error=result.error[:1000],
+            )
+            return 'failed'
+        self._reschedule(msg, min(MAX_BACKOFF_SECONDS, 5 * 2 ** msg.attempts), result.error)
+        return 'retry'
+
+    def _deliver_safely(self, msg):
+        try:
+            return self._deliver(msg)
+        except Exception:
+            logger.exception('Outbox message #%s failed', msg.pk)
+            return 'error'
+        finally:
+            close_old_connections()
+
+    def run_once(self, batch_size: int = 100) -> dict:
+        """Claim and send one batch; returns outcome counts."""
+        batch = claim_batch(batch_size)
+        counts = {}
+        for outcome in self.pool.map(self._deliver_safely, batch):
+            counts[outcome] = counts.get(outcome, 0) + 1
+        return counts
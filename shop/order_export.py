@@ -0,0 +1,127 @@
+"""Streaming order export for accounting (CSV or JSON Lines).
+
+- CSV has one line per order item with the order's columns repeated
+  (orders without items get one line with empty item columns); JSON Lines
+  has one object per order with its ``items``.
+- CSV text cells starting with ``=``, ``+``, ``-``, ``@``, a tab or a
+  carriage return get a leading ``'``: names, addresses and comments come
+  from customers, and spreadsheets would run them as formulas.
+- Orders are read ``CHUNK_SIZE`` at a time by keyset on ``(created_at,
+  id)`` (``shop_order_created_idx``), each chunk with one more query for
+  its items. No query holds a cursor or a transaction open between
+  chunks, memory stays flat whatever the range, and the first lines go out
+  as soon as the first chunk is read.
+- ``filter_orders`` takes statuses and local dates (``TIME_ZONE``,
+  inclusive), the same days the sales reports use.
+
+Used by ``manage.py export_orders``, ``/api/orders/export`` and the
+admin's export action.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .catalog_io import to_csv, to_jsonl
+from .models import Order, OrderItem
+
+CHUNK_SIZE = 2000
+# Lines are joined into blocks of about this many characters: one socket write each
+BLOCK_SIZE = 64 * 1024
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+ORDER_FIELDS = {
+    'order_id': 'id', 'created_at': 'created_at', 'status': 'status', 'total': 'total',
+    'user_id': 'user_id', 'telegram_id': 'user__telegram_id', 'full_name': 'user__full_name',
+    'phone': 'user__phone', 'comment': 'comment', 'address': 'address',
+}
+ITEM_FIELDS = {
+    'product_id': 'product_id', 'product_name_uz': 'product_name_uz', 'product_name_ru': 'product_name_ru',
+    'product_name_en': 'product_name_en', 'quantity': 'quantity', 'price': 'price',
+}
+CSV_COLUMNS = tuple(ORDER_FIELDS) + tuple(ITEM_FIELDS) + ('line_total',)
+# Spreadsheets read cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def filter_orders(queryset=None, statuses=(), start=None, end=None):
+    """Orders with one of ``statuses`` placed on ``start``..``end`` (dates, inclusive)."""
+    qs = Order.objects.all() if queryset is None else queryset
+    if statuses:
+        qs = qs.filter(status__in=statuses)
+    if start is not None:
+        qs = qs.filter(created_at__gte=_day_start(start))
+    if end is not None:
+        qs = qs.filter(created_at__lt=_day_start(end + timedelta(days=1)))
+    return qs
+
+
+def iter_orders(queryset, chunk_size: int = CHUNK_SIZE):
+    """Yield order dicts (``ORDER_FIELDS`` plus ``items``) oldest first."""
+    qs = queryset.order_by('created_at', 'id').values_list(*ORDER_FIELDS.values())
+    after = None
+    while True:
+        page = qs
+        if after is not None:
+            # The plain >= lets the index range start at the last timestamp
+            page = qs.filter(Q(created_at__gt=after[0]) | Q(id__gt=after[1]), created_at__gte=after[0])
+        orders = [dict(zip(ORDER_FIELDS, row)) for row in page[:chunk_size]]
+        if not orders:
+            return
+        after = (orders[-1]['created_at'], orders[-1]['order_id'])
+        by_id = {}
+        for order in orders:
+            order['created_at'] = timezone.localtime(order['created_at']).isoformat()
+            order['items'] = []
+            by_id[order['order_id']] = order
+        items = (
+            OrderItem.objects.filter(order_id__in=by_id).order_by('order_id', 'id')
+            .values_list('order_id', *ITEM_FIELDS.values())
+        )
+        for order_id, *values in items:
+            by_id[order_id]['items'].append(dict(zip(ITEM_FIELDS, values)))
+        yield from orders
+        if len(orders) < chunk_size:
+            return
+
+
+def _cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def item_rows(orders):
+    """One flat ``CSV_COLUMNS`` dict per order item, text made safe for spreadsheets."""
+    blank = dict.fromkeys(ITEM_FIELDS, None)
+    for order in orders:
+        items = order.pop('items')
+        order = {k: _cell(v) for k, v in order.items()}
+        for item in items or [blank]:
+            line_total = item['price'] * item['quantity'] if item['price'] is not None else None
+            yield {**order, **{k: _cell(v) for k, v in item.items()}, 'line_total': line_total}
+
+
+def _blocks(lines):
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield ''.join(block)
+            block, size = [], 0
+    if block:
+        yield ''.join(block)
+
+
+def stream(queryset, fmt: str, chunk_size: int = CHUNK_SIZE):
+    """Text blocks of ``queryset`` exported as ``fmt`` ('csv' or 'jsonl')."""
+    orders = iter_orders(queryset, chunk_size)
+    if fmt == 'csv':
+        return _blocks(to_csv(item_rows(orders), CSV_COLUMNS))
+    return _blocks(to_jsonl(orders))
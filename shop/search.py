@@ -0,0 +1,195 @@
+"""Multilingual product search.
+
+Names are folded into one Latin alphabet (Uzbek Cyrillic/Russian are
+transliterated, apostrophes and case dropped) and stored on
+``Product.search_text``. Queries are folded the same way, so "плов",
+"plov" and "PLOV" all meet.
+
+Both backends match every query token as a word prefix:
+
+- On PostgreSQL ``search_text`` has a trigram GIN index and every query
+  token becomes an indexed ``~ '(^| )token'``.
+- Elsewhere (SQLite) an in-memory inverted index of token prefixes is
+  rebuilt on a background thread whenever the catalog version changes;
+  searches keep using the previous index until the new one is ready.
+"""
+import logging
+import re
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import catalog
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+# Uzbek Latin "x" and Cyrillic "х"/"ҳ" are searched as the same letter
+LATIN_FOLD = {'x': 'h'}
+_TRANSLATE = str.maketrans({**CYRILLIC, **LATIN_FOLD, "'": '', '‘': '', '’': '', 'ʻ': '', 'ʼ': '', '`': ''})
+_TOKEN_RE = re.compile(r'[0-9a-z]+')
+
+MIN_QUERY_LENGTH = 2
+# Prefixes up to this length get precomputed rank lists
+SHORT_PREFIX = 3
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Row columns kept by the in-memory index (same shape as the list API rows)
+INDEX_COLUMNS = (
+    'id', 'name_uz', 'name_ru', 'name_en', 'price', 'image_url', 'image', 'image_variants', 'category_id', 'sort_order',
+)
+
+
+def tokens(text: str) -> list:
+    """Fold ``text`` to search tokens."""
+    return _TOKEN_RE.findall((text or '').lower().translate(_TRANSLATE))
+
+
+def index_text(product) -> str:
+    """Build the ``search_text`` value for a product."""
+    seen = []
+    for name in (product.name_uz, product.name_ru, product.name_en):
+        for tok in tokens(name):
+            if tok not in seen:
+                seen.append(tok)
+    return ' '.join(seen)
+
+
+class SearchIndex:
+    """Inverted index from token prefixes to catalog ranks.
+
+    Short prefixes (autocomplete's worst case, matching thousands of tokens)
+    get a precomputed sorted rank list; longer ones are unioned on the fly
+    from the narrow token range they cover. A query walks the smallest list
+    in catalog order, checks the other tokens against the row and stops
+    after ``limit`` matches.
+    """
+
+    def __init__(self, rows):
+        self.rows = []
+        self.row_tokens = []
+        postings = {}
+        for rank, row in enumerate(rows):
+            names = ' '.join(row[f] or '' for f in ('name_uz', 'name_ru', 'name_en'))
+            toks = tuple(set(tokens(names)))
+            self.rows.append(row)
+            self.row_tokens.append(toks)
+            for tok in toks:
+                postings.setdefault(tok, []).append(rank)
+        self.tokens = sorted(postings)
+        self.postings = [postings[t] for t in self.tokens]
+        prefixes = {}
+        for tok, plist in postings.items():
+            for n in range(1, min(len(tok), SHORT_PREFIX) + 1):
+                prefixes.setdefault(tok[:n], set()).update(plist)
+        self.prefixes = {p: sorted(ranks) for p, ranks in prefixes.items()}
+
+    def _ranks(self, prefix: str) -> list:
+        if len(prefix) <= SHORT_PREFIX:
+            return self.prefixes.get(prefix, [])
+        lo = bisect_left(self.tokens, prefix)
+        hi = bisect_left(self.tokens, prefix + '\uffff', lo)
+        if hi - lo == 1:
+            return self.postings[lo]
+        ranks = set()
+        for plist in self.postings[lo:hi]:
+            ranks.update(plist)
+        return sorted(ranks)
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list:
+        """Return rows matching every query token as a prefix, in catalog order."""
+        qtokens = set(tokens(query))
+        if not qtokens:
+            return []
+        lists = sorted(((self._ranks(t), t) for t in qtokens), key=lambda x: len(x[0]))
+        lead = lists[0][0]
+        rest = [t for _, t in lists[1:]]
+        out = []
+        for rank in lead:
+            if rest:
+                row_tokens = self.row_tokens[rank]
+                if not all(any(rt.startswith(t) for rt in row_tokens) for t in rest):
+                    continue
+            out.append(self.rows[rank])
+            if len(out) >= limit:
+                break
+        return out
+
+
+_lock = threading.Lock()
+_index = {'version': None, 'index': None, 'building': False}
+
+
+def _build_index() -> SearchIndex:
+    rows = (
+        Product.objects.filter(is_active=True)
+        .order_by('sort_order', 'id')
+        .values(*INDEX_COLUMNS)
+    )
+    return SearchIndex(rows.iterator(chunk_size=2000))
+
+
+def _rebuild_in_background(version):
+    close_old_connections()
+    try:
+        index = _build_index()
+        with _lock:
+            if version > _index['version']:
+                _index['index'], _index['version'] = index, version
+    except Exception:
+        logger.exception('Search index rebuild failed')
+    finally:
+        _index['building'] = False
+        close_old_connections()
+
+
+def memory_index() -> SearchIndex:
+    """Return the in-memory index, starting a rebuild if the catalog moved on.
+
+    Only the very first build runs in the caller; after that a stale index
+    keeps answering until its replacement is ready.
+    """
+    version = catalog.current_version()
+    if _index['version'] == version:
+        return _index['index']
+    with _lock:
+        if _index['index'] is None:
+            _index['index'] = _build_index()
+            _index['version'] = version
+        elif _index['version'] != version and not _index['building']:
+            _index['building'] = True
+            threading.Thread(
+                target=_rebuild_in_background, args=(version,), name='search-index', daemon=True,
+            ).start()
+    return _index['index']
+
+
+def use_postgres() -> bool:
+    backend = getattr(settings, 'SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return connection.vendor == 'postgresql'
+    return backend == 'postgres'
+
+
+def search(query: str, limit: int = DEFAULT_LIMIT, columns=INDEX_COLUMNS) -> list:
+    """Return product rows (dicts with ``columns``) matching ``query``."""
+    qtokens = tokens(query)
+    if not qtokens or sum(len(t) for t in qtokens) < MIN_QUERY_LENGTH:
+        return []
+    if not use_postgres():
+        return memory_index().search(query, limit)
+    qs = Product.objects.filter(is_active=True)
+    for tok in set(qtokens):
+        # Word prefix like the in-memory index; pg_trgm indexes regexes too
+        qs = qs.filter(search_text__regex=r'(^| )' + tok)
+    return list(qs.order_by('sort_order', 'id').values(*columns)[:limit])
@@ -0,0 +1,289 @@
+"""Domain operations shared by the HTTP views (and anything else that
+needs them without going through HTTP)."""
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import analytics, notifications
+from .models import Order, OrderItem, Product, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# create_order issues at most this many queries whatever the cart size:
+# BEGIN/COMMIT (statements on SQLite), idempotency key lookup, user lookup
+# (+ savepoint/insert/release when new) or update, products, order insert,
+# bulk item insert, bulk outbox insert, three sales rollup upserts
+ORDER_QUERY_BUDGET = 14
+
+
+class InvalidOrder(ValueError):
+    pass
+
+
+class IdempotencyConflict(InvalidOrder):
+    pass
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(limit: int, label: str):
+    """Count queries in the block; over ``limit`` raises in DEBUG and logs otherwise.
+
+    Open it inside the transaction it measures, so the DEBUG error rolls
+    the work back rather than reporting a failure for committed data.
+    """
+    count = [0]
+
+    def counter(execute, sql, params, many, context):
+        count[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(counter):
+        yield count
+    if count[0] > limit:
+        msg = f"{label} ran {count[0]} queries (budget {limit})"
+        if settings.DEBUG:
+            raise QueryBudgetExceeded(msg)
+        logger.error(msg)
+
+
+def _parse_items(items):
+    """Merge cart lines into ``{product_id: quantity}``, dropping empty ones."""
+    lines = {}
+    for it in items:
+        try:
+            pid = int(it.get('product_id'))
+            qty = int(it.get('quantity', 0))
+        except (TypeError, ValueError, AttributeError):
+            raise InvalidOrder('Invalid item')
+        if qty > 0:
+            lines[pid] = lines.get(pid, 0) + qty
+    return lines
+
+
+def upsert_profile(telegram_id, **fields):
+    """Get or create the profile and store the non-empty ``fields``.
+
+    Writes only the columns that actually changed.
+    """
+    values = {k: v for k, v in fields.items() if v}
+    user, created = UserProfile.objects.get_or_create(telegram_id=telegram_id, defaults=values)
+    if not created:
+        changed = [k for k, v in values.items() if getattr(user, k) != v]
+        for k in changed:
+            setattr(user, k, values[k])
+        if changed:
+            user.save(update_fields=changed)
+    return user
+
+
+def get_profile(telegram_id):
+    """Return the stored profile fields for ``telegram_id``, or None."""
+    user = UserProfile.objects.filter(telegram_id=str(telegram_id)).first()
+    if user is None:
+        return None
+    return {
+        'telegram_id': user.telegram_id,
+        'language': user.language,
+        'phone': user.phone,
+        'full_name': user.full_name,
+        'username': user.username,
+    }
+
+
+def product_rows():
+    """Active products in catalog order as plain dicts (no media URLs)."""
+    rows = (
+        Product.objects.filter(is_active=True)
+        .order_by('sort_order', 'id')
+        .values('id', 'name_uz', 'name_ru', 'name_en', 'price', 'category_id', 'sort_order')
+    )
+    return [dict(r, price=float(r['price'])) for r in rows]
+
+
+def _replayed_order(telegram_id, idempotency_key):
+    """Return the order already created for ``idempotency_key`` within the
+    retention window, or None. Expired keys are released for reuse."""
+    order = (
+        Order.objects.filter(idempotency_key=idempotency_key)
+        .select_related('user').only('id', 'total', 'created_at', 'user__telegram_id')
+        .first()
+    )
+    if order is None:
+        return None
+    ttl = timedelta(hours=float(getattr(settings, 'ORDER_IDEMPOTENCY_TTL_HOURS', 24)))
+    if order.created_at < timezone.now() - ttl:
+        Order.objects.filter(pk=order.pk).update(idempotency_key=None)
+        return None
+    if order.user.telegram_id != str(telegram_id):
+        raise IdempotencyConflict('Idempotency key was used by another user')
+    return order
+
+
+def create_order(telegram_id, items, language=None, phone=None, full_name=None, username=None,
+                 comment='', address='', contact_whatsapp='', contact_email='', idempotency_key=None):
+    """Create an order with its items and queued notifications atomically.
+
+    Returns ``(order, replayed)``. With an ``idempotency_key`` a retry
+    within ``ORDER_IDEMPOTENCY_TTL_HOURS`` returns the original order
+    (``replayed=True``) instead of creating another one; concurrent
+    duplicates are settled by the unique index.
+
+    Runs a fixed number of queries (``ORDER_QUERY_BUDGET``) regardless of
+    how many lines the cart has. Raises ``InvalidOrder`` for malformed or
+    empty carts.
+    """
+    lines = _parse_items(items)
+    if not lines:
+        raise InvalidOrder('Cart is empty')
+    if idempotency_key and len(idempotency_key) > 64:
+        raise InvalidOrder('Idempotency key is too long')
+
+    try:
+        # Budget inside the transaction: going over in DEBUG rolls the order back
+        # instead of failing a request whose order was already committed
+        with transaction.atomic(), query_budget(ORDER_QUERY_BUDGET, 'create_order'):
+            if idempotency_key:
+                existing = _replayed_order(telegram_id, idempotency_key)
+                if existing is not None:
+                    return existing, True
+            order = _create_order(
+                telegram_id, lines, language, phone, full_name, username,
+                comment, address, contact_whatsapp, contact_email, idempotency_key,
+            )
+    except IntegrityError:
+        # A concurrent request with the same key won the race
+        existing = _replayed_order(telegram_id, idempotency_key) if idempotency_key else None
+        if existing is None:
+            raise
+        return existing, True
+    return order, False
+
+
+def _create_order(telegram_id, lines, language, phone, full_name, username,
+                  comment, address, contact_whatsapp, contact_email, idempotency_key):
+    """Write the profile, order, items and notifications (caller holds the transaction)."""
+    user = upsert_profile(telegram_id, language=language, phone=phone, full_name=full_name, username=username)
+    products_map = (
+        Product.objects.filter(id__in=list(lines), is_active=True)
+        .only('id', 'price', 'name_uz', 'name_ru', 'name_en', 'image_url', 'image', 'category_id')
+        .in_bulk()
+    )
+
+    order_items = []
+    order_total = Decimal('0.00')
+    for pid, qty in lines.items():
+        product = products_map.get(pid)
+        if product is None:
+            continue
+        order_total += Decimal(product.price) * qty
+        item = OrderItem(product=product, quantity=qty, price=product.price)
+        item.snapshot_product(product)
+        order_items.append(item)
+    if not order_items:
+        raise InvalidOrder('No available products in cart')
+
+    order = Order.objects.create(
+        user=user,
+        total=order_total,
+        comment=comment,
+        address=address,
+        contact_whatsapp=contact_whatsapp,
+        contact_email=contact_email,
+        idempotency_key=idempotency_key or None,
+    )
+    for oi in order_items:
+        oi.order = order
+    OrderItem.objects.bulk_create(order_items)
+    analytics.order_created(order, order_items)
+
+    # Build messages from what is already in memory
+    admin_text_lines = [
+        f"New order #{order.id}",
+        f"User: {user.full_name or ''} ({user.telegram_id})",
+        f"Phone: {user.phone or ''}",
+        f"WhatsApp: {order.contact_whatsapp or ''}",
+        f"Email: {order.contact_email or ''}",
+        f"Lang: {user.language or ''}",
+        f"Address: {address}",
+        f"Comment: {comment}",
+        "Items:",
+    ]
+    for oi in order_items:
+        admin_text_lines.append(f" - {oi.product_name_uz} x{oi.quantity} = {oi.price} * {oi.quantity}")
+    admin_text_lines.append(f"Total: {order.total}")
+    admin_text = '\n'.join(admin_text_lines)
+
+    user_text = f"✅ Buyurtma qabul qilindi!\n\n# {order.id} summa: {order.total}"
+
+    # Delivered by the notify_worker process once this transaction commits
+    notifications.enqueue_many([
+        (user.telegram_id, user_text),
+        (getattr(settings, 'ADMIN_CHAT_ID', ''), admin_text),
+    ])
+    return order
+
+
+STATUS_NAMES = {
+    'new':        {'UZ': 'Yangi',        'RU': 'Новый',       'EN': 'New'},
+    'processing': {'UZ': 'Jarayonda',    'RU': 'В обработке', 'EN': 'Processing'},
+    'done':       {'UZ': 'Tugallandi',   'RU': 'Готов',       'EN': 'Done'},
+    'cancelled':  {'UZ': 'Bekor qilindi','RU': 'Отменён',     'EN': 'Cancelled'},
+}
+# Statuses orders can be moved to in bulk
+BULK_STATUSES = ('processing', 'done', 'cancelled')
+BULK_CHUNK = 1000
+
+
+def status_change_text(order_id, status, language) -> str:
+    """The customer's message for an order status change."""
+    lang = (language or 'UZ').upper()
+    st_txt = STATUS_NAMES.get(status, {}).get(lang, status)
+    texts = {
+        'UZ': f"📦 Buyurtma #{order_id} status yangilandi: {st_txt}",
+        'RU': f"📦 Заказ #{order_id} обновлён: {st_txt}",
+        'EN': f"📦 Order #{order_id} updated: {st_txt}",
+    }
+    return texts.get(lang, texts['EN'])
+
+
+def bulk_set_status(order_ids, status) -> int:
+    """Move orders to ``status`` and queue one notification per changed order.
+
+    Each chunk of ``BULK_CHUNK`` ids costs a locking read, one UPDATE, the
+    sales rollup upserts and one outbox INSERT; orders already in
+    ``status`` are left alone.
+    Returns the number of orders changed.
+    """
+    if status not in BULK_STATUSES:
+        raise InvalidOrder(f'status must be one of {", ".join(BULK_STATUSES)}')
+    ids = sorted(set(int(i) for i in order_ids))
+    notify = bool(getattr(settings, 'BOT_TOKEN', ''))
+    changed = 0
+    for start in range(0, len(ids), BULK_CHUNK):
+        chunk = ids[start:start + BULK_CHUNK]
+        with transaction.atomic():
+            rows = list(
+                Order.objects.select_for_update(of=('self',))
+                .filter(pk__in=chunk).exclude(status=status)
+                .values_list('id', 'created_at', 'total', 'status', 'user__telegram_id', 'user__language')
+            )
+            if not rows:
+                continue
+            Order.objects.filter(pk__in=[r[0] for r in rows]).update(status=status)
+            analytics.status_changed([r[:4] for r in rows], status)
+            if notify:
+                notifications.enqueue_many(
+                    (telegram_id, status_change_text(order_id, status, language))
+                    for order_id, _, _, _, telegram_id, language in rows
+                )
+            changed += len(rows)
+    return changed
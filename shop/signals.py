@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import catalog, images
+from .models import Category, Product
+from .search import index_text
+
+
+@receiver(pre_save, sender=Product)
+def product_search_text(sender, instance, **kwargs):
+    instance.search_text = index_text(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    catalog.stamp_product(instance)
+    images.schedule(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    catalog.stamp_product(instance, deleted=True)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    # Category rows only feed /api/categories; a version bump is enough
+    catalog.bump_version()
+    images.schedule(instance)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    catalog.bump_version()
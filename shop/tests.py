@@ -0,0 +1,216 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import catalog, catalog_io, notifications, services
+from .models import CatalogTombstone, Category, Order, OrderItem, OutboxMessage, Product, UserProfile
+
+
+class CatalogRoundTripTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name_uz='Kitoblar', name_ru='Книги')
+        self.products = [
+            Product.objects.create(category=self.category, name_uz=f'Kitob {n}', name_ru=f'Книга {n}', price=Decimal(n))
+            for n in (10, 20)
+        ]
+
+    def _export(self, kind):
+        text = ''.join(catalog_io.to_csv(catalog_io.export_rows(kind), catalog_io.EXPORT_COLUMNS[kind]))
+        return list(catalog_io.read_rows(io.StringIO(text), 'csv'))
+
+    def test_keys_added_to_an_export_update_the_exported_rows(self):
+        rows = self._export('products')
+        for row in rows:
+            row['sku'] = f"SKU-{row['id']}"
+        result = catalog_io.import_rows('products', rows)
+
+        self.assertEqual((result['created'], result['updated'], result['errors']), (0, 2, 0))
+        self.assertEqual(Product.objects.count(), 2)
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertEqual(product.sku, f'SKU-{product.pk}')
+
+        # Importing the same file again finds the rows by their new keys
+        result = catalog_io.import_rows('products', rows)
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (0, 0, 2))
+
+    def test_changed_image_url_queues_new_variants(self):
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(
+            image_url='https://cdn.example/old.jpg',
+            image_variants={'source': 'https://cdn.example/old.jpg', 'widths': {'160': 'variants/old-160.webp'}},
+        )
+        row = {'id': str(product.pk), 'image_url': 'https://cdn.example/new.jpg'}
+        result = catalog_io.import_rows('products', [row])
+
+        self.assertEqual(result['updated'], 1)
+        product.refresh_from_db()
+        self.assertEqual((product.image_variants, product.variants_pending), ({}, True))
+
+    def test_category_codes_added_to_an_export(self):
+        rows = self._export('categories')
+        rows[0]['code'] = 'books'
+        result = catalog_io.import_rows('categories', rows)
+
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        self.assertEqual(Category.objects.get().code, 'books')
+
+    def test_new_key_with_an_unknown_id_creates_a_row(self):
+        row = {'sku': 'NEW-1', 'id': '999', 'category_id': str(self.category.pk),
+               'name_uz': 'Yangi', 'name_ru': 'Новая', 'price': '5'}
+        result = catalog_io.import_rows('products', [row])
+
+        self.assertEqual(result['created'], 1)
+        self.assertTrue(Product.objects.filter(sku='NEW-1').exists())
+
+
+# Re-read the version on every call: on_commit never publishes inside a TestCase
+@override_settings(CATALOG_VERSION_TTL=0, CATALOG_CACHE='')
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        # Versions repeat between tests once their transactions roll back
+        catalog._local['snapshots'].clear()
+        self.category = Category.objects.create(name_uz='Kitoblar', name_ru='Книги')
+        self.kept, self.hidden, self.deleted = [
+            Product.objects.create(category=self.category, name_uz=name, name_ru=name, price=Decimal('10'))
+            for name in ('kept', 'hidden', 'deleted')
+        ]
+
+    def test_matching_etag_gets_304(self):
+        first = self.client.get('/api/products')
+        self.assertEqual(first.status_code, 200)
+
+        again = self.client.get('/api/products', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+    def test_since_reports_changed_and_removed_products(self):
+        since = catalog.read_version()[0]
+        self.kept.price = Decimal('12')
+        self.kept.save()
+        self.hidden.is_active = False
+        self.hidden.save()
+        deleted_id = self.deleted.pk
+        self.deleted.delete()
+
+        r = self.client.get(f'/api/products?since={since}')
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual([p['id'] for p in data['products']], [self.kept.pk])
+        self.assertEqual(data['removed'], sorted([self.hidden.pk, deleted_id]))
+
+    def test_since_older_than_pruned_tombstones_gets_410(self):
+        since = catalog.read_version()[0]
+        self.deleted.delete()
+        CatalogTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=365))
+        self.assertEqual(catalog.prune_tombstones(), 1)
+
+        r = self.client.get(f'/api/products?since={since}')
+        self.assertEqual(r.status_code, 410)
+        self.assertTrue(r.json()['resync'])
+
+
+class CreateOrderTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name_uz='Kitoblar', name_ru='Книги')
+        self.products = [
+            Product.objects.create(category=category, name_uz=f'Kitob {n}', name_ru=f'Книга {n}', price=Decimal(n))
+            for n in range(1, 21)
+        ]
+
+    def _post(self, telegram_id, key):
+        body = {'telegram_id': telegram_id, 'items': [{'product_id': self.products[0].pk, 'quantity': 2}]}
+        return self.client.post('/api/order', json.dumps(body), content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_with_the_same_key_returns_the_same_order(self):
+        first = self._post('1001', 'cart-1')
+        retry = self._post('1001', 'cart-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()['order_id'], first.json()['order_id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_used_by_another_user_is_a_conflict(self):
+        self._post('1001', 'cart-1')
+        r = self._post('1002', 'cart-1')
+
+        self.assertEqual(r.status_code, 409)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        items = [{'product_id': p.pk, 'quantity': 1} for p in self.products]
+        with CaptureQueriesContext(connection) as queries:
+            order, replayed = services.create_order('1001', items, idempotency_key='cart-20')
+
+        self.assertFalse(replayed)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 20)
+        self.assertLessEqual(len(queries), services.ORDER_QUERY_BUDGET)
+
+
+@override_settings(BOT_TOKEN='123:test')
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.dispatcher = notifications.Dispatcher(threads=1)
+        self.dispatcher.session = mock.Mock()
+
+    def _answer(self, status_code, body):
+        self.dispatcher.session.post.return_value = mock.Mock(status_code=status_code, json=mock.Mock(return_value=body))
+
+    def test_enqueue_writes_a_pending_row(self):
+        msg = notifications.enqueue(42, 'hello')
+        self.assertEqual((msg.status, msg.attempts), (OutboxMessage.PENDING, 0))
+
+    def test_429_pauses_sending_without_using_an_attempt(self):
+        first, second = notifications.enqueue(42, 'one'), notifications.enqueue(43, 'two')
+        self._answer(429, {'description': 'Too Many Requests', 'parameters': {'retry_after': 30}})
+
+        self.assertEqual(self.dispatcher._deliver(first), 'throttled')
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (OutboxMessage.PENDING, 0))
+        self.assertGreater(first.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+        # Every chat waits out the pause, without another call to Telegram
+        self.assertEqual(self.dispatcher._deliver(second), 'deferred')
+        self.assertEqual(self.dispatcher.session.post.call_count, 1)
+
+    def test_sent_message_is_marked_sent(self):
+        msg = notifications.enqueue(42, 'hello')
+        self._answer(200, {'ok': True})
+
+        self.assertEqual(self.dispatcher._deliver(msg), 'sent')
+        msg.refresh_from_db()
+        self.assertEqual((msg.status, msg.attempts), (OutboxMessage.SENT, 1))
+
+
+@override_settings(ORDERS_API_TOKEN='export-token')
+class OrderExportTests(TestCase):
+    def setUp(self):
+        user = UserProfile.objects.create(telegram_id='1001', full_name='=cmd|calc', phone='+998901234567')
+        Order.objects.create(user=user, total=Decimal('10'), comment='=cmd', address='Toshkent')
+
+    def _export(self, fmt):
+        r = self.client.get(f'/api/orders/export?format={fmt}', HTTP_AUTHORIZATION='Bearer export-token')
+        self.assertEqual(r.status_code, 200)
+        return b''.join(r.streaming_content).decode('utf-8')
+
+    def test_csv_cells_that_look_like_formulas_get_a_leading_quote(self):
+        header, line = list(csv.reader(io.StringIO(self._export('csv'))))
+        row = dict(zip(header, line))
+        self.assertEqual(row['comment'], "'=cmd")
+        self.assertEqual(row['full_name'], "'=cmd|calc")
+        self.assertEqual(row['phone'], "'+998901234567")
+        self.assertEqual(row['address'], 'Toshkent')
+
+    def test_jsonl_keeps_values_as_they_are(self):
+        order = json.loads(self._export('jsonl'))
+        self.assertEqual(order['comment'], '=cmd')
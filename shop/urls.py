@@ -4,7 +4,13 @@ from . import views
 urlpatterns = [
     path('categories', views.categories, name='api_categories'),
     path('products', views.products, name='api_products'),
+    path('search', views.search_products, name='api_search'),
     path('order', views.create_order, name='api_order'),
     path('my-orders', views.my_orders, name='api_my_orders'),
+    path('orders/<int:order_id>', views.order_detail, name='api_order_detail'),
+    path('orders/status', views.bulk_order_status, name='api_bulk_order_status'),
+    path('orders/export', views.export_orders, name='api_export_orders'),
+    path('analytics/sales', views.sales_report, name='api_sales_report'),
     path('user', views.upsert_user, name='api_user'),
+    path('catalog-stats', views.catalog_stats, name='api_catalog_stats'),
 ]
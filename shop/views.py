@@ -1,39 +1,50 @@
-﻿import json
-from decimal import Decimal
-import requests
+﻿import base64
+import hmac
+import json
+from datetime import date, datetime, timedelta
 
 from django.conf import settings
-from django.http import JsonResponse, HttpResponseBadRequest
-from django.views.decorators.csrf import csrf_exempt
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.decorators.http import require_GET, require_POST
 
-from .models import Product, UserProfile, Order, OrderItem, Category
+from config.middleware import span
+
+from . import analytics, catalog, images, order_export, search, services
+from .models import Product, Order, OrderItem, Category
 from django.db.models import Count, Q
 
 
-def _abs_media_url(request, rel_url: str) -> str:
-    """Return absolute https URL for media.
+def _media_base(request) -> str:
+    """Return the absolute https base (scheme + host) used for media links.
 
     Preference order:
     1) settings.BASE_URL if it is HTTPS
     2) request.build_absolute_uri (respects SECURE_PROXY_SSL_HEADER)
     This avoids generating http:// links that Telegram blocks in WebView.
     """
-    if not rel_url:
-        return ''
     base = getattr(settings, 'BASE_URL', '') or ''
     try:
         if base and isinstance(base, str) and base.lower().startswith("https://"):
-            base = base.rstrip("/")
-            if not rel_url.startswith("/"):
-                rel_url = '/' + rel_url
-            return f"{base}{rel_url}"
+            return base.rstrip("/")
     except Exception:
         pass
     # fallback to request-based absolute url (should be https with proxy headers)
+    return request.build_absolute_uri('/').rstrip('/')
+
+
+def _abs_media_url(request, rel_url: str) -> str:
+    """Return absolute https URL for media (see _media_base)."""
+    if not rel_url:
+        return ''
     if not rel_url.startswith("/"):
         rel_url = '/' + rel_url
-    return request.build_absolute_uri(rel_url)
+    return f"{_media_base(request)}{rel_url}"
+
+
 def product_to_dict(request, p: Product):
     # Prefer direct link when provided, fallback to uploaded file
     image_url = p.image_url or (_abs_media_url(request, p.image.url) if p.image else '')
@@ -44,20 +55,32 @@ def product_to_dict(request, p: Product):
         'name_en': getattr(p, 'name_en', '') or '',
         'price': float(p.price),
         'image': image_url,
+        'srcset': images.srcset(p, lambda u: _abs_media_url(request, u)),
         'category_id': p.category_id,
         'sort_order': getattr(p, 'sort_order', 0),
     }
 
 
-@require_GET
-def products(request):
+def _snapshot_response(request, snap):
+    # Clients must revalidate on every use; unchanged catalogs then cost a 304
+    resp = get_conditional_response(request, etag=snap.etag, last_modified=snap.last_modified)
+    if resp is None:
+        resp = HttpResponse(snap.body, content_type='application/json')
+    resp['ETag'] = snap.etag
+    if snap.last_modified:
+        resp['Last-Modified'] = http_date(snap.last_modified)
+    resp['Cache-Control'] = 'no-cache'
+    resp['X-Catalog-Version'] = str(snap.version)
+    resp['X-Catalog-Cache'] = snap.source.upper()
+    return resp
+
+
+def _products_payload(request):
     qs = Product.objects.filter(is_active=True).select_related('category').order_by('sort_order', 'id')
-    data = [product_to_dict(request, p) for p in qs]
-    return JsonResponse({'products': data})
+    return {'products': [product_to_dict(request, p) for p in qs]}
 
 
-@require_GET
-def categories(request):
+def _categories_payload(request):
     qs = (
         Category.objects
         .annotate(active_count=Count('products', filter=Q(products__is_active=True)))
@@ -72,22 +95,175 @@ def categories(request):
             'name_ru': c.name_ru,
             'name_en': c.name_en,
             'image': img,
+            'srcset': images.srcset(c, lambda u: _abs_media_url(request, u)),
             'count': c.active_count,
             'sort_order': getattr(c, 'sort_order', 0),
         })
-    return JsonResponse({'categories': data})
+    return {'categories': data}
+
+
+# Lean list mode of /api/products (any of these params switches it on)
+LIST_PARAMS = ('limit', 'cursor', 'category_id', 'lang', 'fields')
+LIST_FIELDS = ('id', 'name', 'name_uz', 'name_ru', 'name_en', 'price', 'image', 'srcset', 'category_id', 'sort_order')
+LIST_COLUMNS = {
+    'id': ('id',),
+    'name_uz': ('name_uz',),
+    'name_ru': ('name_ru',),
+    'name_en': ('name_en',),
+    'price': ('price',),
+    'image': ('image_url', 'image'),
+    'srcset': ('image_url', 'image', 'image_variants'),
+    'category_id': ('category_id',),
+    'sort_order': ('sort_order',),
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(key, pk) -> str:
+    return base64.urlsafe_b64encode(f"{key}:{pk}".encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str):
+    """Return ``(key, pk)``; ``key`` is the raw string of the leading sort key."""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    key, pk = raw.rsplit(':', 1)
+    return key, int(pk)
+
+
+def _projection(params):
+    """Parse ``lang``/``fields``; returns ``(lang, fields)`` or ``(None, error)``."""
+    lang = (params.get('lang') or '').lower()
+    if lang and lang not in ('uz', 'ru', 'en'):
+        return None, 'lang must be uz, ru or en'
+    if params.get('fields'):
+        fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in LIST_FIELDS]
+        if unknown:
+            return None, 'Unknown fields: ' + ', '.join(unknown)
+    elif lang:
+        fields = ['id', 'name', 'price', 'image', 'srcset', 'category_id', 'sort_order']
+    else:
+        fields = [f for f in LIST_FIELDS if f != 'name']
+    if 'name' in fields and not lang:
+        return None, 'fields=name requires lang'
+    return lang, fields
+
+
+def _list_row(request, row, fields, lang):
+    out = {}
+    for f in fields:
+        if f == 'name':
+            out['name'] = row.get(f'name_{lang}') or row['name_uz']
+        elif f == 'image':
+            name = row['image']
+            out['image'] = row['image_url'] or (_abs_media_url(request, Product._meta.get_field('image').storage.url(name)) if name else '')
+        elif f == 'srcset':
+            out['srcset'] = images.srcset(row, lambda u: _abs_media_url(request, u))
+        elif f == 'price':
+            out['price'] = float(row['price'])
+        elif f == 'name_en':
+            out['name_en'] = row['name_en'] or ''
+        else:
+            out[f] = row[f]
+    return out
+
+
+def _product_list(request):
+    """Keyset-paginated, filtered and projected product list.
+
+    Pages are ordered by ``(sort_order, id)`` and the cursor is the last
+    row's key rather than an offset, so reordering items elsewhere in the
+    catalog never shifts page boundaries for the remaining rows.
+    """
+    params = request.GET
+    try:
+        limit = min(max(int(params.get('limit') or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest('limit must be an integer')
 
+    lang, fields = _projection(params)
+    if lang is None:
+        return HttpResponseBadRequest(fields)
 
-def send_telegram_message(chat_id: str, text: str):
-    token = settings.BOT_TOKEN
-    if not token or not chat_id:
-        return
+    qs = Product.objects.filter(is_active=True)
+    if params.get('category_id'):
+        try:
+            qs = qs.filter(category_id=int(params['category_id']))
+        except ValueError:
+            return HttpResponseBadRequest('category_id must be an integer')
+    if params.get('cursor'):
+        try:
+            after_order, after_id = _decode_cursor(params['cursor'])
+            after_order = int(after_order)
+        except Exception:
+            return HttpResponseBadRequest('Invalid cursor')
+        qs = qs.filter(Q(sort_order__gt=after_order) | Q(sort_order=after_order, id__gt=after_id))
+
+    columns = {'id', 'sort_order'}
+    for f in fields:
+        columns.update(LIST_COLUMNS.get(f, (f'name_{lang}', 'name_uz')))
+    rows = list(qs.order_by('sort_order', 'id').values(*columns)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['sort_order'], rows[-1]['id'])
+    version = catalog.current_version()
+    with span('serialize'):
+        return JsonResponse({
+            'products': [_list_row(request, r, fields, lang) for r in rows],
+            'next_cursor': next_cursor,
+            'version': version,
+        })
+
+
+@require_GET
+def products(request):
+    if any(p in request.GET for p in LIST_PARAMS):
+        return _product_list(request)
+    since = request.GET.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return HttpResponseBadRequest('since must be a catalog version')
+        with span('serialize'):
+            delta = catalog.changes_since(since, lambda p: product_to_dict(request, p))
+            # 410: the delta history no longer reaches back to ``since``
+            resp = JsonResponse(delta, status=410 if delta.get('resync') else 200)
+        resp['Cache-Control'] = 'no-cache'
+        return resp
+    snap = catalog.get_snapshot('products', _media_base(request), lambda: _products_payload(request))
+    return _snapshot_response(request, snap)
+
+
+@require_GET
+def search_products(request):
+    """Multilingual product search (see shop.search); accepts lang/fields like the list mode."""
+    query = (request.GET.get('q') or '').strip()
     try:
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        requests.post(url, json={'chat_id': chat_id, 'text': text})
-    except Exception:
-        # Fail silently in scaffold
-        pass
+        limit = min(max(int(request.GET.get('limit') or search.DEFAULT_LIMIT), 1), search.MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest('limit must be an integer')
+    lang, fields = _projection(request.GET)
+    if lang is None:
+        return HttpResponseBadRequest(fields)
+    rows = search.search(query, limit)
+    return JsonResponse({'query': query, 'products': [_list_row(request, r, fields, lang) for r in rows]})
+
+
+@require_GET
+def categories(request):
+    snap = catalog.get_snapshot('categories', _media_base(request), lambda: _categories_payload(request))
+    return _snapshot_response(request, snap)
+
+
+@require_GET
+def catalog_stats(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden('Staff only')
+    return JsonResponse(catalog.stats())
 
 
 @csrf_exempt
@@ -115,105 +291,228 @@ def create_order(request):
     if not items:
         return HttpResponseBadRequest('Cart is empty')
 
-    user, _ = UserProfile.objects.get_or_create(telegram_id=telegram_id)
-    if language:
-        user.language = language
-    if phone:
-        user.phone = phone
-    if full_name:
-        user.full_name = full_name
-    if username:
-        user.username = username
-    user.save()
-
-    product_ids = [int(i.get('product_id')) for i in items if i.get('product_id')]
-    products_map = {p.id: p for p in Product.objects.filter(id__in=product_ids, is_active=True)}
-
-    order_total = Decimal('0.00')
-    order = Order.objects.create(
-        user=user,
-        total=Decimal('0.00'),
-        comment=comment,
-        address=address,
-        contact_whatsapp=contact_whatsapp,
-        contact_email=contact_email,
-    )
+    # Retries carrying the same key get the original order back
+    idempotency_key = (request.headers.get('Idempotency-Key') or payload.get('idempotency_key') or '').strip()
 
-    for it in items:
-        pid = int(it.get('product_id'))
-        qty = int(it.get('quantity', 0))
-        if qty <= 0 or pid not in products_map:
-            continue
-        product = products_map[pid]
-        line_total = Decimal(product.price) * qty
-        order_total += line_total
-        OrderItem.objects.create(order=order, product=product, quantity=qty, price=product.price)
-
-    order.total = order_total
-    order.save()
-
-    # Build messages
-    admin_text_lines = [
-        f"New order #{order.id}",
-        f"User: {user.full_name or ''} ({user.telegram_id})",
-        f"Phone: {user.phone or ''}",
-        f"WhatsApp: {order.contact_whatsapp or ''}",
-        f"Email: {order.contact_email or ''}",
-        f"Lang: {user.language or ''}",
-        f"Address: {address}",
-        f"Comment: {comment}",
-        "Items:",
-    ]
-    for oi in order.items.select_related('product'):
-        admin_text_lines.append(f" - {oi.product.name_uz} x{oi.quantity} = {oi.price} * {oi.quantity}")
-    admin_text_lines.append(f"Total: {order.total}")
-    admin_text = '\n'.join(admin_text_lines)
-
-    user_text = f"вњ… Buyurtma qabul qilindi!\n\n# {order.id} summa: {order.total}"
-
-    send_telegram_message(chat_id=user.telegram_id, text=user_text)
-    if getattr(settings, 'ADMIN_CHAT_ID', ''):
-        send_telegram_message(chat_id=settings.ADMIN_CHAT_ID, text=admin_text)
-
-    return JsonResponse({'status': 'ok', 'order_id': order.id, 'total': float(order.total)})
+    try:
+        order, replayed = services.create_order(
+            telegram_id, items,
+            language=language, phone=phone, full_name=full_name, username=username,
+            comment=comment, address=address, contact_whatsapp=contact_whatsapp, contact_email=contact_email,
+            idempotency_key=idempotency_key or None,
+        )
+    except services.IdempotencyConflict as e:
+        return JsonResponse({'status': 'error', 'error': str(e)}, status=409)
+    except services.InvalidOrder as e:
+        return HttpResponseBadRequest(str(e))
+    resp = JsonResponse({'status': 'ok', 'order_id': order.id, 'total': float(order.total)})
+    if replayed:
+        resp['Idempotent-Replayed'] = 'true'
+    return resp
+
+
+ORDER_PAGE_SIZE = 20
+MAX_ORDER_PAGE_SIZE = 100
+ORDER_SUMMARY_FIELDS = ('id', 'total', 'status', 'created_at')
+
+
+def _order_summary(row) -> dict:
+    return {
+        'id': row['id'],
+        'total': float(row['total']),
+        'status': row['status'],
+        'created_at': row['created_at'].isoformat(),
+        'item_count': row['item_count'],
+    }
+
+
+def _order_items(order_ids, request=None) -> dict:
+    """Items of ``order_ids`` from their purchase-time snapshot (no Product join).
+
+    With ``request`` each item also gets its ``image`` URL.
+    """
+    columns = ['order_id', 'product_id', 'quantity', 'price', 'product_name_uz', 'product_name_ru', 'product_name_en']
+    if request is not None:
+        columns.append('product_image')
+    storage = Product._meta.get_field('image').storage
+    items = {}
+    for it in OrderItem.objects.filter(order_id__in=order_ids).order_by('id').values(*columns):
+        item = {
+            'product_id': it['product_id'],
+            'product_name_uz': it['product_name_uz'],
+            'product_name_ru': it['product_name_ru'],
+            'product_name_en': it['product_name_en'],
+            'quantity': it['quantity'],
+            'price': float(it['price']),
+        }
+        if request is not None:
+            image = it['product_image']
+            item['image'] = image if '://' in image else (_abs_media_url(request, storage.url(image)) if image else '')
+        items.setdefault(it['order_id'], []).append(item)
+    return items
 
 
 @require_GET
 def my_orders(request):
-    telegram_id = request.GET.get('telegram_id') or ''
+    """A user's orders, newest first, one page at a time.
+
+    ``limit`` and ``cursor`` page through ``(created_at, id)`` (follow
+    ``next_cursor``). ``view=summary`` returns id/total/status/created_at
+    and ``item_count`` only; the default also includes each order's items.
+    ``/api/orders/<id>`` has the full detail of one order.
+    """
+    params = request.GET
+    telegram_id = params.get('telegram_id') or ''
     if not telegram_id:
-        return JsonResponse({'orders': []})
+        return JsonResponse({'orders': [], 'next_cursor': None})
     try:
-        user = UserProfile.objects.get(telegram_id=str(telegram_id))
-    except UserProfile.DoesNotExist:
-        return JsonResponse({'orders': []})
-
-    orders = (
-        Order.objects.filter(user=user)
-        .order_by('-created_at')
-        .prefetch_related('items__product')
+        limit = min(max(int(params.get('limit') or ORDER_PAGE_SIZE), 1), MAX_ORDER_PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest('limit must be an integer')
+    summary = params.get('view') == 'summary'
+
+    qs = Order.objects.filter(user__telegram_id=str(telegram_id))
+    if params.get('cursor'):
+        try:
+            created_at, before_id = _decode_cursor(params['cursor'])
+            created_at = datetime.fromisoformat(created_at)
+        except Exception:
+            return HttpResponseBadRequest('Invalid cursor')
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=before_id))
+    fields = ORDER_SUMMARY_FIELDS if summary else ORDER_SUMMARY_FIELDS + ('comment',)
+    rows = list(
+        qs.order_by('-created_at', '-id')
+        .annotate(item_count=Count('items'))
+        .values(*fields, 'item_count')[:limit + 1]
     )
-    out = []
-    for o in orders:
-        items = []
-        for it in o.items.all():
-            items.append({
-                'product_id': it.product_id,
-                'product_name_uz': it.product.name_uz,
-                'product_name_ru': it.product.name_ru,
-                'product_name_en': getattr(it.product, 'name_en', '') or '',
-                'quantity': it.quantity,
-                'price': float(it.price),
-            })
-        out.append({
-            'id': o.id,
-            'total': float(o.total),
-            'status': o.status,
-            'comment': o.comment or '',
-            'created_at': o.created_at.isoformat(),
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['created_at'].isoformat(), rows[-1]['id'])
+
+    with span('serialize'):
+        out = [_order_summary(r) for r in rows]
+        if not summary:
+            items = _order_items([r['id'] for r in rows])
+            for o, r in zip(out, rows):
+                o['comment'] = r['comment'] or ''
+                o['items'] = items.get(r['id'], [])
+        return JsonResponse({'orders': out, 'next_cursor': next_cursor})
+
+
+@require_GET
+def order_detail(request, order_id):
+    telegram_id = request.GET.get('telegram_id') or ''
+    order = None
+    if telegram_id:
+        order = (
+            Order.objects.filter(pk=order_id, user__telegram_id=str(telegram_id))
+            .values('id', 'total', 'status', 'created_at', 'comment', 'address', 'contact_whatsapp', 'contact_email')
+            .first()
+        )
+    if order is None:
+        return JsonResponse({'error': 'Order not found'}, status=404)
+    with span('serialize'):
+        items = _order_items([order_id], request).get(order_id, [])
+        return JsonResponse({
+            'id': order['id'],
+            'total': float(order['total']),
+            'status': order['status'],
+            'created_at': order['created_at'].isoformat(),
+            'comment': order['comment'] or '',
+            'address': order['address'] or '',
+            'whatsapp': order['contact_whatsapp'] or '',
+            'email': order['contact_email'] or '',
             'items': items,
         })
-    return JsonResponse({'orders': out})
+
+
+def _has_api_token(request) -> bool:
+    token = getattr(settings, 'ORDERS_API_TOKEN', '') or ''
+    auth = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(auth.encode(), f'Bearer {token}'.encode())
+
+
+def staff_or_token(view):
+    """Allow ``Authorization: Bearer <ORDERS_API_TOKEN>`` or a staff session.
+
+    Token requests skip CSRF (no cookies involved); session requests keep it.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    def wrapper(request, *args, **kwargs):
+        if _has_api_token(request):
+            return view(request, *args, **kwargs)
+        if request.user.is_active and request.user.is_staff:
+            return protected(request, *args, **kwargs)
+        return HttpResponseForbidden('Staff or API token required')
+
+    return wrapper
+
+
+@require_POST
+@staff_or_token
+def bulk_order_status(request):
+    """Move many orders to one status: ``{"order_ids": [...], "status": "done"}``."""
+    try:
+        payload = json.loads(request.body.decode('utf-8'))
+        order_ids = [int(i) for i in payload.get('order_ids') or []]
+    except Exception:
+        return HttpResponseBadRequest('Invalid JSON')
+    if not order_ids:
+        return HttpResponseBadRequest('order_ids required')
+    try:
+        changed = services.bulk_set_status(order_ids, payload.get('status'))
+    except services.InvalidOrder as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({'status': 'ok', 'updated': changed})
+
+
+# Longest range /api/analytics/sales answers in one request
+MAX_REPORT_DAYS = 366
+
+
+@require_GET
+@staff_or_token
+def sales_report(request):
+    """Sales for ``?start=YYYY-MM-DD&end=YYYY-MM-DD`` (default: last 30 days), from the rollups."""
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=29)
+        top = min(max(int(request.GET.get('top') or 10), 1), 100)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date or top')
+    if start > end:
+        return HttpResponseBadRequest('start is after end')
+    if (end - start).days >= MAX_REPORT_DAYS:
+        return HttpResponseBadRequest(f'Range is longer than {MAX_REPORT_DAYS} days')
+    return JsonResponse(analytics.report(start, end, top=top))
+
+
+@require_GET
+@staff_or_token
+def export_orders(request):
+    """Orders with items as CSV (or ``format=jsonl``), streamed oldest first.
+
+    ``start``/``end`` are local dates (inclusive), ``status`` may repeat.
+    """
+    fmt = request.GET.get('format') or 'csv'
+    statuses = request.GET.getlist('status')
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date')
+    if fmt not in order_export.FORMATS:
+        return HttpResponseBadRequest('format must be csv or jsonl')
+    if not set(statuses) <= {s for s, _ in Order.STATUS_CHOICES}:
+        return HttpResponseBadRequest('Invalid status')
+    orders = order_export.filter_orders(statuses=statuses, start=start, end=end)
+    response = StreamingHttpResponse(order_export.stream(orders, fmt), content_type=order_export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+    return response
 
 
 @csrf_exempt
@@ -222,20 +521,10 @@ def upsert_user(request):
         telegram_id = request.GET.get('telegram_id') or ''
         if not telegram_id:
             return JsonResponse({'exists': False})
-        try:
-            user = UserProfile.objects.get(telegram_id=str(telegram_id))
-        except UserProfile.DoesNotExist:
+        user = services.get_profile(telegram_id)
+        if user is None:
             return JsonResponse({'exists': False})
-        return JsonResponse({
-            'exists': True,
-            'user': {
-                'telegram_id': user.telegram_id,
-                'language': user.language,
-                'phone': user.phone,
-                'full_name': user.full_name,
-                'username': getattr(user, 'username', ''),
-            }
-        })
+        return JsonResponse({'exists': True, 'user': user})
 
     if request.method == 'POST':
         try:
@@ -252,16 +541,7 @@ def upsert_user(request):
         full_name = payload.get('full_name')
         username = payload.get('username')
 
-        user, _ = UserProfile.objects.get_or_create(telegram_id=telegram_id)
-        if language:
-            user.language = language
-        if phone:
-            user.phone = phone
-        if full_name:
-            user.full_name = full_name
-        if username:
-            user.username = username
-        user.save()
+        services.upsert_profile(telegram_id, language=language, phone=phone, full_name=full_name, username=username)
         return JsonResponse({'status': 'ok'})
 
     return HttpResponseBadRequest('Unsupported method')
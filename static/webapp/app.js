@@ -84,6 +84,7 @@
   let allProducts = [];
   let allCategories = [];
   let selectedCategory = 'all';
+  let checkoutKey = null; // idempotency key for the current cart
 
   // UI texts --------------------------------------------------------------
   function initTexts(){
@@ -142,9 +143,10 @@
       const thumb = (id==='all')
         ? 'https://i.postimg.cc/4NXyxzcT/supplies.png'
         : absMedia((cat && cat.image) ? cat.image : 'https://via.placeholder.com/56x56?text=%20');
-      el.innerHTML = `<img class="thumb" src="${thumb}" alt=""><div class="name">${name}</div><div class="count">${count}</div>`;
+      const srcset = (cat && cat.srcset) ? ` srcset="${cat.srcset}" sizes="56px"` : '';
+      el.innerHTML = `<img class="thumb" src="${thumb}"${srcset} alt="" loading="lazy"><div class="name">${name}</div><div class="count">${count}</div>`;
       const img = el.querySelector('img.thumb');
-      if (img) img.addEventListener('error', () => { img.src = 'https://via.placeholder.com/56x56?text=%20'; });
+      if (img) img.addEventListener('error', () => { img.removeAttribute('srcset'); img.src = 'https://via.placeholder.com/56x56?text=%20'; });
       el.addEventListener('click', () => { selectedCategory = id; renderCategories(); renderProducts(); });
       return el;
     };
@@ -163,7 +165,7 @@
       const card = document.createElement('div');
       card.className = 'card';
       card.innerHTML = `
-        <img src="${absMedia(p.image) || 'https://via.placeholder.com/300x200?text=No+Image'}" alt="">
+        <img src="${absMedia(p.image) || 'https://via.placeholder.com/300x200?text=No+Image'}"${p.srcset ? ` srcset="${p.srcset}" sizes="(max-width: 600px) 50vw, 320px"` : ''} alt="" loading="lazy">
         <div class="content">
           <div class="name">${lang==='RU'?p.name_ru:(lang==='EN'?(p.name_en||p.name_uz):p.name_uz)}</div>
           <div class="price">${fmt(p.price)} UZS</div>
@@ -174,11 +176,11 @@
           </div>
         </div>`;
       const img = card.querySelector('img');
-      if (img) img.addEventListener('error', () => { img.src = 'https://via.placeholder.com/300x200?text=No+Image'; });
+      if (img) img.addEventListener('error', () => { img.removeAttribute('srcset'); img.src = 'https://via.placeholder.com/300x200?text=No+Image'; });
       const q = card.querySelector('.q');
       const inc = card.querySelector('.inc');
       const dec = card.querySelector('.dec');
-      function setQty(n){ n=Math.max(0,n); q.value=n; if(n===0) cart.delete(p.id); else cart.set(p.id,{product:p,qty:n}); updateTotal(); }
+      function setQty(n){ n=Math.max(0,n); q.value=n; if(n===0) cart.delete(p.id); else cart.set(p.id,{product:p,qty:n}); checkoutKey = null; updateTotal(); }
       inc.addEventListener('click', ()=>setQty((parseInt(q.value)||0)+1));
       dec.addEventListener('click', ()=>setQty((parseInt(q.value)||0)-1));
       $products.appendChild(card);
@@ -223,6 +225,30 @@
   }
 
   // Submit ----------------------------------------------------------------
+  function newKey(){
+    try{ if (crypto && crypto.randomUUID) return crypto.randomUUID(); }catch(e){}
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+  // POST the order, retrying timeouts/5xx with the same Idempotency-Key
+  async function postOrder(payload, key, attempts=3){
+    for (let i = 0; i < attempts; i++){
+      const last = i === attempts - 1;
+      const ctrl = window.AbortController ? new AbortController() : null;
+      const timer = ctrl ? setTimeout(() => ctrl.abort(), 8000) : null;
+      try{
+        const res = await fetch(`${window.API_BASE}/order`, {
+          method:'POST',
+          headers:{'Content-Type':'application/json', 'Idempotency-Key': key},
+          body: JSON.stringify(payload),
+          signal: ctrl ? ctrl.signal : undefined,
+        });
+        if (res.status < 500 || last) return res;
+      }catch(e){ if (last) throw e; }
+      finally{ if (timer) clearTimeout(timer); }
+      await new Promise(r => setTimeout(r, 500 * Math.pow(2, i)));
+    }
+  }
+
   async function submitOrder(){
     const items = Array.from(cart.values()).map(({product, qty})=>({product_id:product.id, quantity:qty}));
     if (!items.length) return;
@@ -253,10 +279,11 @@
     };
     try{
       if ($checkout) $checkout.disabled = true;
-      const res = await fetch(`${window.API_BASE}/order`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(payload) });
+      if (!checkoutKey) checkoutKey = newKey();
+      const res = await postOrder(payload, checkoutKey);
       if (!res.ok){ const txt = await res.text().catch(()=> ''); if (tg) tg.showAlert((txt && txt.length < 200 ? txt : t('Xatolik. Qayta urinib ko\'ring.','Ошибка. Пожалуйста, попробуйте ещё раз.','Error. Please try again.'))); return; }
       const data = await res.json().catch(()=>({status:'error'}));
-      if (data.status==='ok'){ if (tg) tg.showAlert(t('Buyurtma qabul qilindi!','Заказ принят!','Order placed!')); if (tg) tg.close(); }
+      if (data.status==='ok'){ checkoutKey = null; if (tg) tg.showAlert(t('Buyurtma qabul qilindi!','Заказ принят!','Order placed!')); if (tg) tg.close(); }
       else { if (tg) tg.showAlert(t('Xatolik. Qayta urinib ko\'ring.','Ошибка. Пожалуйста, попробуйте ещё раз.','Error. Please try again.')); }
     }catch(e){ console.error('Order failed', e); if (tg) tg.showAlert(t('Xatolik yuz berdi','Произошла ошибка','An error occurred')); }
     finally{ if ($checkout) $checkout.disabled = false; }